@@ -1,17 +1,513 @@
-import google.generativeai as genai
-from langchain_ollama import OllamaLLM
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+import extractive
+from async_runtime import iterate_sync, run_sync
+from llm_router import NoHealthyEndpoint, generation_info_from, get_router
+from metrics import increment, record_span, span
+from token_accounting import count_tokens
+from utils import split_transcript
+
+CHUNK_PROMPT = (
+    "{prompt}\n\n"
+    "This is part {index} of {total} of a longer transcript. Summarize only this part; "
+    "the partial summaries will be combined afterwards.\n\nTranscript: {chunk}"
+)
+
+REDUCE_PROMPT = (
+    "{prompt}\n\n"
+    "The transcript was too long to process at once, so it was summarized in parts. "
+    "Combine the partial summaries below into a single summary in the requested format, "
+    "merging duplicate points and keeping every decision and action item.\n\n"
+    "Partial summaries:\n\n{summaries}"
+)
+
+# Errors meaning the model could not be reached or did not answer in time, rather than that the
+# request itself failed; callers may fall back to generate_summary_extractive on these.
+UNAVAILABLE_ERRORS = (TimeoutError, ConnectionError, NoHealthyEndpoint, httpx.TransportError)
+
+# Multi-template requests put the transcript first, so every template's request shares it as a
+# prompt prefix that Ollama evaluates once and then serves from its cache.
+SHARED_PREFIX_PROMPT = "Transcript: {transcript}\n\n{prompt}"
+
+SHARED_PREFIX_CHUNK_PROMPT = (
+    "This is part {index} of {total} of a longer transcript.\n\nTranscript: {chunk}\n\n{prompt}\n\n"
+    "Summarize only this part; the partial summaries will be combined afterwards."
+)
+
+# Live meetings are summarized as they go: each new part is folded into the summary so far, and
+# notes kept per part let the summary be rebuilt from scratch now and then (see live_summary.py).
+LIVE_FIRST_PROMPT = (
+    "{prompt}\n\n"
+    "The meeting is still in progress; summarize what has been said so far.\n\nTranscript: {segment}"
+)
+
+LIVE_UPDATE_PROMPT = (
+    "{prompt}\n\n"
+    "The meeting is still in progress. Below are the summary so far and the transcript of the "
+    "latest part. Rewrite the summary in the requested format so that it also covers the latest "
+    "part, keeping every decision and action item from the summary so far.\n\n"
+    "Summary so far:\n{summary}\n\nLatest part (part {index}):\n{segment}"
+)
+
+LIVE_NOTES_PROMPT = (
+    "This is part {index} of a meeting that is still in progress. Write concise notes on this part "
+    "only: topics discussed, decisions, action items with owners, and open questions.\n\n"
+    "Transcript: {segment}"
+)
+
 
 class AIHandler:
-    def __init__(self, ollama_base_url, ollama_model):
-        self.ollama_llm = OllamaLLM(base_url=ollama_base_url, model=ollama_model)
-    
-    def generate_summary_ollama(self, transcript_text, prompt):
+    """
+    Summarization against Ollama (through the shared router) and Gemini, and extractive
+    summaries computed locally.
+
+    The a-prefixed methods are the asyncio-native API: they take a timeout (a deadline in
+    seconds for the whole call, default request_timeout) and can be cancelled, which aborts
+    the HTTP streams they have open. They run on the shared loop from async_runtime; await
+    them through async_runtime.run_async() from other event loops. The methods without the
+    prefix are blocking wrappers with the same arguments, for Streamlit and the batch CLI.
+
+    Args:
+        ollama_base_url: One Ollama URL, or several as a list or comma-separated string;
+            requests are spread over them by a router shared by every handler for the
+            same servers and model.
+        max_chunk_tokens (int): Chunk size for map-reduce over long transcripts.
+        max_concurrency (int): Requests one summary fans out to at a time.
+        backend_concurrency (int): Process-wide cap on generations in flight per Ollama
+            server, and for Gemini; None leaves Ollama uncapped and Gemini at 4.
+        request_timeout (float): Default deadline in seconds; None waits indefinitely.
+        keep_alive: How long Ollama keeps the model loaded after each request (e.g. "30m").
+    """
+
+    def __init__(self, ollama_base_url, ollama_model, max_chunk_tokens=3000, max_concurrency=4, num_ctx=None,
+                 hedge_after=None, backend_concurrency=None, request_timeout=None, keep_alive=None):
+        self.router = get_router(
+            ollama_base_url, ollama_model,
+            hedge_after=hedge_after, max_concurrency=backend_concurrency, keep_alive=keep_alive,
+        )
+        self.gemini_semaphore = _backend_semaphore("gemini", backend_concurrency or 4)
+        self.ollama_model = ollama_model
+        self.num_ctx = num_ctx
+        self.max_chunk_tokens = max_chunk_tokens
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.logger = logging.getLogger(__name__)
+
+    # Blocking API
+
+    def generate_summary_ollama(self, transcript_text, prompt, generation_infos=None, timeout=None):
+        return run_sync(self.agenerate_summary_ollama(transcript_text, prompt, generation_infos, timeout))
+
+    def generate_summary_ollama_chunked(self, transcript_text, prompt, generation_infos=None, timeout=None):
+        return run_sync(self.agenerate_summary_ollama_chunked(transcript_text, prompt, generation_infos, timeout))
+
+    def generate_summaries_ollama(self, transcript_text, prompts, keep_alive=None, timeout=None):
+        return run_sync(self.agenerate_summaries_ollama(transcript_text, prompts, keep_alive, timeout))
+
+    def generate_summary_gemini(self, transcript_text, prompt, timeout=None):
+        return run_sync(self.agenerate_summary_gemini(transcript_text, prompt, timeout))
+
+    def generate_summary_extractive(self, transcript_text, prompt):
+        """Picks the key sentences, decisions and action items out of the transcript, on the CPU."""
+        with span("extractive"):
+            return extractive.summarize(transcript_text, prompt).text
+
+    def stream_summary_ollama(self, transcript_text, prompt, timeout=None):
+        """
+        Streams the summary as Ollama generates it.
+
+        Returns a SummaryStream that yields text fragments when iterated; the full text, timings
+        and Ollama's metadata for every request are available on it once iteration finishes.
+        Abandoning the stream part way cancels the request on the server.
+        """
+        generation_infos = []
+        tokens = iterate_sync(self.astream_summary_ollama(transcript_text, prompt, generation_infos, timeout))
+        return SummaryStream(tokens, self.logger, generation_infos)
+
+    # Async API
+
+    async def agenerate_summary_ollama(self, transcript_text, prompt, generation_infos=None, timeout=None):
         full_prompt = prompt + "\n\nTranscript: " + transcript_text
-        response = self.ollama_llm.generate([full_prompt])
-        return response.generations[0][0].text if response.generations else "No response generated"
+        return await _with_deadline(self._agenerate_ollama(full_prompt, generation_infos), self._timeout(timeout))
+
+    async def agenerate_summary_ollama_chunked(self, transcript_text, prompt, generation_infos=None, timeout=None):
+        """
+        Map-reduce summarization for transcripts that do not fit in one request.
+
+        The transcript is split at speaker and paragraph boundaries into chunks of at most
+        max_chunk_tokens, each chunk is summarized concurrently (at most max_concurrency
+        requests at a time), and the partial summaries are merged in a reduce step.
+        Transcripts that fit in a single chunk go through agenerate_summary_ollama unchanged.
+        If generation_infos is a list, Ollama's metadata for every request is appended to it.
+        """
+        return await _with_deadline(
+            self._agenerate_chunked(transcript_text, prompt, generation_infos), self._timeout(timeout)
+        )
+
+    async def _agenerate_chunked(self, transcript_text, prompt, generation_infos):
+        chunks = await asyncio.to_thread(split_transcript, transcript_text, self.max_chunk_tokens)
+        if len(chunks) <= 1:
+            return await self._agenerate_ollama(prompt + "\n\nTranscript: " + transcript_text, generation_infos)
+
+        start_time = time.time()
+        partials = await self._asummarize_chunks(chunks, prompt, generation_infos)
+        reduce_prompt = await self._areduce_prompt(partials, prompt, generation_infos)
+        summary = await self._agenerate_ollama(reduce_prompt, generation_infos)
+        self.logger.info(f"Chunked summary of {len(chunks)} chunks completed in {time.time() - start_time:.2f}s.")
+        return summary
+
+    async def astream_summary_ollama(self, transcript_text, prompt, generation_infos=None, timeout=None):
+        """
+        Yields the summary's text fragments as Ollama generates them.
+
+        Long transcripts are summarized chunk by chunk first, and only the final reduce step
+        is streamed. The timeout covers all of it.
+        """
+        deadline = _deadline(self._timeout(timeout))
+        chunks = await asyncio.to_thread(split_transcript, transcript_text, self.max_chunk_tokens)
+        if len(chunks) <= 1:
+            full_prompt = prompt + "\n\nTranscript: " + transcript_text
+        else:
+            partials = await _with_deadline(self._asummarize_chunks(chunks, prompt, generation_infos), _remaining(deadline))
+            full_prompt = await _with_deadline(self._areduce_prompt(partials, prompt, generation_infos), _remaining(deadline))
+        async for endpoint_url, chunk in self.router.astream(full_prompt, self._options(), timeout=_remaining(deadline)):
+            if chunk.done and generation_infos is not None:
+                generation_infos.append(generation_info_from(chunk, endpoint_url))
+            if chunk.response:
+                yield chunk.response
+
+    async def agenerate_summaries_ollama(self, transcript_text, prompts, keep_alive=None, timeout=None):
+        """
+        Summarizes one transcript with several templates, reusing Ollama's prompt cache.
+
+        Each request is laid out as transcript first, template prompt last, and the requests
+        for one transcript (or one chunk of a long transcript) run one after another on the
+        same server, so the transcript is evaluated once and later templates only pay for
+        their own prompt text. keep_alive (default: the router's, else 10 minutes) keeps the
+        model, and its cache, loaded in between.
+
+        Args:
+            prompts (dict): Template name -> prompt text.
+
+        Returns:
+            MultiSummary: The summaries by template name, with the prompt-eval savings.
+        """
+        return await _with_deadline(
+            self._agenerate_summaries(transcript_text, prompts, keep_alive), self._timeout(timeout)
+        )
+
+    async def _agenerate_summaries(self, transcript_text, prompts, keep_alive):
+        start_time = time.time()
+        keep_alive = keep_alive or self.router.keep_alive or "10m"
+        names = list(prompts)
+        result = MultiSummary(names)
+        chunks = await asyncio.to_thread(split_transcript, transcript_text, self.max_chunk_tokens)
+        if len(chunks) <= 1:
+            full_prompts = [SHARED_PREFIX_PROMPT.format(transcript=transcript_text, prompt=prompts[name]) for name in names]
+            texts = await self._agenerate_shared_prefix(full_prompts, prompts, names, result, keep_alive)
+            result.summaries.update(zip(names, texts))
+        else:
+            self.logger.info(f"Transcript split into {len(chunks)} chunks of up to {self.max_chunk_tokens} tokens.")
+
+            async def summarize_chunk(index, chunk):
+                full_prompts = [
+                    SHARED_PREFIX_CHUNK_PROMPT.format(index=index, total=len(chunks), chunk=chunk, prompt=prompts[name])
+                    for name in names
+                ]
+                return await self._agenerate_shared_prefix(full_prompts, prompts, names, result, keep_alive)
+
+            partials_by_chunk = await self._map_concurrent(summarize_chunk, range(1, len(chunks) + 1), chunks)
+
+            async def reduce(name):
+                infos = result.generation_infos[name]
+                partials = [partials[names.index(name)] for partials in partials_by_chunk]
+                return await self._agenerate_ollama(await self._areduce_prompt(partials, prompts[name], infos), infos)
+
+            result.summaries.update(zip(names, await self._map_concurrent(reduce, names)))
+
+        result.duration = round(time.time() - start_time, 2)
+        increment("prefix_reuse_tokens_saved_total", result.saved_prompt_tokens)
+        self.logger.info(f"Summarized with {len(names)} templates: {result.describe()}")
+        return result
+
+    async def _agenerate_shared_prefix(self, full_prompts, prompts, names, result, keep_alive):
+        """
+        Runs prompts that share a prefix in order on one server and tallies the cache savings.
+
+        The first request evaluates the whole prompt. Any later request that Ollama reports
+        fewer prompt tokens for than (first request - first template + its template) was
+        served the difference from the cache; that difference is costed at the first
+        request's prompt evaluation rate.
+        """
+        texts, first, endpoint_url = [], None, None
+        for name, full_prompt in zip(names, full_prompts):
+            with span("llm_total", mode="shared_prefix"):
+                text, info = await self.router.agenerate(
+                    full_prompt, self._options(), prefer=endpoint_url, keep_alive=keep_alive
+                )
+            texts.append(text or "No response generated")
+            if not info:
+                continue
+            result.add_generation_info(name, info)
+            if first is None:
+                first = info
+                endpoint_url = info.get("endpoint")
+                continue
+            expected = (first.get("prompt_eval_count") or 0) - count_tokens(prompts[names[0]]) + count_tokens(prompts[name])
+            evaluated = info.get("prompt_eval_count") or 0
+            if expected > evaluated and first.get("prompt_eval_count"):
+                seconds_per_token = (first.get("prompt_eval_duration") or 0) / 1e9 / first["prompt_eval_count"]
+                result.add_savings(expected - evaluated, (expected - evaluated) * seconds_per_token)
+        return texts
+
+    async def _asummarize_chunks(self, chunks, prompt, generation_infos=None):
+        """Summarizes transcript chunks concurrently, preserving their order."""
+        self.logger.info(f"Transcript split into {len(chunks)} chunks of up to {self.max_chunk_tokens} tokens.")
+
+        async def summarize_chunk(index, chunk):
+            chunk_start = time.time()
+            summary = await self._agenerate_ollama(
+                CHUNK_PROMPT.format(prompt=prompt, index=index, total=len(chunks), chunk=chunk), generation_infos
+            )
+            self.logger.info(f"Chunk {index}/{len(chunks)} summarized in {time.time() - chunk_start:.2f}s.")
+            return summary
+
+        return await self._map_concurrent(summarize_chunk, range(1, len(chunks) + 1), chunks)
 
-    def generate_summary_gemini(self, transcript_text, prompt):
+    async def _areduce_prompt(self, partials, prompt, generation_infos=None):
+        """
+        Builds the prompt that merges partial summaries into the final one.
+
+        If the partial summaries do not fit in one request, they are first merged in groups,
+        as many rounds as needed.
+        """
+        while True:
+            labelled = [f"--- Part {i} ---\n{summary}" for i, summary in enumerate(partials, start=1)]
+            groups, current, current_tokens = [], [], 0
+            for part in labelled:
+                part_tokens = count_tokens(part)
+                if current and current_tokens + part_tokens > self.max_chunk_tokens:
+                    groups.append("\n\n".join(current))
+                    current, current_tokens = [], 0
+                current.append(part)
+                current_tokens += part_tokens
+            groups.append("\n\n".join(current))
+            # Stop once everything fits, or once grouping no longer shrinks the input.
+            if len(groups) == 1 or len(groups) >= len(partials):
+                return REDUCE_PROMPT.format(prompt=prompt, summaries="\n\n".join(labelled))
+
+            reduce_start = time.time()
+
+            async def reduce_group(group):
+                return await self._agenerate_ollama(REDUCE_PROMPT.format(prompt=prompt, summaries=group), generation_infos)
+
+            partials = await self._map_concurrent(reduce_group, groups)
+            self.logger.info(f"Reduced {len(labelled)} partial summaries into {len(partials)} in {time.time() - reduce_start:.2f}s.")
+
+    async def _agenerate_ollama(self, full_prompt, generation_infos=None):
+        with span("llm_total", mode="generate"):
+            text, generation_info = await self.router.agenerate(full_prompt, self._options())
+        if generation_infos is not None and generation_info:
+            generation_infos.append(generation_info)
+        return text or "No response generated"
+
+    async def agenerate_summary_gemini(self, transcript_text, prompt, timeout=None):
         full_prompt = prompt + "\n\n" + transcript_text
-        model = genai.GenerativeModel("gemini-pro")
-        response = model.generate_content(full_prompt)
+        model = _gemini().GenerativeModel("gemini-pro")
+        async with self.gemini_semaphore:
+            response = await _with_deadline(model.generate_content_async(full_prompt), self._timeout(timeout))
         return response.text
+
+    async def _map_concurrent(self, function, *iterables):
+        """Awaits function(*args) for each set of args, max_concurrency at a time, in order."""
+        limit = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(*args):
+            async with limit:
+                return await function(*args)
+
+        tasks = [asyncio.create_task(run(*args)) for args in zip(*iterables)]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # One failure (or a cancellation) stops the rest instead of leaving them running.
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def afold_live_segment(self, summary, segment, prompt, index, generation_infos=None, timeout=None):
+        """
+        Folds one new part of a live meeting into its summary.
+
+        The updated summary and standalone notes on the part are generated concurrently; the
+        request size depends on the summary and the part, not on how long the meeting is.
+
+        Returns:
+            tuple: (updated summary, notes on the part)
+        """
+        if summary:
+            update_prompt = LIVE_UPDATE_PROMPT.format(prompt=prompt, summary=summary, segment=segment, index=index)
+        else:
+            update_prompt = LIVE_FIRST_PROMPT.format(prompt=prompt, segment=segment)
+        notes_prompt = LIVE_NOTES_PROMPT.format(segment=segment, index=index)
+
+        async def generate(full_prompt):
+            return await self._agenerate_ollama(full_prompt, generation_infos)
+
+        summary, notes = await _with_deadline(
+            self._map_concurrent(generate, [update_prompt, notes_prompt]), self._timeout(timeout)
+        )
+        return summary, notes
+
+    async def aconsolidate_live_summary(self, notes, prompt, generation_infos=None, timeout=None):
+        """Rebuilds a live meeting's summary from its per-part notes, merging them in groups if needed."""
+
+        async def consolidate():
+            return await self._agenerate_ollama(await self._areduce_prompt(notes, prompt, generation_infos), generation_infos)
+
+        return await _with_deadline(consolidate(), self._timeout(timeout))
+
+    def _options(self):
+        return {"num_ctx": self.num_ctx} if self.num_ctx else None
+
+    def _timeout(self, timeout):
+        return timeout if timeout is not None else self.request_timeout
+
+
+@functools.lru_cache(maxsize=None)
+def _gemini():
+    """Imports and configures the Gemini SDK on first use, so Ollama-only runs never load it."""
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai
+
+
+_backend_semaphores = {}
+_backend_semaphores_lock = threading.Lock()
+
+
+def _backend_semaphore(name, limit):
+    """Returns the process-wide semaphore for a backend; the first caller's limit applies."""
+    with _backend_semaphores_lock:
+        if name not in _backend_semaphores:
+            _backend_semaphores[name] = asyncio.Semaphore(limit)
+        return _backend_semaphores[name]
+
+
+def _deadline(timeout):
+    return time.monotonic() + timeout if timeout is not None else None
+
+
+def _remaining(deadline):
+    return max(0.0, deadline - time.monotonic()) if deadline is not None else None
+
+
+async def _with_deadline(coroutine, timeout):
+    """Awaits coroutine, cancelling it and raising TimeoutError once timeout seconds pass."""
+    if timeout is None:
+        return await coroutine
+    try:
+        return await asyncio.wait_for(coroutine, timeout)
+    except asyncio.TimeoutError:
+        increment("llm_timeouts_total")
+        raise TimeoutError(f"Summary did not finish within {timeout}s.") from None
+
+
+class SummaryStream:
+    """
+    Wraps a stream of text fragments and records timings while it is consumed.
+
+    Attributes:
+        text (str): The full text, complete once iteration has finished.
+        time_to_first_token (float): Seconds from the start of iteration to the first fragment.
+        duration (float): Seconds from the start of iteration to the end of the stream.
+        generation_infos (list): Backend metadata (token counts, durations) for each request made.
+    """
+
+    def __init__(self, tokens, logger=None, generation_infos=None):
+        self._tokens = tokens
+        self.logger = logger or logging.getLogger(__name__)
+        self.generation_infos = generation_infos if generation_infos is not None else []
+        self.text = ""
+        self.time_to_first_token = None
+        self.duration = None
+
+    def __iter__(self):
+        start_time = time.perf_counter()
+        first_token_seconds = None
+        parts = []
+        try:
+            for token in self._tokens:
+                if first_token_seconds is None:
+                    first_token_seconds = time.perf_counter() - start_time
+                    self.time_to_first_token = round(first_token_seconds, 2)
+                parts.append(token)
+                yield token
+        finally:
+            # Stopping early (the reader went away) closes the source, which cancels the request.
+            close = getattr(self._tokens, "close", None)
+            if close is not None:
+                close()
+        total_seconds = time.perf_counter() - start_time
+        self.text = "".join(parts)
+        self.duration = round(total_seconds, 2)
+        if first_token_seconds is not None:
+            record_span("llm_first_token", first_token_seconds, mode="stream")
+        record_span("llm_total", total_seconds, mode="stream")
+        self.logger.info(
+            f"Streamed summary: first token after {self.time_to_first_token}s, completed in {self.duration}s."
+        )
+
+
+class MultiSummary:
+    """
+    Summaries of one transcript with several templates.
+
+    Attributes:
+        summaries (dict): Template name -> summary.
+        generation_infos (dict): Template name -> Ollama metadata for each request made for it.
+        prompt_eval_seconds (float): Prompt evaluation time Ollama reported over all requests.
+        saved_prompt_tokens (int): Prompt tokens served from Ollama's cache instead of evaluated.
+        saved_prompt_eval_seconds (float): Estimated evaluation time of those tokens.
+        duration (float): Seconds for the whole run.
+    """
+
+    def __init__(self, names):
+        self.summaries = {}
+        self.generation_infos = {name: [] for name in names}
+        self.prompt_eval_seconds = 0.0
+        self.saved_prompt_tokens = 0
+        self.saved_prompt_eval_seconds = 0.0
+        self.duration = None
+        self._lock = threading.Lock()
+
+    def add_generation_info(self, name, info):
+        with self._lock:
+            self.generation_infos[name].append(info)
+            self.prompt_eval_seconds += (info.get("prompt_eval_duration") or 0) / 1e9
+
+    def add_savings(self, tokens, seconds):
+        with self._lock:
+            self.saved_prompt_tokens += tokens
+            self.saved_prompt_eval_seconds += seconds
+
+    @property
+    def saved_ratio(self):
+        """Share of the prompt-eval time independent requests would have needed that was saved."""
+        independent = self.prompt_eval_seconds + self.saved_prompt_eval_seconds
+        return round(self.saved_prompt_eval_seconds / independent, 3) if independent else 0.0
+
+    def describe(self):
+        return (
+            f"prompt eval {self.prompt_eval_seconds:.2f}s, {self.saved_prompt_tokens} prompt tokens reused "
+            f"saving ~{self.saved_prompt_eval_seconds:.2f}s ({100 * self.saved_ratio:.1f}%) vs. independent "
+            f"calls, total {self.duration}s"
+        )
@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+from ai_handlers import AIHandler
+from async_runtime import run_sync
+from utils import split_transcript
+
+
+class _Router:
+    """Answers every prompt straight away and remembers it; partial summaries name their part."""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def agenerate(self, prompt, options=None):
+        self.prompts.append(prompt)
+        part = re.search(r"This is part (\d+) of", prompt)
+        text = f"summary of part {part.group(1)}" if part else f"merged {prompt.count('--- Part ')} parts"
+        return text, {"eval_count": 3}
+
+
+@pytest.fixture
+def handler(word_tokens):
+    handler = AIHandler("http://127.0.0.1:1", "stub", max_chunk_tokens=30)
+    handler.router = _Router()
+    return handler
+
+
+def _words(count, word="word"):
+    return " ".join([word] * count)
+
+
+def test_chunks_are_packed_at_paragraph_boundaries_in_order(word_tokens):
+    paragraphs = [_words(8, f"p{index}") for index in range(5)]
+    chunks = split_transcript("\n\n".join(paragraphs), max_tokens=20)
+    assert chunks == ["\n\n".join(paragraphs[0:2]), "\n\n".join(paragraphs[2:4]), paragraphs[4]]
+
+
+def test_an_oversized_paragraph_is_cut_at_speaker_turns_then_lines_then_tokens(word_tokens):
+    turns = [
+        "Kenny, Mike   0:14\n" + _words(10, "a"),
+        "Raube, Chad 1 minutes 4 seconds\n" + _words(10, "b"),
+    ]
+    assert split_transcript("\n".join(turns), max_tokens=17) == turns
+
+    # One line longer than the budget on its own.
+    chunks = split_transcript(_words(45), max_tokens=20)
+    assert [len(chunk.split()) for chunk in chunks] == [20, 20, 5]
+    assert all(len(chunk.split()) <= 20 for chunk in split_transcript("\n".join(turns), max_tokens=5))
+
+
+def test_a_transcript_that_fits_is_summarized_in_one_request(handler):
+    summary = handler.generate_summary_ollama_chunked(_words(10), "Summarize.")
+    assert summary == "merged 0 parts"
+    assert handler.router.prompts == ["Summarize.\n\nTranscript: " + _words(10)]
+
+
+def test_chunk_summaries_are_merged_in_transcript_order(handler):
+    transcript = "\n\n".join(_words(20, f"p{index}") for index in range(3))
+    generation_infos = []
+    summary = handler.generate_summary_ollama_chunked(transcript, "Summarize.", generation_infos)
+
+    chunk_prompts = handler.router.prompts[:3]
+    reduce_prompt = handler.router.prompts[-1]
+    assert [prompt.split("Transcript: ")[1] for prompt in chunk_prompts] == transcript.split("\n\n")
+    assert "This is part 3 of 3" in chunk_prompts[2]
+    assert reduce_prompt.startswith("Summarize.\n\n")
+    assert reduce_prompt.index("--- Part 1 ---\nsummary of part 1") < reduce_prompt.index("--- Part 3 ---\nsummary of part 3")
+    assert summary == "merged 3 parts"
+    assert len(generation_infos) == 4
+
+
+def test_partials_too_long_for_one_request_are_merged_in_rounds(handler):
+    partials = [_words(8, f"s{index}") for index in range(6)]
+    reduce_prompt = run_sync(handler._areduce_prompt(partials, "Summarize."))
+    # Labelled, each partial is 11 words: two fit in a request, so six are merged in three.
+    assert [prompt.count("--- Part ") for prompt in handler.router.prompts] == [2, 2, 2]
+    assert reduce_prompt.count("--- Part ") == 3 and "--- Part 3 ---\nmerged 2 parts" in reduce_prompt
@@ -0,0 +1,405 @@
+"""
+Usage analytics over the audit log, from incrementally maintained hourly rollups.
+
+UsageRollup.refresh() reads the INTELLINOTES_LOG rows added since its watermark (scalar
+columns only, never the texts) and the feedback submitted since then, aggregates them by
+hour, model, template and event, and adds the result to INTELLINOTES_USAGE_HOURLY and
+INTELLINOTES_USAGE_LATENCY in the same transaction that advances the watermark. The
+watermark row is locked for the duration, so refreshes from several processes take turns
+and every row is counted once. sql/002_intellinotes_usage_rollups.sql creates the tables.
+
+Both scans are keyed on LOADED_AT, which the database sets on insert (CREATEDATE and
+CREATED_DATE are set by the app, and a row replayed from the audit spill keeps its original
+one). Rows are only counted once they were loaded lag_seconds ago, which gives concurrent
+writers time to commit rows with lower LOGIDs or earlier load times than the ones already
+visible.
+
+fetch_usage() answers dashboard queries from the rollups alone.
+"""
+import bisect
+import datetime
+import logging
+import threading
+
+from metrics import increment, span
+
+ROLLUP_NAME = "usage_hourly"
+# Placeholder for a missing model, template or event; they are part of the rollup keys.
+UNKNOWN = "-"
+# Upper bounds, in seconds, of the request duration histogram; the last bucket is open-ended.
+LATENCY_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+OVERFLOW_BUCKET = 1e9
+DIMENSIONS = {"hour": "HOUR_START", "model": "MODEL", "template": "TEMPLATE_NAME", "event": "EVENT"}
+
+WATERMARK_LOCK_SQL = """
+    SELECT LAST_LOGID, LAST_FEEDBACK_LOADED FROM INTELLINOTES_ROLLUP_WATERMARKS
+    WHERE NAME = :name FOR UPDATE
+"""
+
+WATERMARK_UPDATE_SQL = """
+    UPDATE INTELLINOTES_ROLLUP_WATERMARKS
+    SET LAST_LOGID = :last_logid, LAST_FEEDBACK_LOADED = :last_feedback_loaded, UPDATED_DATE = SYSDATE
+    WHERE NAME = :name
+"""
+
+NEW_LOG_ROWS_SQL = """
+    SELECT LOGID, LOADED_AT, CREATEDATE, MODEL, TEMPLATE_NAME, EVENT, INPUT_TOKENS, OUTPUT_TOKENS, DURATION,
+           CASE WHEN ERRORMESSAGE IS NULL THEN 0 ELSE 1 END
+    FROM INTELLINOTES_LOG
+    WHERE LOGID > :last_logid
+    ORDER BY LOGID
+    FETCH FIRST :batch_size ROWS ONLY
+"""
+
+NEW_FEEDBACK_SQL = """
+    SELECT f.CREATED_DATE, f.USER_RATING, l.CREATEDATE, l.MODEL, l.TEMPLATE_NAME, l.EVENT
+    FROM IntelliNotes_Feedback f
+    OUTER APPLY (
+        SELECT CREATEDATE, MODEL, TEMPLATE_NAME, EVENT FROM INTELLINOTES_LOG
+        WHERE USERID = f.USERID
+        ORDER BY LOGID DESC
+        FETCH FIRST 1 ROWS ONLY
+    ) l
+    WHERE f.LOADED_AT > :since AND f.LOADED_AT <= :until
+"""
+
+HOURLY_MERGE_SQL = """
+    MERGE INTO INTELLINOTES_USAGE_HOURLY h
+    USING (SELECT :hour_start AS HOUR_START, :model AS MODEL, :template_name AS TEMPLATE_NAME, :event AS EVENT FROM dual) s
+    ON (h.HOUR_START = s.HOUR_START AND h.MODEL = s.MODEL AND h.TEMPLATE_NAME = s.TEMPLATE_NAME AND h.EVENT = s.EVENT)
+    WHEN MATCHED THEN UPDATE SET
+        REQUESTS = h.REQUESTS + :requests,
+        ERRORS = h.ERRORS + :errors,
+        INPUT_TOKENS = h.INPUT_TOKENS + :input_tokens,
+        OUTPUT_TOKENS = h.OUTPUT_TOKENS + :output_tokens,
+        DURATION_SUM = h.DURATION_SUM + :duration_sum,
+        DURATION_COUNT = h.DURATION_COUNT + :duration_count,
+        DURATION_MAX = GREATEST(NVL(h.DURATION_MAX, :duration_max), NVL(:duration_max, h.DURATION_MAX)),
+        FEEDBACK_COUNT = h.FEEDBACK_COUNT + :feedback_count,
+        RATING_SUM = h.RATING_SUM + :rating_sum,
+        RATING_COUNT = h.RATING_COUNT + :rating_count
+    WHEN NOT MATCHED THEN INSERT (
+        HOUR_START, MODEL, TEMPLATE_NAME, EVENT, REQUESTS, ERRORS, INPUT_TOKENS, OUTPUT_TOKENS,
+        DURATION_SUM, DURATION_COUNT, DURATION_MAX, FEEDBACK_COUNT, RATING_SUM, RATING_COUNT
+    ) VALUES (
+        :hour_start, :model, :template_name, :event, :requests, :errors, :input_tokens, :output_tokens,
+        :duration_sum, :duration_count, :duration_max, :feedback_count, :rating_sum, :rating_count
+    )
+"""
+
+LATENCY_MERGE_SQL = """
+    MERGE INTO INTELLINOTES_USAGE_LATENCY h
+    USING (
+        SELECT :hour_start AS HOUR_START, :model AS MODEL, :template_name AS TEMPLATE_NAME,
+               :event AS EVENT, :bucket_le AS BUCKET_LE
+        FROM dual
+    ) s
+    ON (h.HOUR_START = s.HOUR_START AND h.MODEL = s.MODEL AND h.TEMPLATE_NAME = s.TEMPLATE_NAME
+        AND h.EVENT = s.EVENT AND h.BUCKET_LE = s.BUCKET_LE)
+    WHEN MATCHED THEN UPDATE SET REQUESTS = h.REQUESTS + :requests
+    WHEN NOT MATCHED THEN INSERT (HOUR_START, MODEL, TEMPLATE_NAME, EVENT, BUCKET_LE, REQUESTS)
+    VALUES (:hour_start, :model, :template_name, :event, :bucket_le, :requests)
+"""
+
+
+class RollupBatch:
+    """Rollup increments for a set of log and feedback rows, keyed by (hour, model, template, event)."""
+
+    def __init__(self):
+        self.rows = {}
+        self.latency = {}
+
+    def _row(self, key):
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = {
+                "requests": 0, "errors": 0, "input_tokens": 0, "output_tokens": 0,
+                "duration_sum": 0.0, "duration_count": 0, "duration_max": None,
+                "feedback_count": 0, "rating_sum": 0, "rating_count": 0,
+            }
+        return row
+
+    def add_request(self, created, model, template_name, event, input_tokens, output_tokens, duration, error):
+        key = rollup_key(created, model, template_name, event)
+        row = self._row(key)
+        row["requests"] += 1
+        row["errors"] += int(bool(error))
+        row["input_tokens"] += input_tokens or 0
+        row["output_tokens"] += output_tokens or 0
+        if duration is not None and not error:
+            duration = float(duration)
+            row["duration_sum"] += duration
+            row["duration_count"] += 1
+            row["duration_max"] = max(row["duration_max"] or 0.0, duration)
+            bucket = latency_bucket(duration)
+            self.latency[key + (bucket,)] = self.latency.get(key + (bucket,), 0) + 1
+
+    def add_feedback(self, created, model, template_name, event, rating):
+        row = self._row(rollup_key(created, model, template_name, event))
+        row["feedback_count"] += 1
+        if rating is not None:
+            row["rating_sum"] += rating
+            row["rating_count"] += 1
+
+    def hourly_binds(self):
+        return [dict(zip(("hour_start", "model", "template_name", "event"), key), **row) for key, row in self.rows.items()]
+
+    def latency_binds(self):
+        return [
+            dict(zip(("hour_start", "model", "template_name", "event", "bucket_le"), key), requests=count)
+            for key, count in self.latency.items()
+        ]
+
+
+def rollup_key(created, model, template_name, event):
+    return (
+        created.replace(minute=0, second=0, microsecond=0),
+        model or UNKNOWN,
+        template_name or UNKNOWN,
+        event or UNKNOWN,
+    )
+
+
+def latency_bucket(seconds):
+    index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else OVERFLOW_BUCKET
+
+
+def percentile(buckets, fraction):
+    """
+    Estimates a percentile from {bucket upper bound: count}, interpolating within the bucket.
+
+    Returns None for an empty histogram; values in the overflow bucket are reported as the
+    last finite bound.
+    """
+    total = sum(buckets.values())
+    if not total:
+        return None
+    rank = fraction * total
+    seen = 0
+    for bound in sorted(buckets):
+        count = buckets[bound]
+        if count and seen + count >= rank:
+            if bound == OVERFLOW_BUCKET:
+                return float(LATENCY_BUCKETS[-1])
+            index = bisect.bisect_left(LATENCY_BUCKETS, bound)
+            lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+            return round(lower + (bound - lower) * (rank - seen) / count, 2)
+        seen += count
+    return float(LATENCY_BUCKETS[-1])
+
+
+class UsageRollup:
+    """
+    Maintains the hourly usage rollups.
+
+    Args:
+        db (DBOracle): The database holding the log and the rollup tables.
+        lag_seconds (float): Rows younger than this are left for a later refresh.
+        batch_size (int): Log rows read per refresh; a backlog is worked off over several.
+    """
+
+    def __init__(self, db, lag_seconds=120, batch_size=5000):
+        self.db = db
+        self.lag_seconds = lag_seconds
+        self.batch_size = batch_size
+        self.logger = logging.getLogger(__name__)
+        self.last_refresh = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """
+        Adds the log and feedback rows since the watermark to the rollups.
+
+        Returns:
+            dict: Rows counted, the new watermarks, and whether a backlog remains.
+
+        Raises:
+            ConnectionError: If no database connection could be acquired.
+        """
+        with span("analytics_refresh"):
+            connection = self.db.get_connection()
+            if not connection:
+                self.logger.error("Failed to refresh usage rollups: Database connection error.")
+                raise ConnectionError("Database connection error.")
+            try:
+                with connection.cursor() as cursor:
+                    # The same clock as the LOADED_AT defaults.
+                    cursor.execute("SELECT CAST(SYSTIMESTAMP AS TIMESTAMP) FROM dual")
+                    cutoff = cursor.fetchone()[0] - datetime.timedelta(seconds=self.lag_seconds)
+                    cursor.execute(WATERMARK_LOCK_SQL, {"name": ROLLUP_NAME})
+                    last_logid, last_feedback_loaded = cursor.fetchone()
+
+                    batch = RollupBatch()
+                    cursor.execute(NEW_LOG_ROWS_SQL, {"last_logid": last_logid, "batch_size": self.batch_size})
+                    log_rows = cursor.fetchall()
+                    counted = 0
+                    for logid, loaded, created, model, template_name, event, input_tokens, output_tokens, duration, error in log_rows:
+                        # Stop at the first unsettled row; the ones after it wait for it.
+                        if loaded > cutoff:
+                            break
+                        batch.add_request(created, model, template_name, event, input_tokens, output_tokens, duration, error)
+                        last_logid = logid
+                        counted += 1
+
+                    cursor.execute(NEW_FEEDBACK_SQL, {"since": last_feedback_loaded, "until": cutoff})
+                    feedback_rows = cursor.fetchall()
+                    for created, rating, logged, model, template_name, event in feedback_rows:
+                        batch.add_feedback(logged or created, model, template_name, event, rating)
+                    last_feedback_loaded = max(last_feedback_loaded, cutoff)
+
+                    if batch.rows:
+                        cursor.executemany(HOURLY_MERGE_SQL, batch.hourly_binds())
+                    if batch.latency:
+                        cursor.executemany(LATENCY_MERGE_SQL, batch.latency_binds())
+                    cursor.execute(WATERMARK_UPDATE_SQL, {
+                        "name": ROLLUP_NAME, "last_logid": last_logid, "last_feedback_loaded": last_feedback_loaded,
+                    })
+                    connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.close()
+
+        increment("analytics_rows_rolled_up_total", counted, source="log")
+        increment("analytics_rows_rolled_up_total", len(feedback_rows), source="feedback")
+        self.last_refresh = datetime.datetime.now()
+        result = {
+            "log_rows": counted,
+            "feedback_rows": len(feedback_rows),
+            "last_logid": last_logid,
+            "last_feedback_loaded": last_feedback_loaded,
+            "backlog": len(log_rows) == self.batch_size and counted == len(log_rows),
+        }
+        if counted or feedback_rows:
+            self.logger.info(f"Usage rollup refreshed: {result}")
+        return result
+
+    def refresh_all(self, max_batches=100):
+        """Refreshes until no backlog remains; returns the number of log rows counted."""
+        counted = 0
+        for _ in range(max_batches):
+            result = self.refresh()
+            counted += result["log_rows"]
+            if not result["backlog"]:
+                break
+        return counted
+
+    def start(self, interval=300.0):
+        """Refreshes every interval seconds on a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="usage-rollup", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.refresh_all()
+            except Exception:
+                self.logger.error("Usage rollup refresh failed", exc_info=True)
+            self._stop.wait(interval)
+
+
+def fetch_usage(db, since, until=None, group_by=("hour",), model=None, template=None, event=None):
+    """
+    Reads usage from the rollups, grouped by any of "hour", "model", "template" and "event".
+
+    Args:
+        db (DBOracle): The database holding the rollup tables.
+        since (datetime): Start of the range (rounded down to the hour by the rollups).
+        until (datetime): End of the range, exclusive; None means now.
+        group_by (tuple): Dimensions to group by; an empty tuple gives one total row.
+        model, template, event (str): Optional filters.
+
+    Returns:
+        list: One dict per group with the group's dimensions, requests, errors, token totals,
+        avg/p50/p95/p99/max latency in seconds, output tokens per second, feedback count and
+        average rating, ordered by the group columns.
+
+    Raises:
+        ConnectionError: If no database connection could be acquired.
+    """
+    unknown = [name for name in group_by if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimensions: {', '.join(unknown)}.")
+    columns = [DIMENSIONS[name] for name in group_by]
+    where = ["HOUR_START >= :since", "HOUR_START < :until"]
+    params = {"since": since, "until": until or datetime.datetime.now() + datetime.timedelta(hours=1)}
+    for name, value in (("model", model), ("template", template), ("event", event)):
+        if value is not None:
+            where.append(f"{DIMENSIONS[name]} = :{name}")
+            params[name] = value
+    select = "".join(f"{column}, " for column in columns)
+    group = f"GROUP BY {', '.join(columns)}" if columns else ""
+    order = f"ORDER BY {', '.join(columns)}" if columns else ""
+    where = " AND ".join(where)
+
+    connection = db.get_connection()
+    if not connection:
+        logging.getLogger(__name__).error("Failed to fetch usage: Database connection error.")
+        raise ConnectionError("Database connection error.")
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {select}SUM(REQUESTS), SUM(ERRORS), SUM(INPUT_TOKENS), SUM(OUTPUT_TOKENS),
+                       SUM(DURATION_SUM), SUM(DURATION_COUNT), MAX(DURATION_MAX),
+                       SUM(FEEDBACK_COUNT), SUM(RATING_SUM), SUM(RATING_COUNT)
+                FROM INTELLINOTES_USAGE_HOURLY WHERE {where} {group} {order}
+            """, params)
+            totals = cursor.fetchall()
+            cursor.execute(f"""
+                SELECT {select}BUCKET_LE, SUM(REQUESTS)
+                FROM INTELLINOTES_USAGE_LATENCY WHERE {where}
+                GROUP BY {select}BUCKET_LE
+            """, params)
+            histograms = {}
+            for row in cursor.fetchall():
+                key, bound, count = tuple(row[:len(columns)]), row[len(columns)], row[len(columns) + 1]
+                histograms.setdefault(key, {})[float(bound)] = count
+    finally:
+        connection.close()
+
+    usage = []
+    for row in totals:
+        key = tuple(row[:len(columns)])
+        (requests, errors, input_tokens, output_tokens, duration_sum, duration_count,
+         duration_max, feedback_count, rating_sum, rating_count) = row[len(columns):]
+        if not requests and not feedback_count:
+            continue
+        buckets = histograms.get(key, {})
+        entry = dict(zip(group_by, key))
+        entry.update({
+            "requests": requests or 0,
+            "errors": errors or 0,
+            "input_tokens": input_tokens or 0,
+            "output_tokens": output_tokens or 0,
+            "avg_latency": round(duration_sum / duration_count, 2) if duration_count else None,
+            "p50_latency": percentile(buckets, 0.50),
+            "p95_latency": percentile(buckets, 0.95),
+            "p99_latency": percentile(buckets, 0.99),
+            "max_latency": duration_max,
+            "output_tokens_per_second": round(output_tokens / duration_sum, 2) if duration_sum else None,
+            "feedback_count": feedback_count or 0,
+            "avg_rating": round(rating_sum / rating_count, 2) if rating_count else None,
+        })
+        usage.append(entry)
+    return usage
+
+
+_rollups = {}
+_rollups_lock = threading.Lock()
+
+
+def get_usage_rollup(db, **kwargs):
+    """Returns the process-wide usage rollup for the database behind db."""
+    key = (db.user, db.dsn)
+    with _rollups_lock:
+        if key not in _rollups:
+            _rollups[key] = UsageRollup(db, **kwargs)
+        return _rollups[key]
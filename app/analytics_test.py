@@ -0,0 +1,178 @@
+import datetime
+
+import pytest
+
+import analytics
+from analytics import UsageRollup, latency_bucket, percentile
+
+NOW = datetime.datetime(2024, 5, 1, 12, 0)
+
+
+class _FakeDB:
+    """Keeps the log, feedback and rollup tables in memory and answers UsageRollup's statements."""
+
+    user, dsn = "test", "test"
+
+    def __init__(self):
+        self.now = NOW
+        # (LOGID, LOADED_AT, CREATEDATE, MODEL, TEMPLATE_NAME, EVENT, INPUT_TOKENS, OUTPUT_TOKENS, DURATION, error)
+        self.log = []
+        # (LOADED_AT, CREATED_DATE, USER_RATING); attributed to the latest log row
+        self.feedback = []
+        self.watermark = (0, datetime.datetime(1970, 1, 1))
+        self.hourly = {}
+
+    def get_connection(self):
+        return _Connection(self)
+
+    def add_log(self, created, loaded=None, model="llama3.1", duration=5.0):
+        logid = len(self.log) + 1
+        self.log.append((logid, loaded or self.now, created, model, "Brief", "Meeting Summary", 100, 20, duration, 0))
+        return logid
+
+
+class _Connection:
+    def __init__(self, db):
+        self.db = db
+        self.committed = False
+
+    def cursor(self):
+        return _Cursor(self.db)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _Cursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        db = self.db
+        if "SYSTIMESTAMP" in sql:
+            self.rows = [(db.now,)]
+        elif sql is analytics.WATERMARK_LOCK_SQL:
+            self.rows = [db.watermark]
+        elif sql is analytics.NEW_LOG_ROWS_SQL:
+            self.rows = [row for row in db.log if row[0] > params["last_logid"]][:params["batch_size"]]
+        elif sql is analytics.NEW_FEEDBACK_SQL:
+            latest = db.log[-1]
+            self.rows = [
+                (created, rating, latest[2], latest[3], latest[4], latest[5])
+                for loaded, created, rating in db.feedback
+                if params["since"] < loaded <= params["until"]
+            ]
+        elif sql is analytics.WATERMARK_UPDATE_SQL:
+            db.watermark = (params["last_logid"], params["last_feedback_loaded"])
+        else:
+            raise AssertionError(f"Unexpected statement: {sql}")
+
+    def executemany(self, sql, binds):
+        if sql is analytics.HOURLY_MERGE_SQL:
+            for bind in binds:
+                key = (bind["hour_start"], bind["model"])
+                row = self.db.hourly.setdefault(key, {"requests": 0, "feedback_count": 0})
+                row["requests"] += bind["requests"]
+                row["feedback_count"] += bind["feedback_count"]
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return list(self.rows)
+
+
+def _minutes_ago(minutes):
+    return NOW - datetime.timedelta(minutes=minutes)
+
+
+def test_log_rows_are_counted_once_they_have_settled():
+    db = _FakeDB()
+    db.add_log(_minutes_ago(30), loaded=_minutes_ago(30))
+    db.add_log(_minutes_ago(1), loaded=_minutes_ago(1))
+    rollup = UsageRollup(db, lag_seconds=120)
+
+    result = rollup.refresh()
+    assert (result["log_rows"], result["last_logid"]) == (1, 1)
+    assert db.hourly == {(NOW.replace(hour=11), "llama3.1"): {"requests": 1, "feedback_count": 0}}
+
+    db.now += datetime.timedelta(minutes=5)
+    assert rollup.refresh()["log_rows"] == 1
+    assert rollup.refresh()["log_rows"] == 0
+    assert db.hourly[(NOW.replace(hour=11), "llama3.1")]["requests"] == 2
+
+
+def test_settledness_is_judged_by_load_time_not_the_app_set_date():
+    db = _FakeDB()
+    # Replayed from the audit spill: created two hours ago, loaded just now.
+    db.add_log(_minutes_ago(120), loaded=_minutes_ago(0))
+    rollup = UsageRollup(db, lag_seconds=120)
+    assert rollup.refresh()["log_rows"] == 0
+
+    db.now += datetime.timedelta(minutes=5)
+    assert rollup.refresh()["log_rows"] == 1
+    # Counted in the hour it was created in.
+    assert list(db.hourly) == [(NOW.replace(hour=10), "llama3.1")]
+
+
+def test_replayed_feedback_is_counted_after_the_watermark_has_passed_its_date():
+    db = _FakeDB()
+    db.add_log(_minutes_ago(60), loaded=_minutes_ago(60))
+    rollup = UsageRollup(db, lag_seconds=120)
+    rollup.refresh()
+
+    # Submitted an hour ago during an outage, written to the database just now.
+    db.feedback.append((db.now, _minutes_ago(60), 4))
+    assert rollup.refresh()["feedback_rows"] == 0
+    db.now += datetime.timedelta(minutes=5)
+    assert rollup.refresh()["feedback_rows"] == 1
+    assert rollup.refresh()["feedback_rows"] == 0
+    assert db.hourly[(NOW.replace(hour=11), "llama3.1")]["feedback_count"] == 1
+
+
+def test_a_backlog_is_worked_off_in_batches():
+    db = _FakeDB()
+    for _ in range(5):
+        db.add_log(_minutes_ago(30), loaded=_minutes_ago(30))
+    rollup = UsageRollup(db, lag_seconds=120, batch_size=2)
+    assert rollup.refresh()["backlog"]
+    assert rollup.refresh_all() == 3
+    assert db.watermark[0] == 5
+
+
+def test_a_failed_refresh_leaves_the_watermark():
+    db = _FakeDB()
+    db.add_log(_minutes_ago(30), loaded=_minutes_ago(30))
+    db.add_log(_minutes_ago(30), loaded=_minutes_ago(30), duration="not a number")
+    with pytest.raises(ValueError):
+        UsageRollup(db).refresh()
+    assert db.watermark[0] == 0
+
+
+def test_percentiles_are_interpolated_within_a_bucket():
+    assert latency_bucket(0.5) == 1 and latency_bucket(7) == 10 and latency_bucket(1000) == analytics.OVERFLOW_BUCKET
+    assert percentile({}, 0.5) is None
+    assert percentile({5: 10}, 0.5) == 3.5
+    assert percentile({analytics.OVERFLOW_BUCKET: 1}, 0.99) == 600.0
+
+
+def test_a_missing_database_connection_is_reported():
+    db = _FakeDB()
+    db.get_connection = lambda: None
+    with pytest.raises(ConnectionError):
+        UsageRollup(db).refresh()
+    with pytest.raises(ConnectionError):
+        analytics.fetch_usage(db, NOW)
@@ -0,0 +1,85 @@
+"""
+A process-wide asyncio event loop for code that is not itself async.
+
+Streamlit script threads and the batch CLI are synchronous, while the LLM calls are
+asyncio-native. get_loop() starts one event loop on a daemon thread; run_sync() and
+iterate_sync() run coroutines and async iterators on it from any thread. If the calling
+thread gives up (an exception, or a closed generator), the coroutine is cancelled, which
+closes any HTTP stream it has open.
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """Returns the shared event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async-runtime", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def run_sync(coroutine, timeout=None):
+    """
+    Runs a coroutine on the shared loop and waits for its result.
+
+    Raises:
+        TimeoutError: If timeout seconds pass first; the coroutine is cancelled.
+    """
+    loop = get_loop()
+    if _running_loop() is loop:
+        coroutine.close()
+        raise RuntimeError("run_sync() cannot be called from the shared event loop; await the coroutine instead.")
+    future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        if future.done():
+            # The coroutine itself raised TimeoutError (the same class since Python 3.11).
+            raise
+        future.cancel()
+        raise TimeoutError(f"Timed out after {timeout}s.") from None
+    except BaseException:
+        future.cancel()
+        raise
+
+
+def iterate_sync(async_iterable):
+    """
+    Iterates an async iterable from synchronous code, one item at a time.
+
+    Closing the returned generator (or abandoning it) closes the async iterator on the loop.
+    """
+    iterator = async_iterable.__aiter__()
+    try:
+        while True:
+            try:
+                item = run_sync(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            run_sync(aclose())
+
+
+async def run_async(coroutine):
+    """Awaits a coroutine on the shared loop from another event loop."""
+    if _running_loop() is get_loop():
+        return await coroutine
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, get_loop()))
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
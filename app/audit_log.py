@@ -0,0 +1,330 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+
+class AuditLogWriter:
+    """
+    Write-behind logger for INTELLINOTES_LOG and IntelliNotes_Feedback.
+
+    Records are queued by the request thread and written by a background thread with
+    executemany, in batches of batch_size or every flush_interval seconds, whichever
+    comes first. The queue holds at most max_queue_size records and about max_queue_bytes
+    of text, since a record carries a whole transcript and summary. Batches that cannot be
+    written are appended to a bounded JSONL spill file and replayed once the database
+    accepts writes again; records the database keeps refusing are moved to a quarantine
+    file next to it. The queue is drained on interpreter shutdown.
+    """
+
+    def __init__(self, db, batch_size=50, flush_interval=2.0, max_queue_size=10000,
+                 max_queue_bytes=64 * 1024 * 1024, spill_path="audit_spill.jsonl", max_spill_bytes=50 * 1024 * 1024, retry_interval=30.0,
+                 max_replay_attempts=3):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_bytes = max_queue_bytes
+        self.spill_path = spill_path
+        self.quarantine_path = os.path.splitext(spill_path)[0] + ".quarantine.jsonl"
+        self.max_spill_bytes = max_spill_bytes
+        self.retry_interval = retry_interval
+        self.max_replay_attempts = max_replay_attempts
+        self.logger = logging.getLogger(__name__)
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._queued_bytes = 0
+        self._written = 0
+        self._spilled = 0
+        self._dropped = 0
+        self._quarantined = 0
+        self._flushes = 0
+        self._total_flush_time = 0.0
+        self._last_flush_time = 0.0
+        self._replay_after = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log_entry(self, event, model, input_message, output_message=None,
+                  input_tokens=None, output_tokens=None, duration=None,
+                  error_message=None, user_id=None, user_rating=None,
+                  user_feedback=None, created_date=None, custom_prompt=None, template_name=None):
+        """
+        Queues an event for INTELLINOTES_LOG. Takes the same arguments as DBOracle.log_entry.
+
+        Returns:
+            bool: True if the record was queued, False if the queue is full or the writer is closed.
+        """
+        return self._enqueue("log", {
+            "event": event,
+            "model": model,
+            "input_message": input_message,
+            "output_message": output_message,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "duration": duration,
+            "error_message": error_message,
+            "user_id": user_id,
+            "user_rating": user_rating,
+            "user_feedback": user_feedback,
+            "created_date": created_date or datetime.datetime.now(),
+            "custom_prompt": custom_prompt,
+            "template_name": template_name,
+        })
+
+    def log_feedback(self, logid, user_id, user_feedback, user_rating, created_date=None):
+        """
+        Queues feedback for IntelliNotes_Feedback. Takes the same arguments as DBOracle.log_feedback.
+
+        Returns:
+            bool: True if the record was queued, False if the queue is full or the writer is closed.
+        """
+        return self._enqueue("feedback", {
+            "logid": logid,
+            "user_id": user_id,
+            "user_feedback": user_feedback,
+            "user_rating": user_rating,
+            "created_date": created_date or datetime.datetime.now(),
+        })
+
+    def stats(self):
+        """Returns queue depth, record counts and flush latency."""
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_bytes": self._queued_bytes,
+                "written": self._written,
+                "spilled": self._spilled,
+                "dropped": self._dropped,
+                "quarantined": self._quarantined,
+                "flushes": self._flushes,
+                "last_flush_ms": round(1000 * self._last_flush_time, 2),
+                "avg_flush_ms": round(1000 * self._total_flush_time / self._flushes, 2) if self._flushes else 0.0,
+                "spill_bytes": os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0,
+            }
+
+    def adopt_spill(self, path):
+        """
+        Moves another writer's spill file into this writer's, to be replayed with it.
+
+        Returns:
+            bool: False if the file was gone, e.g. adopted by another process first.
+        """
+        # Renaming first claims the file, so two processes cannot both replay it.
+        claimed = f"{path}.{os.getpid()}"
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return False
+        with open(claimed, encoding="utf-8") as spill_file:
+            lines = [line for line in spill_file if line.strip()]
+        with self._spill_lock:
+            with open(self.spill_path, "a", encoding="utf-8") as spill_file:
+                spill_file.writelines(lines)
+        os.remove(claimed)
+        self.logger.info(f"Adopted {len(lines)} spilled audit records from {path}.")
+        return True
+
+    def close(self, timeout=10):
+        """Stops accepting records and waits for the queue to be flushed."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.logger.warning(f"Audit log writer did not drain within {timeout}s; {self._queue.qsize()} records left.")
+
+    def _enqueue(self, kind, record):
+        if self._stop.is_set():
+            self.logger.error(f"Audit log writer is closed; dropping {kind} record.")
+            return False
+        size = _record_size(record)
+        with self._stats_lock:
+            if self._queued_bytes + size <= self.max_queue_bytes:
+                try:
+                    self._queue.put_nowait((kind, record))
+                    self._queued_bytes += size
+                    return True
+                except queue.Full:
+                    pass
+            self._dropped += 1
+        self.logger.error(f"Audit log queue is full; dropping {kind} record.")
+        return False
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    kind, record = self._queue.get(timeout=min(remaining, 0.5))
+                except queue.Empty:
+                    if self._stop.is_set():
+                        break
+                    continue
+                with self._stats_lock:
+                    self._queued_bytes -= _record_size(record)
+                batch.append((kind, record))
+            if batch:
+                self._flush(batch)
+            elif self._should_replay():
+                self._replay_spill()
+
+    def _flush(self, batch):
+        start_time = time.perf_counter()
+        failed = []
+        for kind, write in (("log", self.db.log_entries), ("feedback", self.db.log_feedback_batch)):
+            records = [record for record_kind, record in batch if record_kind == kind]
+            if records and not write(records):
+                failed.extend((kind, record) for record in records)
+        elapsed = time.perf_counter() - start_time
+
+        with self._stats_lock:
+            self._flushes += 1
+            self._written += len(batch) - len(failed)
+            self._total_flush_time += elapsed
+            self._last_flush_time = elapsed
+        self.logger.info(f"Flushed {len(batch) - len(failed)}/{len(batch)} audit records in {elapsed:.3f}s.")
+
+        if failed:
+            self._spill(failed)
+            self._replay_after = time.monotonic() + self.retry_interval
+        elif self._should_replay():
+            self._replay_spill()
+
+    def _should_replay(self):
+        return os.path.exists(self.spill_path) and time.monotonic() >= self._replay_after
+
+    def _spill(self, records):
+        """Appends records that could not be written to the spill file, up to max_spill_bytes."""
+        lines = [json.dumps({"kind": kind, "record": record}, default=_json_default) + "\n" for kind, record in records]
+        with self._spill_lock:
+            size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+            kept = []
+            for line in lines:
+                size += len(line.encode("utf-8"))
+                if size > self.max_spill_bytes:
+                    break
+                kept.append(line)
+            with open(self.spill_path, "a", encoding="utf-8") as spill_file:
+                spill_file.writelines(kept)
+
+        with self._stats_lock:
+            self._spilled += len(kept)
+            self._dropped += len(lines) - len(kept)
+        if len(kept) < len(lines):
+            self.logger.error(f"Audit spill file is full; dropped {len(lines) - len(kept)} records.")
+        else:
+            self.logger.warning(f"Database unavailable; spilled {len(kept)} audit records to {self.spill_path}.")
+
+    def _replay_spill(self):
+        """
+        Writes spilled records back to the database, keeping those it could not write.
+
+        The spill file is taken under the lock and replayed without it, so request threads
+        spilling a failed batch do not wait on the database; the records left over are put
+        back in front of anything spilled meanwhile. A batch that fails is retried row by
+        row. While the database is unreachable, the rest of the spill is kept as is; a row
+        that fails with the database up (a constraint violation, a value too large) is kept
+        for another try and, after max_replay_attempts, moved to the quarantine file so it
+        cannot block the rows behind it.
+        """
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, encoding="utf-8") as spill_file:
+                    spilled = [json.loads(line) for line in spill_file if line.strip()]
+            except (OSError, ValueError):
+                self.logger.error("Failed to read audit spill file", exc_info=True)
+                return
+            os.remove(self.spill_path)
+
+        writers = {"log": self.db.log_entries, "feedback": self.db.log_feedback_batch}
+        remaining, quarantined, written, unreachable = [], [], 0, False
+        for kind in ("log", "feedback"):
+            items = [item for item in spilled if item["kind"] == kind]
+            for start in range(0, len(items), self.batch_size):
+                batch = items[start:start + self.batch_size]
+                if unreachable:
+                    remaining.extend(batch)
+                    continue
+                if writers[kind]([_record(item) for item in batch]):
+                    written += len(batch)
+                    continue
+                for index, item in enumerate(batch):
+                    if writers[kind]([_record(item)]):
+                        written += 1
+                    elif not self.db.check_health():
+                        unreachable = True
+                        remaining.extend(batch[index:])
+                        break
+                    else:
+                        attempts = item.get("attempts", 0) + 1
+                        failed = quarantined if attempts >= self.max_replay_attempts else remaining
+                        failed.append(dict(item, attempts=attempts))
+
+        with self._spill_lock:
+            if remaining:
+                self._replay_after = time.monotonic() + self.retry_interval
+                try:
+                    with open(self.spill_path, encoding="utf-8") as spill_file:
+                        spilled_meanwhile = [line for line in spill_file if line.strip()]
+                except FileNotFoundError:
+                    spilled_meanwhile = []
+                self._write_spill(self.spill_path, remaining, "w")
+                with open(self.spill_path, "a", encoding="utf-8") as spill_file:
+                    spill_file.writelines(spilled_meanwhile)
+            if quarantined:
+                self._write_spill(self.quarantine_path, quarantined, "a")
+        if quarantined:
+            self.logger.error(f"Moved {len(quarantined)} audit records that keep failing to {self.quarantine_path}.")
+        with self._stats_lock:
+            self._written += written
+            self._quarantined += len(quarantined)
+        self.logger.info(f"Replayed {written}/{len(spilled)} spilled audit records.")
+
+    @staticmethod
+    def _write_spill(path, items, mode):
+        with open(path, mode, encoding="utf-8") as spill_file:
+            spill_file.writelines(json.dumps(item, default=_json_default) + "\n" for item in items)
+
+
+def _record_size(record):
+    """Approximates a queued record's size by the length of its text fields."""
+    return sum(len(value) for value in record.values() if isinstance(value, str))
+
+
+def _record(item):
+    record = dict(item["record"])
+    record["created_date"] = datetime.datetime.fromisoformat(record["created_date"])
+    return record
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# Writers are shared across Streamlit sessions and reruns, keyed by (user, dsn).
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_audit_writer(db, **kwargs):
+    """Returns the process-wide audit log writer for the database behind db."""
+    key = (db.user, db.dsn)
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = AuditLogWriter(db, **kwargs)
+        return _writers[key]
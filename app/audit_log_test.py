@@ -0,0 +1,146 @@
+import datetime
+import json
+import os
+import threading
+
+import pytest
+
+from audit_log import AuditLogWriter
+
+
+class _FlakyDB:
+    """Accepts rows unless it is down or the row's event is in rejected."""
+
+    user, dsn = "test", "test"
+
+    def __init__(self):
+        self.down = False
+        self.rejected = set()
+        self.rows = []
+        self.feedback = []
+
+    def check_health(self):
+        return not self.down
+
+    def log_entries(self, entries):
+        if self.down or any(entry["event"] in self.rejected for entry in entries):
+            return False
+        self.rows.extend(entries)
+        return True
+
+    def log_feedback_batch(self, feedback):
+        if self.down:
+            return False
+        self.feedback.extend(feedback)
+        return True
+
+
+def _entry(event):
+    return ("log", {"event": event, "model": "stub", "input_message": "transcript",
+                    "created_date": datetime.datetime(2024, 5, 1, 9, 30)})
+
+
+@pytest.fixture
+def writer(tmp_path):
+    db = _FlakyDB()
+    # Long intervals keep the writer thread out of the way; the tests flush and replay themselves.
+    writer = AuditLogWriter(db, batch_size=2, flush_interval=60, spill_path=str(tmp_path / "spill.jsonl"),
+                            retry_interval=3600)
+    yield writer
+    writer.close()
+
+
+def _spilled(writer):
+    with open(writer.spill_path, encoding="utf-8") as spill_file:
+        return [json.loads(line) for line in spill_file]
+
+
+def test_failed_batches_are_spilled_and_replayed(writer):
+    writer.db.down = True
+    writer._flush([_entry("a"), _entry("b"), ("feedback", {"logid": 1, "user_id": 1, "user_feedback": "ok",
+                                                           "user_rating": 5, "created_date": datetime.datetime.now()})])
+    assert len(_spilled(writer)) == 3
+
+    writer._replay_spill()
+    assert len(_spilled(writer)) == 3
+    assert all(not item.get("attempts") for item in _spilled(writer))
+
+    writer.db.down = False
+    writer._replay_spill()
+    assert not os.path.exists(writer.spill_path)
+    assert [row["event"] for row in writer.db.rows] == ["a", "b"]
+    assert isinstance(writer.db.rows[0]["created_date"], datetime.datetime)
+    assert len(writer.db.feedback) == 1
+    assert writer.stats()["written"] == 3
+
+
+def test_a_row_the_database_refuses_is_quarantined(writer):
+    writer.db.down = True
+    writer._flush([_entry("a"), _entry("poison"), _entry("c")])
+    writer.db.down = False
+    writer.db.rejected.add("poison")
+
+    writer._replay_spill()
+    assert [row["event"] for row in writer.db.rows] == ["a", "c"]
+    assert [(item["record"]["event"], item["attempts"]) for item in _spilled(writer)] == [("poison", 1)]
+    assert writer.stats()["written"] == 2
+
+    for _ in range(writer.max_replay_attempts - 1):
+        writer._replay_spill()
+    assert not os.path.exists(writer.spill_path)
+    with open(writer.quarantine_path, encoding="utf-8") as quarantine:
+        assert [json.loads(line)["record"]["event"] for line in quarantine] == ["poison"]
+    assert writer.stats()["quarantined"] == 1
+    assert writer.stats()["written"] == 2
+
+
+def test_replay_stops_when_the_database_goes_away(writer):
+    writer.db.down = True
+    writer._flush([_entry("a"), _entry("b"), _entry("c")])
+    writer.db.down = False
+    writer.db.rejected.add("b")
+    # Refused rows while the database is down are not counted against them.
+    writer.db.check_health = lambda: False
+
+    writer._replay_spill()
+    assert [row["event"] for row in writer.db.rows] == ["a"]
+    assert [(item["record"]["event"], item.get("attempts")) for item in _spilled(writer)] == [("b", None), ("c", None)]
+
+
+def test_spilling_does_not_wait_for_a_replay(writer):
+    writer.db.down = True
+    writer._flush([_entry("a"), _entry("b")])
+    writer.db.rejected.add("b")
+    writer.db.down = False
+    log_entries = writer.db.log_entries
+    spillers = []
+
+    def spill_meanwhile(entries):
+        # A request thread spills while the replay is talking to the database.
+        if not spillers:
+            spillers.append(threading.Thread(target=writer._spill, args=([_entry("new")],)))
+            spillers[0].start()
+            spillers[0].join(5)
+            assert not spillers[0].is_alive()
+        return log_entries(entries)
+
+    writer.db.log_entries = spill_meanwhile
+    writer._replay_spill()
+    assert [row["event"] for row in writer.db.rows] == ["a"]
+    # The leftover goes back in front of the record spilled during the replay.
+    assert [item["record"]["event"] for item in _spilled(writer)] == ["b", "new"]
+
+
+def test_the_queue_is_bounded_by_size(tmp_path):
+    writer = AuditLogWriter(_FlakyDB(), flush_interval=60, max_queue_bytes=100,
+                            spill_path=str(tmp_path / "spill.jsonl"))
+    # Stop the writer thread so the records stay queued.
+    writer._stop.set()
+    writer._thread.join()
+    writer._stop.clear()
+
+    assert writer.log_entry("Meeting Summary", "stub", "x" * 60)
+    assert not writer.log_entry("Meeting Summary", "stub", "x" * 60)
+    assert writer.log_feedback(1, "dana", "short", 5)
+    assert writer.stats()["queue_bytes"] == len("Meeting Summary") + len("stub") + 60 + len("dana") + len("short")
+    assert writer.stats()["dropped"] == 1
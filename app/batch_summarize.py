@@ -0,0 +1,252 @@
+"""
+Headless batch summarization.
+
+Summarizes every .txt/.docx/.vtt/.srt transcript matched by the given directories or glob
+patterns with one or more templates from INTELLINOTES_PROMPTS, on a bounded worker pool, and
+appends one JSON line per (file, template) to the output file as results complete.
+A file's templates run together with the transcript as a shared prompt prefix.
+Re-running with the same output file skips pairs that already succeeded.
+
+Example:
+    python app/batch_summarize.py assets/ --template "General Meeting" --template Sales \
+        --output summaries.jsonl --workers 4
+"""
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from ai_handlers import AIHandler
+from compaction import compact_transcript
+from ingest import SUPPORTED_EXTENSIONS, read_transcript
+from summarize import OLLAMA
+from token_accounting import token_usage
+from utils import DBOracle
+
+
+def find_transcripts(inputs):
+    """Expands directories and glob patterns into a sorted list of transcript paths."""
+    paths = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*")
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and path.lower().endswith(SUPPORTED_EXTENSIONS):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def load_completed(output_path):
+    """Returns the (file, template) pairs that already have a successful result in output_path."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run; that pair is simply redone.
+                continue
+            if record.get("status") == "ok":
+                completed.add((record["file"], record["template"]))
+    return completed
+
+
+class BatchSummarizer:
+    """Runs (file, template) jobs through AIHandler on a worker pool and streams results to JSONL."""
+
+    def __init__(self, ai_handler, templates, output_path, workers=4, model_name="llama3.1", audit_log=None,
+                 compact=True):
+        self.ai_handler = ai_handler
+        self.templates = templates
+        self.output_path = output_path
+        self.workers = workers
+        self.model_name = model_name
+        self.audit_log = audit_log
+        self.compact = compact
+        self.logger = logging.getLogger(__name__)
+        self._write_lock = threading.Lock()
+
+    def run(self, paths, template_names):
+        """
+        Summarizes every path with every template, skipping pairs already in the output file.
+
+        Returns:
+            dict: Throughput summary for this run.
+        """
+        completed = load_completed(self.output_path)
+        # Templates still to run per file; a file's templates run together so they share its prefix.
+        pending = {}
+        for path in paths:
+            names = [name for name in template_names if (path, name) not in completed]
+            if names:
+                pending[path] = names
+        total = sum(len(names) for names in pending.values())
+        skipped = len(paths) * len(template_names) - total
+        self.logger.info(f"Batch: {total} jobs to run, {skipped} already completed.")
+
+        results = []
+        start_time = time.time()
+        with open(self.output_path, "a", encoding="utf-8") as output_file, \
+                ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self._summarize, path, names) for path, names in pending.items()]
+            for future in as_completed(futures):
+                for record in future.result():
+                    with self._write_lock:
+                        output_file.write(json.dumps(record) + "\n")
+                        output_file.flush()
+                    results.append(record)
+                    print(f"[{len(results)}/{total}] {record['status']:5} {record['duration']:7.2f}s  "
+                          f"{record['template']}  {record['file']}")
+
+        return self._throughput(results, skipped, time.time() - start_time)
+
+    def _summarize(self, path, template_names):
+        """Summarizes one file with its pending templates and returns one record per template."""
+        start_time = time.time()
+        records = {name: {"file": path, "template": name, "model": self.model_name} for name in template_names}
+        transcript = None
+        try:
+            transcript = read_transcript(path)
+            llm_transcript = transcript
+            tokens_saved = None
+            if self.compact:
+                llm_transcript, compaction_stats = compact_transcript(transcript)
+                tokens_saved = compaction_stats.tokens_saved
+            if len(template_names) == 1:
+                generation_infos = []
+                summary = self.ai_handler.generate_summary_ollama_chunked(
+                    llm_transcript, self.templates[template_names[0]], generation_infos
+                )
+                summaries, infos, prefix_saved = {template_names[0]: summary}, {template_names[0]: generation_infos}, None
+            else:
+                result = self.ai_handler.generate_summaries_ollama(
+                    llm_transcript, {name: self.templates[name] for name in template_names}
+                )
+                summaries, infos = result.summaries, result.generation_infos
+                prefix_saved = round(result.saved_prompt_eval_seconds, 2)
+            for name, record in records.items():
+                usage = token_usage(llm_transcript, summaries[name], infos[name])
+                record.update({
+                    "status": "ok",
+                    "summary": summaries[name],
+                    "input_tokens": usage.input_tokens,
+                    "output_tokens": usage.output_tokens,
+                    "token_source": usage.source,
+                })
+                if tokens_saved is not None:
+                    record["tokens_saved"] = tokens_saved
+                if prefix_saved is not None:
+                    # Per file: shared by all of the file's records.
+                    record["file_prompt_eval_saved_seconds"] = prefix_saved
+        except Exception as e:
+            self.logger.error(f"Batch summary failed for {path} ({', '.join(template_names)})", exc_info=True)
+            for record in records.values():
+                record.update({"status": "error", "error": str(e)})
+
+        duration = round(time.time() - start_time, 2)
+        for record in records.values():
+            record["duration"] = duration
+            record["completed_at"] = datetime.datetime.now().isoformat()
+            if self.audit_log and record["status"] == "ok":
+                self.audit_log.log_entry(
+                    event="Batch Summary",
+                    # The engine, as the app logs it, so the usage rollups keep one bucket per engine.
+                    model=OLLAMA,
+                    input_message=transcript,
+                    output_message=record["summary"],
+                    input_tokens=record["input_tokens"],
+                    output_tokens=record["output_tokens"],
+                    duration=record["duration"],
+                    template_name=record["template"],
+                )
+        return list(records.values())
+
+    def _throughput(self, results, skipped, elapsed):
+        succeeded = [r for r in results if r["status"] == "ok"]
+        output_tokens = sum(r["output_tokens"] for r in succeeded)
+        return {
+            "jobs": len(results),
+            "succeeded": len(succeeded),
+            "failed": len(results) - len(succeeded),
+            "skipped": skipped,
+            "elapsed_seconds": round(elapsed, 2),
+            "jobs_per_minute": round(60 * len(results) / elapsed, 2) if elapsed else 0.0,
+            "avg_job_seconds": round(sum(r["duration"] for r in results) / len(results), 2) if results else 0.0,
+            "input_tokens": sum(r["input_tokens"] for r in succeeded),
+            "output_tokens": output_tokens,
+            "output_tokens_per_second": round(output_tokens / elapsed, 2) if elapsed else 0.0,
+            "prompt_eval_saved_seconds": round(sum(
+                {r["file"]: r.get("file_prompt_eval_saved_seconds") or 0 for r in succeeded}.values()
+            ), 2),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a directory of meeting transcripts.")
+    parser.add_argument("inputs", nargs="+", help="Directories or glob patterns of transcript files.")
+    parser.add_argument("--template", action="append", required=True, dest="templates",
+                        help="Template name from INTELLINOTES_PROMPTS; repeat for several templates.")
+    parser.add_argument("--output", default="summaries.jsonl", help="JSONL file results are appended to.")
+    parser.add_argument("--workers", type=int, default=4, help="Transcripts summarized concurrently.")
+    parser.add_argument("--ollama-url", default="http://uatml1.itrans.int:11434/",
+                        help="Ollama server URL; several comma-separated URLs spread the load.")
+    parser.add_argument("--hedge-after", type=float,
+                        help="Seconds without a first token before a request is also sent to another server.")
+    parser.add_argument("--model", default="llama3.1")
+    parser.add_argument("--log-to-db", action="store_true", help="Also write each summary to INTELLINOTES_LOG.")
+    parser.add_argument("--no-compact", action="store_true", help="Send transcripts to the model as-is.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+
+    db = DBOracle(os.getenv("DB_USER"), os.getenv("DB_PASSWORD"), os.getenv("DB_DSN", "UATGVPDB.ITRANS.INT/GVPUAT2"))
+    # fetch_templates() logs and returns nothing when the database cannot be reached.
+    templates = {t["name"]: t["prompt"] for t in db.fetch_templates()}
+    if not templates:
+        parser.error("Could not read the templates from INTELLINOTES_PROMPTS; is the database available?")
+    # A template named twice would be summarized and counted twice.
+    args.templates = list(dict.fromkeys(args.templates))
+    missing = [name for name in args.templates if name not in templates]
+    if missing:
+        parser.error(f"Unknown template(s): {', '.join(missing)}")
+
+    paths = find_transcripts(args.inputs)
+    if not paths:
+        parser.error(f"No {'/'.join(SUPPORTED_EXTENSIONS)} transcripts found.")
+
+    audit_log = None
+    if args.log_to_db:
+        from audit_log import get_audit_writer
+        audit_log = get_audit_writer(db)
+
+    summarizer = BatchSummarizer(
+        AIHandler(args.ollama_url, args.model, hedge_after=args.hedge_after),
+        templates,
+        args.output,
+        workers=args.workers,
+        model_name=args.model,
+        audit_log=audit_log,
+        compact=not args.no_compact,
+    )
+    summary = summarizer.run(paths, args.templates)
+    if audit_log:
+        audit_log.close()
+
+    print("\nThroughput summary")
+    for key, value in summary.items():
+        print(f"  {key:26} {value}")
+    logging.info(f"Batch summarization finished: {summary}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
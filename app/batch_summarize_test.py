@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+import batch_summarize
+from stubs import StubDB, StubOllamaServer
+from summarize import OLLAMA
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch, word_tokens):
+    (tmp_path / "standup.txt").write_text("Alice: We ship on Friday.\nBob: I'll update the release notes.\n")
+    monkeypatch.chdir(tmp_path)
+    # Keep the repository's .env out of the test process.
+    monkeypatch.setattr(batch_summarize, "load_dotenv", lambda: None)
+    return tmp_path
+
+
+def _use_db(monkeypatch, db):
+    monkeypatch.setattr(batch_summarize, "DBOracle", lambda user, password, dsn: db)
+
+
+def test_repeated_templates_run_once_and_are_logged_under_the_engine(workdir, monkeypatch):
+    db = StubDB(latency=0)
+    _use_db(monkeypatch, db)
+    with StubOllamaServer(first_token_latency=0.01, tokens_per_second=1000, output_tokens=5) as ollama:
+        exit_code = batch_summarize.main([
+            str(workdir), "--template", "General Meeting", "--template", "General Meeting",
+            "--ollama-url", ollama.url, "--model", ollama.model, "--log-to-db", "--output", "out.jsonl",
+        ])
+
+    assert exit_code == 0
+    records = [json.loads(line) for line in (workdir / "out.jsonl").read_text().splitlines()]
+    assert [(record["template"], record["status"]) for record in records] == [("General Meeting", "ok")]
+    assert [(row["event"], row["model"]) for row in db.log_rows] == [("Batch Summary", OLLAMA)]
+
+
+def test_an_unreachable_database_is_reported_as_such(workdir, monkeypatch, capsys):
+    db = StubDB(latency=0)
+    db.fetch_templates = lambda: []
+    _use_db(monkeypatch, db)
+    with pytest.raises(SystemExit):
+        batch_summarize.main([str(workdir), "--template", "General Meeting"])
+    error = capsys.readouterr().err
+    assert "database available" in error and "Unknown template" not in error
@@ -0,0 +1,276 @@
+"""
+Offline end-to-end benchmark of the summarize path.
+
+Parses each upload the way main.py does and runs it through summarize.Summarizer, the path
+behind the "Generate Summary" button (compaction, summary cache, single-flight, fair
+scheduler, streaming generation, extractive fallback, token accounting, audit log), against
+local stub Ollama servers and an in-memory stub database, at one or more levels of
+concurrent users. Reports p50/p95/p99 latency, time to first token, throughput and peak
+memory, and saves the results as JSON so two runs can be compared.
+
+Every pass repeats the same inputs, so the summary cache is off unless --summary-cache is
+given; otherwise only the first pass would reach the model.
+
+Example:
+    python app/benchmark.py --users 1,4,8 --iterations 3 --output bench.json
+    python app/benchmark.py --users 1,4,8 --iterations 3 --compare bench.json
+"""
+import argparse
+import datetime
+import glob
+import io
+import json
+import logging
+import os
+import platform
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_handlers import AIHandler
+from audit_log import AuditLogWriter
+from ingest import read_transcript
+from scheduler import FairScheduler
+from single_flight import SingleFlight
+from stubs import StubDB, StubOllamaServer
+from summarize import OLLAMA, SummaryRequest, Summarizer
+from summary_cache import SummaryCache
+from template_cache import TemplateCache
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assets")
+
+
+def percentile(values, q):
+    """Returns the q-th percentile (0-100) of values by nearest rank."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(q / 100 * len(ordered) + 0.5)))
+    return round(ordered[min(rank, len(ordered)) - 1], 4)
+
+
+def describe(values):
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": round(sum(values) / len(values), 4) if values else None,
+        "max": round(max(values), 4) if values else None,
+    }
+
+
+def load_inputs(synthetic_sizes):
+    """
+    Returns (name, file name, raw bytes) for every asset transcript plus synthetic ones.
+
+    Synthetic transcripts repeat the paragraphs of the asset transcripts until they reach
+    each requested size in characters.
+    """
+    inputs = []
+    for path in sorted(glob.glob(os.path.join(ASSETS_DIR, "*.txt")) + glob.glob(os.path.join(ASSETS_DIR, "*.docx"))):
+        with open(path, "rb") as input_file:
+            inputs.append((os.path.basename(path), os.path.basename(path), input_file.read()))
+
+    paragraphs = [
+        paragraph
+        for _, file_name, data in inputs if file_name.endswith(".txt")
+        for paragraph in data.decode("utf-8", errors="replace").split("\n\n") if paragraph.strip()
+    ]
+    for size in synthetic_sizes:
+        parts, length, index = [], 0, 0
+        while paragraphs and length < size:
+            paragraph = paragraphs[index % len(paragraphs)]
+            parts.append(paragraph)
+            length += len(paragraph) + 2
+            index += 1
+        inputs.append((f"synthetic-{size}", "synthetic.txt", "\n\n".join(parts).encode("utf-8")))
+    return inputs
+
+
+def parse_transcript(file_name, data):
+    """Decodes an upload the way main.py does."""
+    return read_transcript(io.BytesIO(data), file_name)
+
+
+class Benchmark:
+    """Runs the summarize pipeline against stub backends and collects timings."""
+
+    def __init__(self, summarizer, template_name="General Meeting"):
+        self.summarizer = summarizer
+        self.template_name = template_name
+        self.logger = logging.getLogger(__name__)
+
+    def run_request(self, file_name, data, user="benchmark"):
+        """Runs one request end to end and returns its timings in seconds."""
+        start_time = time.perf_counter()
+        transcript = parse_transcript(file_name, data)
+        result = self.summarizer.run(SummaryRequest(transcript, self.template_name, engine=OLLAMA, user=user))
+        return {
+            "latency": time.perf_counter() - start_time,
+            "time_to_first_token": result.time_to_first_token,
+            "input_tokens": result.input_tokens,
+            "cache_hit": result.cache_hit,
+            "coalesced": result.coalesced,
+            "fallback": result.engine != OLLAMA,
+        }
+
+    def run_level(self, users, inputs, iterations):
+        """Runs every input iterations times per user, with users concurrent users."""
+        jobs = [item for _ in range(iterations * users) for item in inputs]
+        results, errors = [], 0
+        lock = threading.Lock()
+
+        def worker(job):
+            nonlocal errors
+            name, file_name, data = job
+            try:
+                # One scheduler user per concurrent benchmark user, as per browser session in the app.
+                result = self.run_request(file_name, data, user=threading.current_thread().name)
+                result["input"] = name
+                with lock:
+                    results.append(result)
+            except Exception:
+                self.logger.error(f"Benchmark request for {name} failed", exc_info=True)
+                with lock:
+                    errors += 1
+
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as executor:
+            list(executor.map(worker, jobs))
+        elapsed = time.perf_counter() - start_time
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies = [r["latency"] for r in results]
+        return {
+            "users": users,
+            "requests": len(jobs),
+            "errors": errors,
+            "cache_hits": sum(r["cache_hit"] for r in results),
+            "coalesced": sum(r["coalesced"] for r in results),
+            "fallbacks": sum(r["fallback"] for r in results),
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_rps": round(len(results) / elapsed, 3) if elapsed else None,
+            "latency": describe(latencies),
+            "time_to_first_token": describe([r["time_to_first_token"] for r in results if r["time_to_first_token"] is not None]),
+            "peak_memory_mb": round(peak_memory / (1024 * 1024), 2),
+            "per_input_p50": {
+                name: percentile([r["latency"] for r in results if r["input"] == name], 50)
+                for name, _, _ in inputs
+            },
+        }
+
+
+def compare(previous, current):
+    """Prints latency and throughput changes between two saved benchmark runs."""
+    previous_levels = {level["users"]: level for level in previous["levels"]}
+    print(f"\nComparison with run from {previous['timestamp']}")
+    print(f"{'users':>5} {'metric':>16} {'before':>10} {'after':>10} {'change':>8}")
+    for level in current["levels"]:
+        before = previous_levels.get(level["users"])
+        if not before:
+            continue
+        rows = [("throughput_rps", before["throughput_rps"], level["throughput_rps"])]
+        rows += [(f"latency_{q}", before["latency"][q], level["latency"][q]) for q in ("p50", "p95", "p99")]
+        rows.append(("peak_memory_mb", before["peak_memory_mb"], level["peak_memory_mb"]))
+        for metric, old, new in rows:
+            change = f"{100 * (new - old) / old:+.1f}%" if old and new is not None else "n/a"
+            print(f"{level['users']:>5} {metric:>16} {old!s:>10} {new!s:>10} {change:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the summarize path against stub backends.")
+    parser.add_argument("--users", default="1,4,8", help="Comma-separated concurrent user levels.")
+    parser.add_argument("--iterations", type=int, default=2, help="Passes over the inputs per user.")
+    parser.add_argument("--synthetic-sizes", default="100000,400000",
+                        help="Comma-separated sizes, in characters, of synthetic transcripts to add.")
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=5000.0)
+    parser.add_argument("--output-tokens", type=int, default=100)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--max-chunk-tokens", type=int, default=3000)
+    parser.add_argument("--stub-servers", type=int, default=1, help="Stub Ollama servers to route requests over.")
+    parser.add_argument("--hedge-after", type=float, help="Hedge requests with no first token after this many seconds.")
+    parser.add_argument("--max-running", type=int, default=4, help="Ollama requests the scheduler runs at once.")
+    parser.add_argument("--summary-cache", action="store_true", help="Serve repeated inputs from the summary cache.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to save the results.")
+    parser.add_argument("--compare", help="A previous results file to compare against.")
+    args = parser.parse_args(argv)
+
+    previous = None
+    if args.compare:
+        # Read it first: it may be the same file the results are about to be saved to.
+        with open(args.compare, encoding="utf-8") as previous_file:
+            previous = json.load(previous_file)
+
+    inputs = load_inputs([int(size) for size in args.synthetic_sizes.split(",") if size])
+    stub_servers = [
+        StubOllamaServer(
+            first_token_latency=args.first_token_latency,
+            prompt_tokens_per_second=args.prompt_tokens_per_second,
+            tokens_per_second=args.tokens_per_second,
+            output_tokens=args.output_tokens,
+        )
+        for _ in range(max(1, args.stub_servers))
+    ]
+    db = StubDB(latency=args.db_latency)
+    audit_log = AuditLogWriter(db, spill_path="benchmark_spill.jsonl")
+
+    for server in stub_servers:
+        server.start()
+    try:
+        ai_handler = AIHandler(
+            [server.url for server in stub_servers],
+            stub_servers[0].model,
+            max_chunk_tokens=args.max_chunk_tokens,
+            hedge_after=args.hedge_after,
+        )
+        summarizer = Summarizer(
+            ai_handler,
+            TemplateCache(db),
+            audit_log,
+            SummaryCache(max_bytes=64 * 1024 * 1024 if args.summary_cache else 0),
+            SingleFlight("benchmark"),
+            FairScheduler(max_running=args.max_running),
+        )
+        benchmark = Benchmark(summarizer)
+        # One untimed request so encoder loading and connection setup are not measured.
+        benchmark.run_request(inputs[0][1], inputs[0][2])
+
+        levels = []
+        for users in [int(u) for u in args.users.split(",") if u]:
+            level = benchmark.run_level(users, inputs, args.iterations)
+            levels.append(level)
+            print(f"users={users:<3} rps={level['throughput_rps']:<8} p50={level['latency']['p50']}s "
+                  f"p95={level['latency']['p95']}s p99={level['latency']['p99']}s "
+                  f"ttft_p50={level['time_to_first_token']['p50']}s peak_mem={level['peak_memory_mb']}MB "
+                  f"fallbacks={level['fallbacks']} errors={level['errors']}")
+        endpoints = ai_handler.router.stats()
+    finally:
+        for server in stub_servers:
+            server.stop()
+    audit_log.close()
+
+    results = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "inputs": {name: len(data) for name, _, data in inputs},
+        "levels": levels,
+        "endpoints": endpoints,
+        "audit_log_blobs": db.blob_stats(),
+    }
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if previous:
+        compare(previous, results)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,30 @@
+import logging
+
+from ai_handlers import AIHandler
+from audit_log import AuditLogWriter
+from benchmark import Benchmark, load_inputs
+from scheduler import FairScheduler
+from single_flight import SingleFlight
+from stubs import StubDB, StubOllamaServer
+from summarize import Summarizer
+from summary_cache import SummaryCache
+from template_cache import TemplateCache
+
+
+def test_a_level_runs_through_the_summarizer(tmp_path, word_tokens, caplog):
+    with StubOllamaServer(first_token_latency=0.01, tokens_per_second=1000, output_tokens=5) as ollama:
+        db = StubDB(latency=0)
+        audit_log = AuditLogWriter(db, flush_interval=0.1, spill_path=str(tmp_path / "spill.jsonl"))
+        summarizer = Summarizer(AIHandler(ollama.url, ollama.model), TemplateCache(db), audit_log,
+                                SummaryCache(max_bytes=0), SingleFlight("benchmark-test"), FairScheduler(max_running=2))
+        inputs = [item for item in load_inputs([]) if item[1].endswith(".txt")][:2]
+        inputs.append(("broken", "broken.pdf", b"%PDF"))
+
+        with caplog.at_level(logging.ERROR, logger="benchmark"):
+            level = Benchmark(summarizer).run_level(2, inputs, iterations=1)
+        audit_log.close()
+
+    assert (level["requests"], level["errors"], level["fallbacks"], level["cache_hits"]) == (6, 2, 0, 0)
+    assert any("broken" in record.getMessage() and record.exc_info for record in caplog.records)
+    assert {row["event"] for row in db.log_rows} <= {"Meeting Summary", "Meeting Summary (Coalesced)"}
+    assert len(db.log_rows) == 4
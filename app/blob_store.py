@@ -0,0 +1,268 @@
+"""
+Content-addressed, compressed storage for the large texts in INTELLINOTES_LOG.
+
+Transcripts, summaries and custom prompts are stored once in INTELLINOTES_BLOBS, keyed by
+the SHA-256 of their UTF-8 text and zlib-compressed; log rows carry the hashes instead of
+their own CLOBs. The same transcript summarized with three templates, or re-run five times,
+is stored once. sql/001_intellinotes_blobs.sql creates the table and the hash columns.
+
+Rows logged before the migration keep their CLOBs until migrate_log_rows() moves them over;
+DBOracle.fetch_log_entry() reads either kind.
+
+Run as a script to migrate existing rows:
+
+    python blob_store.py --batch-size 200
+"""
+import argparse
+import hashlib
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from metrics import increment
+
+COMPRESSION_LEVEL = 6
+# Committed hashes remembered per process; a hit skips the existence check and the upload.
+KNOWN_HASHES = 10000
+
+# The text columns of INTELLINOTES_LOG and the hash columns that replace them.
+MESSAGE_COLUMNS = {
+    "input_message": "INPUT_HASH",
+    "output_message": "OUTPUT_HASH",
+    "custom_prompt": "CUSTOM_PROMPT_HASH",
+}
+
+# Concurrent writers can both find a hash missing; the loser's MERGE raises ORA-00001, which is
+# harmless because the row it wanted now exists.
+BLOB_MERGE_SQL = """
+    MERGE INTO INTELLINOTES_BLOBS b
+    USING (SELECT :blob_hash AS BLOB_HASH FROM dual) s
+    ON (b.BLOB_HASH = s.BLOB_HASH)
+    WHEN NOT MATCHED THEN INSERT (BLOB_HASH, CONTENT, ORIGINAL_BYTES, STORED_BYTES, CREATED_DATE)
+    VALUES (:blob_hash, :content, :original_bytes, :stored_bytes, SYSDATE)
+"""
+
+BLOB_SELECT_SQL = "SELECT BLOB_HASH, CONTENT FROM INTELLINOTES_BLOBS WHERE BLOB_HASH IN ({binds})"
+BLOB_EXISTS_SQL = "SELECT BLOB_HASH FROM INTELLINOTES_BLOBS WHERE BLOB_HASH IN ({binds})"
+UNIQUE_VIOLATION = 1  # ORA-00001
+
+
+def digest(text):
+    """Returns the content hash of a text: the hex SHA-256 of its UTF-8 encoding."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def compress(text):
+    return zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress(content):
+    """Returns the text of a stored blob; accepts bytes or an oracledb LOB."""
+    if hasattr(content, "read"):
+        content = content.read()
+    return zlib.decompress(content).decode("utf-8")
+
+
+class BlobWriter:
+    """
+    Writes texts into INTELLINOTES_BLOBS at most once each.
+
+    Hashes this process has seen committed are remembered (up to KNOWN_HASHES), so repeated
+    texts cost neither a query nor a transfer. Otherwise the missing hashes of a batch are
+    looked up in one query and only those are compressed and merged. Callers pass the hashes
+    to remember() once their transaction has committed, so a rolled back batch is never
+    taken as stored.
+    """
+
+    def __init__(self, known_hashes=KNOWN_HASHES):
+        self.known_hashes = known_hashes
+        self._known = OrderedDict()
+        self._lock = threading.Lock()
+
+    def store(self, cursor, texts):
+        """
+        Stores texts (None and empty strings are skipped) using cursor, without committing.
+
+        Returns:
+            list: The hash of each text, or None where the text was empty.
+        """
+        hashes = [digest(text) if text else None for text in texts]
+        pending = {}
+        for text, blob_hash in zip(texts, hashes):
+            if blob_hash and blob_hash not in pending and not self._is_known(blob_hash):
+                pending[blob_hash] = text
+        if pending:
+            existing = _existing_hashes(cursor, list(pending))
+            rows = []
+            for blob_hash, text in pending.items():
+                if blob_hash in existing:
+                    continue
+                content = compress(text)
+                original_bytes = len(text.encode("utf-8"))
+                rows.append({
+                    "blob_hash": blob_hash,
+                    "content": content,
+                    "original_bytes": original_bytes,
+                    "stored_bytes": len(content),
+                })
+                increment("blob_store_original_bytes_total", original_bytes)
+                increment("blob_store_stored_bytes_total", len(content))
+            if rows:
+                _merge_blobs(cursor, rows)
+        deduplicated = sum(1 for blob_hash in hashes if blob_hash) - len(pending)
+        if deduplicated:
+            increment("blob_store_deduplicated_total", deduplicated)
+        return hashes
+
+    def _is_known(self, blob_hash):
+        with self._lock:
+            if blob_hash in self._known:
+                self._known.move_to_end(blob_hash)
+                return True
+            return False
+
+    def remember(self, blob_hashes):
+        """Records hashes whose blobs are committed; None entries are ignored."""
+        with self._lock:
+            for blob_hash in filter(None, blob_hashes):
+                self._known[blob_hash] = True
+                self._known.move_to_end(blob_hash)
+            while len(self._known) > self.known_hashes:
+                self._known.popitem(last=False)
+
+
+def _in_binds(values):
+    return ", ".join(f":h{index}" for index in range(len(values))), {f"h{index}": value for index, value in enumerate(values)}
+
+
+def _existing_hashes(cursor, blob_hashes):
+    existing = set()
+    # Oracle allows at most 1000 expressions in an IN list.
+    for start in range(0, len(blob_hashes), 1000):
+        binds, params = _in_binds(blob_hashes[start:start + 1000])
+        cursor.execute(BLOB_EXISTS_SQL.format(binds=binds), params)
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
+
+
+def _merge_blobs(cursor, rows):
+    import oracledb
+
+    cursor.setinputsizes(content=oracledb.DB_TYPE_BLOB)
+    cursor.executemany(BLOB_MERGE_SQL, rows, batcherrors=True)
+    for error in cursor.getbatcherrors():
+        if error.code != UNIQUE_VIOLATION:
+            raise oracledb.DatabaseError(error)
+
+
+def read_blobs(cursor, blob_hashes):
+    """Returns {hash: text} for the given hashes that exist; None entries are ignored."""
+    blob_hashes = list(dict.fromkeys(blob_hash for blob_hash in blob_hashes if blob_hash))
+    texts = {}
+    for start in range(0, len(blob_hashes), 1000):
+        binds, params = _in_binds(blob_hashes[start:start + 1000])
+        cursor.execute(BLOB_SELECT_SQL.format(binds=binds), params)
+        for blob_hash, content in cursor.fetchall():
+            texts[blob_hash] = decompress(content)
+    return texts
+
+
+# Only rows with some non-empty text: a row whose CLOBs are all empty gets no hash, so it
+# would match again and again.
+MIGRATE_SELECT_SQL = """
+    SELECT LOGID, INPUT_MESSAGE, OUTPUT_MESSAGE, CUSTOM_PROMPT
+    FROM INTELLINOTES_LOG
+    WHERE INPUT_HASH IS NULL AND OUTPUT_HASH IS NULL AND CUSTOM_PROMPT_HASH IS NULL
+      AND (DBMS_LOB.GETLENGTH(INPUT_MESSAGE) > 0 OR DBMS_LOB.GETLENGTH(OUTPUT_MESSAGE) > 0
+           OR DBMS_LOB.GETLENGTH(CUSTOM_PROMPT) > 0)
+      AND ROWNUM <= :batch_size
+"""
+
+MIGRATE_UPDATE_SQL = """
+    UPDATE INTELLINOTES_LOG
+    SET INPUT_HASH = :input_hash, OUTPUT_HASH = :output_hash, CUSTOM_PROMPT_HASH = :custom_prompt_hash,
+        INPUT_MESSAGE = CASE WHEN :clear = 1 THEN NULL ELSE INPUT_MESSAGE END,
+        OUTPUT_MESSAGE = CASE WHEN :clear = 1 THEN NULL ELSE OUTPUT_MESSAGE END,
+        CUSTOM_PROMPT = CASE WHEN :clear = 1 THEN NULL ELSE CUSTOM_PROMPT END
+    WHERE LOGID = :logid
+"""
+
+
+def migrate_log_rows(db, batch_size=200, clear_clobs=True, max_batches=None):
+    """
+    Moves the CLOBs of rows logged before the blob store into it, one committed batch at a time.
+
+    Safe to stop and re-run: each batch picks up rows that have no hashes yet.
+
+    Args:
+        db (DBOracle): The database to migrate.
+        batch_size (int): Rows per transaction.
+        clear_clobs (bool): Null the old CLOB columns once a row references its blobs. Leave
+            them in place (False) to verify the migration before reclaiming the space.
+        max_batches (int): Stop after this many batches; None migrates every row.
+
+    Returns:
+        int: The number of rows migrated.
+
+    Raises:
+        ConnectionError: If no database connection could be acquired.
+    """
+    logger = logging.getLogger(__name__)
+    writer = BlobWriter()
+    migrated = batches = 0
+    while max_batches is None or batches < max_batches:
+        connection = db.get_connection()
+        if not connection:
+            logger.error("Failed to migrate log rows: Database connection error.")
+            raise ConnectionError("Database connection error.")
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(MIGRATE_SELECT_SQL, {"batch_size": batch_size})
+                rows = [
+                    (logid, *(value.read() if hasattr(value, "read") else value for value in values))
+                    for logid, *values in cursor.fetchall()
+                ]
+                if not rows:
+                    break
+                texts = [text for row in rows for text in row[1:]]
+                hashes = writer.store(cursor, texts)
+                updates = []
+                for index, (logid, *_) in enumerate(rows):
+                    input_hash, output_hash, custom_prompt_hash = hashes[index * 3:index * 3 + 3]
+                    updates.append({
+                        "logid": logid, "input_hash": input_hash, "output_hash": output_hash,
+                        "custom_prompt_hash": custom_prompt_hash, "clear": int(clear_clobs),
+                    })
+                cursor.executemany(MIGRATE_UPDATE_SQL, updates)
+                connection.commit()
+                writer.remember(hashes)
+        finally:
+            connection.close()
+        migrated += len(rows)
+        batches += 1
+        logger.info(f"Migrated {migrated} log rows to the blob store.")
+        if len(rows) < batch_size:
+            break
+    return migrated
+
+
+def main():
+    from dotenv import load_dotenv
+    from utils import DBOracle
+
+    parser = argparse.ArgumentParser(description="Move INTELLINOTES_LOG CLOBs into the content-addressed blob store.")
+    parser.add_argument("--batch-size", type=int, default=200, help="Rows per transaction.")
+    parser.add_argument("--max-batches", type=int, help="Stop after this many batches.")
+    parser.add_argument("--keep-clobs", action="store_true", help="Leave the old CLOB columns populated.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = DBOracle(os.getenv("DB_USER"), os.getenv("DB_PASSWORD"), os.getenv("DB_DSN", "UATGVPDB.ITRANS.INT/GVPUAT2"))
+    migrated = migrate_log_rows(db, args.batch_size, clear_clobs=not args.keep_clobs, max_batches=args.max_batches)
+    print(f"Migrated {migrated} rows.")
+
+
+if __name__ == "__main__":
+    main()
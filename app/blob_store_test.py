@@ -0,0 +1,158 @@
+import pytest
+
+import blob_store
+from blob_store import BlobWriter, compress, decompress, digest, migrate_log_rows, read_blobs
+
+
+class _FakeDB:
+    """INTELLINOTES_BLOBS and the text columns of INTELLINOTES_LOG, in memory."""
+
+    def __init__(self, log_rows=()):
+        self.blobs = {}
+        # LOGID: {"INPUT_MESSAGE": ..., "INPUT_HASH": ..., ...}
+        self.log = {logid: dict(row) for logid, row in log_rows}
+        self.commits = 0
+
+    def get_connection(self):
+        return _Connection(self)
+
+
+class _Connection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return _Cursor(self.db)
+
+    def commit(self):
+        self.db.commits += 1
+
+    def close(self):
+        pass
+
+
+class _Cursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        db = self.db
+        if sql.startswith(blob_store.BLOB_EXISTS_SQL.split("{")[0]):
+            self.rows = [(blob_hash,) for blob_hash in params.values() if blob_hash in db.blobs]
+        elif sql.startswith(blob_store.BLOB_SELECT_SQL.split("{")[0]):
+            self.rows = [(blob_hash, db.blobs[blob_hash]) for blob_hash in params.values() if blob_hash in db.blobs]
+        elif sql is blob_store.MIGRATE_SELECT_SQL:
+            pending = [
+                (logid, row["INPUT_MESSAGE"], row["OUTPUT_MESSAGE"], row["CUSTOM_PROMPT"])
+                for logid, row in sorted(db.log.items())
+                if not any(row.get(column) for column in blob_store.MESSAGE_COLUMNS.values())
+                and any(row[column] for column in ("INPUT_MESSAGE", "OUTPUT_MESSAGE", "CUSTOM_PROMPT"))
+            ]
+            self.rows = pending[:params["batch_size"]]
+        else:
+            raise AssertionError(f"Unexpected statement: {sql}")
+
+    def setinputsizes(self, **sizes):
+        pass
+
+    def executemany(self, sql, rows, batcherrors=False):
+        self.statements.append(sql)
+        for row in rows:
+            if sql is blob_store.BLOB_MERGE_SQL:
+                self.db.blobs.setdefault(row["blob_hash"], row["content"])
+            elif sql is blob_store.MIGRATE_UPDATE_SQL:
+                log_row = self.db.log[row["logid"]]
+                for field, column in blob_store.MESSAGE_COLUMNS.items():
+                    log_row[column] = row[field.replace("_message", "") + "_hash"]
+                if row["clear"]:
+                    log_row.update(INPUT_MESSAGE=None, OUTPUT_MESSAGE=None, CUSTOM_PROMPT=None)
+
+    def getbatcherrors(self):
+        return []
+
+    def fetchall(self):
+        return list(self.rows)
+
+
+def _row(input_message, output_message=None, custom_prompt=None):
+    return {"INPUT_MESSAGE": input_message, "OUTPUT_MESSAGE": output_message, "CUSTOM_PROMPT": custom_prompt}
+
+
+def test_blobs_round_trip_compressed():
+    text = "Alice: We ship on Friday. " * 100
+    assert digest(text) == digest(text) and len(digest(text)) == 64
+    assert len(compress(text)) < len(text) and decompress(compress(text)) == text
+
+
+def test_each_text_is_stored_once():
+    db = _FakeDB()
+    writer = BlobWriter()
+    cursor = db.get_connection().cursor()
+    hashes = writer.store(cursor, ["transcript", "summary", "transcript", None, ""])
+    assert hashes == [digest("transcript"), digest("summary"), digest("transcript"), None, None]
+    assert sorted(db.blobs) == sorted({digest("transcript"), digest("summary")})
+
+    # Already in the table: looked up, not uploaded again.
+    cursor = db.get_connection().cursor()
+    writer.store(cursor, ["transcript", "other summary"])
+    assert cursor.statements.count(blob_store.BLOB_MERGE_SQL) == 1 and len(db.blobs) == 3
+
+    # Remembered after commit: not even looked up.
+    writer.remember(hashes)
+    cursor = db.get_connection().cursor()
+    writer.store(cursor, ["transcript", "summary"])
+    assert cursor.statements == []
+
+
+def test_known_hashes_are_bounded():
+    writer = BlobWriter(known_hashes=2)
+    writer.remember([digest("a"), digest("b"), digest("c")])
+    assert not writer._is_known(digest("a")) and writer._is_known(digest("c"))
+
+
+def test_read_blobs_skips_missing_and_empty_hashes():
+    db = _FakeDB()
+    cursor = db.get_connection().cursor()
+    hashes = BlobWriter().store(cursor, ["transcript", "summary"])
+    texts = read_blobs(cursor, hashes + [None, digest("never stored"), hashes[0]])
+    assert texts == {hashes[0]: "transcript", hashes[1]: "summary"}
+
+
+def test_migration_moves_clobs_into_blobs_in_batches():
+    db = _FakeDB([
+        (1, _row("transcript", "summary one")),
+        (2, _row("transcript", "summary two", "custom prompt")),
+        (3, _row("other transcript", "summary one")),
+        # Nothing to move: never selected, so the loop still ends.
+        (4, _row(None)),
+    ])
+    assert migrate_log_rows(db, batch_size=2) == 3
+    assert db.commits == 2
+    assert db.log[2]["INPUT_HASH"] == db.log[1]["INPUT_HASH"] == digest("transcript")
+    assert db.log[2]["CUSTOM_PROMPT_HASH"] == digest("custom prompt") and db.log[1]["CUSTOM_PROMPT_HASH"] is None
+    assert db.log[1]["INPUT_MESSAGE"] is None
+    assert len(db.blobs) == 5
+    assert migrate_log_rows(db) == 0
+
+
+def test_migration_can_keep_the_clobs_and_stop_early():
+    db = _FakeDB([(logid, _row(f"transcript {logid}")) for logid in range(1, 6)])
+    assert migrate_log_rows(db, batch_size=2, clear_clobs=False, max_batches=1) == 2
+    assert db.log[1]["INPUT_MESSAGE"] == "transcript 1" and db.log[1]["INPUT_HASH"] == digest("transcript 1")
+    assert "INPUT_HASH" not in db.log[3]
+
+
+def test_migration_without_a_database_connection_raises():
+    db = _FakeDB()
+    db.get_connection = lambda: None
+    with pytest.raises(ConnectionError):
+        migrate_log_rows(db)
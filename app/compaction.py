@@ -0,0 +1,288 @@
+"""
+Transcript compaction before the LLM call.
+
+Teams/Zoom exports repeat the speaker and a timestamp for every caption line, and carry
+fillers, backchannel lines and meeting-tool chatter that cost prompt-eval time without
+adding content. TranscriptCompactor rewrites a transcript line by line into
+"Speaker: text" turns, in a single pass with O(1) state per line, so it can run over
+multi-megabyte transcripts or be fed from a stream.
+"""
+import logging
+import re
+from collections import deque
+
+from token_accounting import count_tokens
+
+# Teams leaves out zero parts: "15 minutes", "1 hour 2 seconds"; at least one part is required.
+_DURATION = (
+    r"(?:\d+ hours?(?: \d+ minutes?)?(?: \d+ seconds?)?|\d+ minutes?(?: \d+ seconds?)?|\d+ seconds?)"
+)
+_CLOCK = r"\d{1,2}:\d{2}(?::\d{2})?"
+
+# "0 minutes 4 seconds0:04", "16 minutes 1 second16:01", "15 minutes15:00", "0:14", "1:02:03"
+TIMESTAMP_LINE = re.compile(rf"^(?:{_DURATION}\s*)?{_CLOCK}$|^{_DURATION}$")
+# "Raube, Chad 0 minutes 4 seconds", "Raube, Chad 15 minutes" (Teams) or "Kenny, Mike   0:14" (Teams web / Zoom)
+SPEAKER_TIME_LINE = re.compile(rf"^(?P<speaker>[^.?!:]{{1,60}}?)(?:\s+{_DURATION}|\s{{2,}}{_CLOCK})$")
+# "Alice Smith: text", in transcripts already written as labelled turns.
+LABELLED_LINE = re.compile(r"^(?P<speaker>[A-Z][\w'.-]*(?:,? [A-Z][\w'.-]*){0,3}):\s+(?P<text>\S.*)$")
+# A speaker stamp that ends in seconds or a clock time, as Teams writes all but exact minutes.
+SECONDS_STAMP = re.compile(r"(?:\bseconds?|\d)$")
+# Export headers such as "Transcript" and "September 25, 2024, 6:59PM"
+HEADER_LINE = re.compile(r"^(?:Transcript|WEBVTT|[A-Z][a-z]+ \d{1,2}, \d{4},? \d{1,2}:\d{2}\s*[AP]M)$")
+# Avatar initials ("KC") that Teams puts between turns
+INITIALS_LINE = re.compile(r"^[A-Z]{1,3}$")
+# The line boundaries str.splitlines() recognizes.
+LINE_BREAK = re.compile("\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+
+DEFAULT_CUES = (
+    r"\bstarted transcription\b",
+    r"\bstopped transcription\b",
+    r"\byou(?:'re| are) (?:on )?mute[d]?\b",
+    r"\bcan you (?:all )?(?:hear|see) (?:me|my screen)\b",
+    r"\bcan everyone (?:hear|see) (?:me|my screen)\b",
+    r"\b(?:is|are) my (?:screen|audio) (?:showing|working|coming through)\b",
+)
+DEFAULT_FILLERS = ("um", "umm", "uh", "uhh", "erm", "hmm", "mm-hmm", "uh-huh")
+# Only removed when set off by a comma ("so, you know, the rates"), since "do you know" is content.
+DEFAULT_FILLER_PHRASES = ("you know", "I mean", "kind of like", "sort of like")
+DEFAULT_BACKCHANNEL = (
+    "yeah", "yes", "yep", "ok", "okay", "right", "sure", "mhm", "alright", "all right", "got it",
+    "thank you", "thanks",
+)
+
+
+class CompactionStats:
+    """Line, character and token counts before and after compaction."""
+
+    def __init__(self):
+        self.lines_in = 0
+        self.lines_out = 0
+        self.chars_in = 0
+        self.chars_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.speakers = {}
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_in - self.tokens_out
+
+    @property
+    def saved_ratio(self):
+        return round(self.tokens_saved / self.tokens_in, 3) if self.tokens_in else 0.0
+
+    def describe(self):
+        return (
+            f"lines {self.lines_in}->{self.lines_out}, tokens {self.tokens_in}->{self.tokens_out} "
+            f"({self.tokens_saved} saved, {100 * self.saved_ratio:.1f}%)"
+        )
+
+
+class TranscriptCompactor:
+    """
+    Streaming transcript normalizer.
+
+    Args:
+        merge_turns (bool): Merge consecutive lines by the same speaker into one turn.
+        strip_timestamps (bool): Drop timestamp, header and avatar-initials lines.
+        drop_cues (bool): Drop meeting-tool chatter ("you're muted", "can you see my screen").
+        drop_fillers (bool): Remove filler words, and drop lines that are only backchannel ("Yeah.",
+            "OK.") within a speaker's own turn. Backchannel that answers a question or comes from
+            another speaker is kept, since "Yes." may be the answer.
+        dedupe_window (int): Drop a line that normalizes to one of the speaker's last this many
+            lines; 0 disables.
+        alias_speakers (bool): Replace "Last, First" speaker names with a short alias.
+        max_turn_chars (int): Start a new line for the same speaker past this length, so long
+            monologues can still be chunked at line boundaries.
+        count_tokens (bool): Measure tokens before and after with the log_tokens encoder.
+        cues, fillers, filler_phrases, backchannel: Override the default pattern and word lists.
+    """
+
+    def __init__(self, merge_turns=True, strip_timestamps=True, drop_cues=True, drop_fillers=True,
+                 dedupe_window=8, alias_speakers=True, max_turn_chars=2000, count_tokens=True, cues=DEFAULT_CUES,
+                 fillers=DEFAULT_FILLERS, filler_phrases=DEFAULT_FILLER_PHRASES, backchannel=DEFAULT_BACKCHANNEL):
+        self.merge_turns = merge_turns
+        self.strip_timestamps = strip_timestamps
+        self.drop_cues = drop_cues
+        self.drop_fillers = drop_fillers
+        self.dedupe_window = dedupe_window
+        self.alias_speakers = alias_speakers
+        self.max_turn_chars = max_turn_chars
+        self.count_tokens = count_tokens
+        self.cue_pattern = re.compile("|".join(cues), re.IGNORECASE) if cues else None
+        self.filler_pattern = re.compile(
+            r"(?:^|(?<=[\s,]))(?:" + "|".join(re.escape(f) for f in fillers) + r")(?:[,.]+)?(?=\s|$)",
+            re.IGNORECASE,
+        ) if fillers else None
+        self.filler_phrase_pattern = re.compile(
+            r"(?:^|(?<=[\s,]))(?:" + "|".join(re.escape(f) for f in filler_phrases) + r"),\s*",
+            re.IGNORECASE,
+        ) if filler_phrases else None
+        self.backchannel = {word.lower() for word in backchannel}
+        self.logger = logging.getLogger(__name__)
+        self.stats = CompactionStats()
+
+    def compact(self, text):
+        """Compacts a whole transcript and returns the compacted text."""
+        return "\n".join(self.compact_lines(iter_lines(text)))
+
+    def compact_lines(self, lines):
+        """
+        Compacts an iterable of transcript lines, yielding "Speaker: text" turns.
+
+        Lines are consumed lazily with one line of lookahead, so any line iterator (for example
+        an open file) can be passed in. Statistics accumulate in self.stats.
+        """
+        self.stats = CompactionStats()
+        aliases, used_aliases, speakers = {}, set(), set()
+        recent, recent_set = deque(), set()
+        # speaker is who is talking now; turn holds text not yet emitted, spoken by turn_speaker.
+        speaker, turn_speaker, turn, turn_chars = None, None, [], 0
+
+        def flush():
+            label = aliases.get(turn_speaker, turn_speaker) if turn_speaker else None
+            return self._emit(f"{label}: {' '.join(turn)}" if label else " ".join(turn))
+
+        pending = None
+        for raw_line in _with_sentinel(lines):
+            if raw_line is not None:
+                self.stats.lines_in += 1
+                self.stats.chars_in += len(raw_line) + 1
+                if self.count_tokens:
+                    self.stats.tokens_in += count_tokens(raw_line + "\n")
+            line = raw_line.strip() if raw_line is not None else None
+            current, pending = pending, line
+            if current is None or not current:
+                continue
+
+            if self.strip_timestamps and (
+                TIMESTAMP_LINE.match(current) or HEADER_LINE.match(current) or INITIALS_LINE.match(current)
+            ):
+                continue
+
+            # A bare speaker name, recognised by the timestamp line that follows it.
+            new_speaker = None
+            match = SPEAKER_TIME_LINE.match(current)
+            if match and len(match.group("speaker").split()) <= 4 and (
+                # "Let's take 10 minutes" is speech; a stamp without seconds needs a speaker already seen.
+                SECONDS_STAMP.search(current) or match.group("speaker").strip() in speakers
+            ):
+                new_speaker = match.group("speaker").strip()
+            elif pending is not None and TIMESTAMP_LINE.match(pending) and len(current) <= 60:
+                new_speaker = current
+            if new_speaker:
+                speaker = new_speaker
+                speakers.add(speaker)
+                self._add_alias(speaker, aliases, used_aliases)
+                continue
+
+            # Without speaker stamps, a "Name: text" line names its own speaker, so turns by
+            # different people are not merged into one.
+            labelled = LABELLED_LINE.match(current) if not speakers else None
+            if labelled:
+                speaker, current = labelled.group("speaker"), labelled.group("text")
+                self._add_alias(speaker, aliases, used_aliases)
+
+            text = self._clean(current)
+            if not text:
+                continue
+            if self._is_backchannel(text):
+                if not turn or (speaker == turn_speaker and not turn[-1].endswith("?")):
+                    continue
+            elif self.dedupe_window:
+                # Only a speaker's own repeats are dropped; another speaker saying the same is content.
+                key = (speaker, re.sub(r"[^a-z0-9]+", "", text.lower()))
+                if key in recent_set:
+                    continue
+                recent.append(key)
+                recent_set.add(key)
+                if len(recent) > self.dedupe_window:
+                    recent_set.discard(recent.popleft())
+
+            # A speaker change only ends the turn once the new speaker says something that is kept.
+            if turn and (speaker != turn_speaker or not self.merge_turns or turn_chars >= self.max_turn_chars):
+                yield flush()
+                turn, turn_chars = [], 0
+            turn_speaker = speaker
+            turn.append(text)
+            turn_chars += len(text) + 1
+
+        if turn:
+            yield flush()
+        self.logger.info(f"Transcript compaction: {self.stats.describe()}")
+
+    def _add_alias(self, speaker, aliases, used_aliases):
+        if self.alias_speakers and speaker not in aliases:
+            aliases[speaker] = _alias(speaker, used_aliases)
+            self.stats.speakers[speaker] = aliases[speaker]
+
+    def _clean(self, line):
+        """Applies the cue and filler rules to one line of speech; returns "" to drop it."""
+        if self.drop_cues and self.cue_pattern and self.cue_pattern.search(line):
+            return ""
+        if self.drop_fillers:
+            if self.filler_pattern:
+                line = self.filler_pattern.sub("", line)
+            if self.filler_phrase_pattern:
+                line = self.filler_phrase_pattern.sub("", line)
+            line = re.sub(r"\s{2,}", " ", line).strip(" ,")
+            if not re.search(r"\w", line):
+                return ""
+            if line[0].islower():
+                line = line[0].upper() + line[1:]
+        return line
+
+    def _is_backchannel(self, line):
+        if not self.drop_fillers:
+            return False
+        bare = re.sub(r"[^\w\s'-]+", " ", line).lower().split()
+        return " ".join(bare) in self.backchannel or all(word in self.backchannel for word in bare)
+
+    def _emit(self, line):
+        self.stats.lines_out += 1
+        self.stats.chars_out += len(line) + 1
+        if self.count_tokens:
+            self.stats.tokens_out += count_tokens(line + "\n")
+        return line
+
+
+def iter_lines(text):
+    """Yields the lines of text as str.splitlines() would, without building the list of them."""
+    start = 0
+    for match in LINE_BREAK.finditer(text):
+        yield text[start:match.start()]
+        start = match.end()
+    if start < len(text):
+        yield text[start:]
+
+
+def _with_sentinel(lines):
+    """Yields the lines followed by one None, so the last line gets processed with empty lookahead."""
+    yield from lines
+    yield None
+
+
+def _alias(speaker, used_aliases):
+    """Maps "Last, First" or "First Last" to the first name, adding initials when that is taken."""
+    if "," in speaker:
+        last, first = (part.strip() for part in speaker.split(",", 1))
+    else:
+        parts = speaker.split()
+        first, last = parts[0], " ".join(parts[1:])
+    candidates = [first, f"{first} {last[:1]}".strip(), speaker]
+    for candidate in candidates:
+        if candidate and candidate not in used_aliases:
+            used_aliases.add(candidate)
+            return candidate
+    return speaker
+
+
+def compact_transcript(text, **options):
+    """
+    Compacts a transcript with the given TranscriptCompactor options.
+
+    Returns:
+        tuple: The compacted text and its CompactionStats.
+    """
+    compactor = TranscriptCompactor(**options)
+    return compactor.compact(text), compactor.stats
@@ -0,0 +1,97 @@
+from compaction import compact_transcript
+
+
+def _teams(*turns):
+    """A Teams export: speaker and duration, then the caption line."""
+    return "\n".join(f"{speaker} 0 minutes {second} seconds\n{text}" for second, (speaker, text) in enumerate(turns))
+
+
+def _compact(text):
+    return compact_transcript(text, count_tokens=False)[0].split("\n")
+
+
+def test_an_answer_to_a_question_is_kept():
+    transcript = _teams(("Kenny, Mike", "Did we agree to ship Friday?"), ("Raube, Chad", "Yes."))
+    assert _compact(transcript) == ["Mike: Did we agree to ship Friday?", "Chad: Yes."]
+
+
+def test_backchannel_from_another_speaker_is_kept():
+    transcript = _teams(("Kenny, Mike", "We'll move the launch to Wednesday."), ("Raube, Chad", "Okay."))
+    assert _compact(transcript) == ["Mike: We'll move the launch to Wednesday.", "Chad: Okay."]
+
+
+def test_backchannel_within_a_speakers_own_turn_is_dropped():
+    transcript = _teams(
+        ("Kenny, Mike", "The rates went up in March."),
+        ("Kenny, Mike", "Yeah."),
+        ("Kenny, Mike", "So we renegotiated."),
+    )
+    assert _compact(transcript) == ["Mike: The rates went up in March. So we renegotiated."]
+
+
+def test_unlabelled_answers_after_questions_are_kept():
+    assert _compact("Did we agree to ship Friday?\nYes.\nOkay.") == ["Did we agree to ship Friday? Yes."]
+
+
+def test_only_a_speakers_own_repeats_are_deduplicated():
+    transcript = _teams(
+        ("Kenny, Mike", "Let's go with option B."),
+        ("Kenny, Mike", "Let's go with option B."),
+        ("Raube, Chad", "Let's go with option B."),
+    )
+    assert _compact(transcript) == ["Mike: Let's go with option B.", "Chad: Let's go with option B."]
+
+
+def test_repeated_answers_to_different_questions_are_kept():
+    transcript = _teams(
+        ("Kenny, Mike", "Is the report done?"),
+        ("Raube, Chad", "Yes."),
+        ("Kenny, Mike", "And sent to finance?"),
+        ("Raube, Chad", "Yes."),
+    )
+    assert _compact(transcript) == [
+        "Mike: Is the report done?", "Chad: Yes.", "Mike: And sent to finance?", "Chad: Yes.",
+    ]
+
+
+def test_teams_stamps_on_an_exact_minute_start_a_turn():
+    # From assets/DS_meeting_transcript.txt, where Chandra speaks at exactly 15:00.
+    transcript = "\n".join([
+        "Talat, Sheikh 14 minutes 59 seconds",
+        "And so they just gave me this curator role, which is I had this ability to create like.",
+        "KC",
+        "Kommineni, Chandra",
+        "15 minutes15:00",
+        "Kommineni, Chandra 15 minutes",
+        "OK.",
+        "Kommineni, Chandra 15 minutes 7 seconds",
+        "Later.",
+    ])
+    assert _compact(transcript) == [
+        "Sheikh: And so they just gave me this curator role, which is I had this ability to create like.",
+        "Chandra: OK. Later.",
+    ]
+
+
+def test_teams_stamps_on_an_exact_hour_start_a_turn():
+    transcript = "\n".join([
+        "Talat, Sheikh 59 minutes 58 seconds",
+        "Shall we wrap up?",
+        "Kommineni, Chandra",
+        "1 hour1:00:00",
+        "Kommineni, Chandra 1 hour",
+        "Yes.",
+        "Kommineni, Chandra 1 hour 3 seconds",
+        "I'll push the code today.",
+    ])
+    assert _compact(transcript) == ["Sheikh: Shall we wrap up?", "Chandra: Yes. I'll push the code today."]
+
+
+def test_speech_ending_in_a_duration_is_not_a_speaker_line():
+    transcript = _teams(("Kenny, Mike", "Let's take 10 minutes"), ("Kenny, Mike", "Then we'll regroup."))
+    assert _compact(transcript) == ["Mike: Let's take 10 minutes Then we'll regroup."]
+
+
+def test_labelled_turns_without_stamps_keep_their_speakers():
+    transcript = "Alice Smith: We ship Friday.\nThe notes are ready.\nBob: Okay.\nBob: I'll test it tomorrow."
+    assert _compact(transcript) == ["Alice: We ship Friday. The notes are ready.", "Bob: Okay. I'll test it tomorrow."]
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules import each other by their top-level names, as Streamlit runs them.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class _WordEncoding:
+    """Counts one token per whitespace-separated word."""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+    def encode_ordinary_batch(self, texts, num_threads=8):
+        return [text.split() for text in texts]
+
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    """Counts tokens by words, so tests do not download tiktoken's encoding."""
+    import token_accounting
+    import utils
+
+    for module in (token_accounting, utils):
+        monkeypatch.setattr(module, "get_encoding", lambda encoding_name="cl100k_base": _WordEncoding())
@@ -0,0 +1,231 @@
+"""
+Extractive summaries on the CPU, for when an LLM is too slow or unavailable.
+
+The transcript is compacted into "Speaker: text" turns and cut into sentences. Sentences are
+ranked with TextRank: PageRank over a graph whose edges are the cosine similarities of the
+sentences' TF-IDF vectors. The similarity matrix is never built; the TF-IDF matrix X is
+kept as sparse (row, column, value) arrays, and each power iteration multiplies by
+X X^T with two np.bincount calls, so a ranking costs O(non-zeros) per iteration.
+
+Sentences that state a decision or an action item get their rank boosted, and more so when
+the template asks for decisions or action items, or for other words the sentence uses. The
+best sentences are returned in transcript order as key points, followed by the decisions
+and action items found among the highest-ranked sentences.
+"""
+import logging
+import re
+import time
+
+import numpy as np
+
+from compaction import compact_transcript
+from retrieval import tokenize
+
+# PageRank damping and convergence.
+DAMPING = 0.85
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-6
+# Sentences with fewer content words are not candidates ("Right.", "Thanks, everyone.").
+MIN_CONTENT_WORDS = 4
+# Sentences more similar than this to one already chosen are skipped as repeats.
+MAX_OVERLAP = 0.5
+# Rank multiplier for a sentence in a category, and again when the template asks for it.
+CUE_BOOST = 1.5
+TEMPLATE_BOOST = 1.5
+# Rank multiplier per template term the sentence contains, capped at MAX_TERM_BOOST.
+TERM_BOOST = 0.15
+MAX_TERM_BOOST = 1.6
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+TURN = re.compile(r"^([^:\n]{1,60}):\s+(.*)$")
+
+# Category: (words in a template that ask for it, cues in a sentence that belong to it).
+CATEGORIES = {
+    "Decisions": (
+        set(tokenize("decision decide decided agree agreed agreement approve approved conclusion outcome resolved")),
+        re.compile(
+            r"\b(?:decided|decision|agreed|agree that|approved|we(?:'ll| will) go with|going (?:to go )?with"
+            r"|settled on|final(?:ly|ized)?|confirmed|sign(?:ed)? off)\b",
+            re.IGNORECASE,
+        ),
+    ),
+    "Action Items": (
+        set(tokenize("action actions task tasks todo next steps follow owner owners assigned deadline deliverables")),
+        re.compile(
+            r"\b(?:action item|follow[- ]up|next step|to-?do|(?:I|we|you|he|she|they)(?:'ll| will) "
+            r"(?:send|share|set up|schedule|reach out|look into|check|update|prepare|create|review|get)"
+            r"|need(?:s)? to|by (?:monday|tuesday|wednesday|thursday|friday|tomorrow|next week|end of)"
+            r"|deadline|assign(?:ed)? to|take care of)\b",
+            re.IGNORECASE,
+        ),
+    ),
+}
+
+
+class ExtractiveSummary:
+    """An extractive summary and the sentences it was built from."""
+
+    def __init__(self, text, key_points, sections, sentences, seconds):
+        self.text = text
+        self.key_points = key_points
+        self.sections = sections
+        self.sentences = sentences
+        self.seconds = seconds
+
+    def describe(self):
+        picked = len(self.key_points) + sum(len(items) for items in self.sections.values())
+        return f"{picked} of {self.sentences} sentences in {self.seconds:.2f}s"
+
+
+def split_sentences(transcript):
+    """Returns (speaker, sentence) pairs from the compacted transcript, in order."""
+    compacted, _ = compact_transcript(transcript)
+    sentences = []
+    for line in compacted.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        match = TURN.match(line)
+        speaker, text = (match.group(1).strip(), match.group(2)) if match else (None, line)
+        sentences.extend((speaker, sentence.strip()) for sentence in SENTENCE_END.split(text) if sentence.strip())
+    return sentences
+
+
+class _TfidfMatrix:
+    """Row-normalized TF-IDF vectors of the sentences, as sparse coordinate arrays."""
+
+    def __init__(self, sentence_terms):
+        vocabulary = {}
+        rows, columns = [], []
+        for row, terms in enumerate(sentence_terms):
+            for term in terms:
+                columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            rows.extend([row] * len(terms))
+        self.shape = (len(sentence_terms), len(vocabulary))
+        size = max(self.shape[1], 1)
+        codes, counts = np.unique(np.array(rows, dtype=np.int64) * size + np.array(columns, dtype=np.int64),
+                                  return_counts=True)
+        self.rows, self.columns = codes // size, codes % size
+        document_frequencies = np.bincount(self.columns, minlength=self.shape[1])
+        idf = np.log((1 + self.shape[0]) / (1 + document_frequencies)) + 1
+        values = (1 + np.log(counts)) * idf[self.columns]
+        norms = np.sqrt(np.bincount(self.rows, weights=values * values, minlength=self.shape[0]))
+        self.values = values / np.where(norms > 0, norms, 1)[self.rows]
+
+    def times(self, vector):
+        """X v, for v over terms."""
+        return np.bincount(self.rows, weights=self.values * vector[self.columns], minlength=self.shape[0])
+
+    def transpose_times(self, vector):
+        """X^T v, for v over sentences."""
+        return np.bincount(self.columns, weights=self.values * vector[self.rows], minlength=self.shape[1])
+
+    def similarities(self, vector):
+        """(X X^T - I) v: the similarity graph times v, without self-loops."""
+        return self.times(self.transpose_times(vector)) - vector
+
+    def row(self, index, start_of_row):
+        start, end = start_of_row[index], start_of_row[index + 1]
+        return dict(zip(self.columns[start:end].tolist(), self.values[start:end].tolist()))
+
+
+def textrank(matrix):
+    """PageRank scores over the cosine similarity graph of the matrix's rows."""
+    count = matrix.shape[0]
+    if count == 0:
+        return np.zeros(0)
+    degrees = matrix.similarities(np.ones(count))
+    connected = degrees > 1e-12
+    scores = np.full(count, 1.0 / count)
+    for _ in range(MAX_ITERATIONS):
+        weighted = np.where(connected, scores / np.where(connected, degrees, 1), 0)
+        # Rank held by sentences with no edges is spread evenly, as with the damping term.
+        dangling = scores[~connected].sum()
+        updated = (1 - DAMPING + DAMPING * dangling) / count + DAMPING * matrix.similarities(weighted)
+        if np.abs(updated - scores).sum() < TOLERANCE:
+            return updated
+        scores = updated
+    return scores
+
+
+def summarize(transcript, prompt="", max_sentences=None, max_section_items=8):
+    """
+    Builds an extractive summary of a transcript.
+
+    Args:
+        transcript (str): The transcript, raw or compacted.
+        prompt (str): The template's prompt; its wording steers which sentences are boosted.
+        max_sentences (int): Key points to return; by default about one in ten sentences, 5 to 15.
+        max_section_items (int): Decisions and action items to return at most, each.
+
+    Returns:
+        ExtractiveSummary: The summary; its text is empty if the transcript had no sentences.
+    """
+    start_time = time.perf_counter()
+    all_sentences = split_sentences(transcript)
+    terms = [tokenize(sentence) for _, sentence in all_sentences]
+    candidates = [index for index, words in enumerate(terms) if len(words) >= MIN_CONTENT_WORDS]
+    sentences = [all_sentences[index] for index in candidates]
+    matrix = _TfidfMatrix([terms[index] for index in candidates])
+    scores = textrank(matrix)
+
+    prompt_terms = set(tokenize(prompt or ""))
+    requested = {name for name, (triggers, _) in CATEGORIES.items() if prompt_terms & triggers}
+    categories = [set() for _ in sentences]
+    boosts = np.ones(len(sentences))
+    for index, (_, sentence) in enumerate(sentences):
+        for name, (_, cues) in CATEGORIES.items():
+            if cues.search(sentence):
+                categories[index].add(name)
+                boosts[index] *= CUE_BOOST * (TEMPLATE_BOOST if name in requested else 1)
+        if prompt_terms:
+            matched = len(prompt_terms.intersection(terms[candidates[index]]))
+            boosts[index] *= min(MAX_TERM_BOOST, 1 + TERM_BOOST * matched)
+    ranked = np.argsort(-(scores * boosts), kind="stable")
+
+    if max_sentences is None:
+        max_sentences = min(15, max(5, round(len(sentences) / 10)))
+    start_of_row = np.searchsorted(matrix.rows, np.arange(len(sentences) + 1))
+    chosen_rows = []
+
+    def pick(indices, limit):
+        picked = []
+        for index in indices:
+            if len(picked) >= limit:
+                break
+            row = matrix.row(index, start_of_row)
+            if any(sum(value * other.get(term, 0.0) for term, value in row.items()) > MAX_OVERLAP
+                   for other in chosen_rows):
+                continue
+            chosen_rows.append(row)
+            picked.append(int(index))
+        return sorted(picked)
+
+    key_points = pick((index for index in ranked if not categories[index]), max_sentences)
+    sections = {
+        name: pick((index for index in ranked if name in categories[index]), max_section_items)
+        for name in CATEGORIES
+    }
+    # Sections the template asks for come first.
+    order = sorted(CATEGORIES, key=lambda name: name not in requested)
+
+    def bullet(index):
+        speaker, sentence = sentences[index]
+        return f"- {speaker}: {sentence}" if speaker else f"- {sentence}"
+
+    parts = []
+    if key_points:
+        parts.append("Key Points:\n" + "\n".join(bullet(index) for index in key_points))
+    for name in order:
+        if sections[name]:
+            parts.append(f"{name}:\n" + "\n".join(bullet(index) for index in sections[name]))
+    seconds = time.perf_counter() - start_time
+    summary = ExtractiveSummary(
+        "\n\n".join(parts),
+        [sentences[index] for index in key_points],
+        {name: [sentences[index] for index in indices] for name, indices in sections.items()},
+        len(all_sentences),
+        seconds,
+    )
+    logging.getLogger(__name__).info(f"Extractive summary: {summary.describe()}.")
+    return summary
@@ -0,0 +1,54 @@
+import extractive
+
+TRANSCRIPT = """Alice: Thanks for joining everyone, today we review the mobile app launch plan.
+Bob: QA found two crash bugs in the payment flow during the regression run.
+Carol: The marketing campaign assets are almost ready for the launch announcement.
+Alice: After some discussion we decided to move the launch to next Wednesday.
+Bob: The crash bugs only happen on older Android devices with low memory.
+Carol: I will send the updated release notes to marketing by Monday.
+Alice: The support team also wants a short training session before the launch.
+Bob: I'll check the crash reports again tomorrow and share a summary with the team.
+Carol: Customers have been asking about the dark mode feature in the app store reviews.
+Alice: We agreed that dark mode goes into the release after this one.
+"""
+
+
+def test_decisions_and_action_items_get_their_own_sections(word_tokens):
+    summary = extractive.summarize(TRANSCRIPT)
+    decisions = [sentence for _, sentence in summary.sections["Decisions"]]
+    actions = [sentence for _, sentence in summary.sections["Action Items"]]
+    assert "After some discussion we decided to move the launch to next Wednesday." in decisions
+    assert "We agreed that dark mode goes into the release after this one." in decisions
+    assert "I will send the updated release notes to marketing by Monday." in actions
+    assert not set(decisions) & set(actions)
+    assert summary.text.startswith("Key Points:\n- ")
+    assert "\n- Carol: I will send the updated release notes to marketing by Monday." in summary.text
+
+
+def test_key_points_keep_transcript_order_and_their_limit(word_tokens):
+    summary = extractive.summarize(TRANSCRIPT, max_sentences=2)
+    assert len(summary.key_points) == 2
+    order = [sentence for _, sentence in extractive.split_sentences(TRANSCRIPT)]
+    positions = [order.index(sentence) for _, sentence in summary.key_points]
+    assert positions == sorted(positions)
+
+
+def test_the_sections_a_template_asks_for_come_first(word_tokens):
+    default = extractive.summarize(TRANSCRIPT).text
+    asked = extractive.summarize(TRANSCRIPT, prompt="List the action items with owners and next steps.").text
+    assert default.index("Decisions:") < default.index("Action Items:")
+    assert asked.index("Action Items:") < asked.index("Decisions:")
+
+
+def test_template_terms_boost_matching_sentences(word_tokens):
+    summary = extractive.summarize(TRANSCRIPT, prompt="What did customers say about dark mode?", max_sentences=1)
+    assert summary.key_points == [
+        ("Carol", "Customers have been asking about the dark mode feature in the app store reviews."),
+    ]
+
+
+def test_an_empty_transcript_gives_an_empty_summary(word_tokens):
+    for transcript in ("", "Okay.\nThanks.\n"):
+        summary = extractive.summarize(transcript)
+        assert summary.text == "" and summary.key_points == []
+        assert summary.describe().startswith("0 of ")
@@ -0,0 +1,306 @@
+"""
+Bounded-memory transcript ingestion.
+
+Reads uploaded or on-disk transcripts (.txt, .vtt, .srt, .docx) incrementally and yields
+normalized text lines, instead of decoding the whole file in one go. The app and the batch
+CLI join them with read_transcript(), since the audit log and the summary cache key keep the
+whole original transcript; compaction then walks that text line by line without copying it.
+
+- Text is read in fixed-size chunks through an incremental decoder; the encoding is
+  detected from a prefix sample (BOM, then UTF-8, then Windows-1252).
+- Caption exports (.vtt/.srt) lose cue identifiers, timings and markup; WebVTT voice tags
+  become "Speaker: text" lines.
+- .docx files are parsed with a streaming XML reader, so body paragraphs, table rows and
+  text boxes come out in document order without building the whole document tree.
+- Files larger than max_bytes are rejected from their reported size before any read,
+  and again while reading if no size is available.
+"""
+import codecs
+import io
+import logging
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+DEFAULT_MAX_BYTES = int(os.getenv("TRANSCRIPT_MAX_MB", "20")) * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Bytes sampled from the start of a text file to pick its encoding.
+ENCODING_SAMPLE_BYTES = 64 * 1024
+# document.xml is typically 5-20x the compressed .docx; anything beyond this is treated as a zip bomb.
+DOCX_EXPANSION_LIMIT = 20
+
+TEXT_EXTENSIONS = (".txt",)
+CAPTION_EXTENSIONS = (".vtt", ".srt")
+DOCX_EXTENSIONS = (".docx",)
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS + CAPTION_EXTENSIONS + DOCX_EXTENSIONS
+
+# "00:00:01.000 --> 00:00:04.000 align:start" (WebVTT) or "00:00:01,000 --> 00:00:04,000" (SRT)
+CUE_TIMING_LINE = re.compile(r"^(?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3}\s+-->\s+(?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3}")
+VOICE_TAG = re.compile(r"<v(?:\.[\w.-]+)?\s+([^>]+)>")
+MARKUP_TAG = re.compile(r"</?[^>]+>")
+# Zero-width characters and the BOM, which Word and caption tools scatter through text.
+INVISIBLE_CHARS = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff"))
+INVISIBLE_CHARS.update({ord("\u00a0"): " ", ord("\u202f"): " "})
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+
+class TranscriptTooLarge(ValueError):
+    """Raised when a transcript is larger than the configured limit."""
+
+
+class UnsupportedTranscript(ValueError):
+    """Raised for file types ingestion cannot read."""
+
+
+def detect_encoding(sample):
+    """
+    Picks a text encoding from the first bytes of a file.
+
+    A BOM wins; otherwise the sample is tried as UTF-8 (allowing a character cut off at the
+    end of the sample) and Windows-1252 is used when that fails.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def normalize_line(line):
+    """Removes invisible characters, maps non-breaking spaces to spaces and trims the line."""
+    return line.translate(INVISIBLE_CHARS).strip()
+
+
+def _reported_size(source):
+    """Returns the size of a path or file object without reading it, or None if unknown."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    size = getattr(source, "size", None)  # Streamlit UploadedFile
+    if isinstance(size, int):
+        return size
+    try:
+        position = source.tell()
+        size = source.seek(0, io.SEEK_END)
+        source.seek(position)
+        return size - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _check_size(size, max_bytes, name):
+    if max_bytes and size is not None and size > max_bytes:
+        raise TranscriptTooLarge(
+            f"{name} is {size / (1024 * 1024):.1f} MB; the limit is {max_bytes / (1024 * 1024):.0f} MB."
+        )
+
+
+def iter_text_lines(stream, max_bytes=DEFAULT_MAX_BYTES, chunk_size=DEFAULT_CHUNK_SIZE, encoding=None):
+    """
+    Decodes a binary stream chunk by chunk and yields its lines, without line endings.
+
+    Only one chunk and one partial line are held at a time. Raises TranscriptTooLarge once
+    more than max_bytes have been read.
+    """
+    sample = stream.read(min(chunk_size, ENCODING_SAMPLE_BYTES)) if encoding is None else b""
+    encoding = encoding or detect_encoding(sample)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    total, partial, data = 0, "", sample
+    while True:
+        if not data:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+        total += len(data)
+        if max_bytes and total > max_bytes:
+            raise TranscriptTooLarge(f"Transcript is over the {max_bytes / (1024 * 1024):.0f} MB limit.")
+        lines = (partial + decoder.decode(data)).splitlines(keepends=True)
+        data = b""
+        partial = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        # A lone "\r" may be the first half of "\r\n" split across chunks; keep it for the next round.
+        if lines and lines[-1].endswith("\r") and not partial:
+            partial = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r\n")
+    partial += decoder.decode(b"", final=True)
+    if partial:
+        for line in partial.splitlines():
+            yield line
+
+
+def iter_caption_lines(lines):
+    """
+    Strips WebVTT/SRT cue identifiers, timings, notes and markup, yielding the spoken text.
+
+    A cue identifier (the SRT cue number) is whatever line comes right before a timing line,
+    so each line is held back until the next one is seen; a spoken "42" is kept.
+    """
+    in_note = False
+    held = None
+    for line in lines:
+        line = line.strip()
+        if CUE_TIMING_LINE.match(line):
+            held = None
+            continue
+        if held is not None:
+            text = _caption_text(held)
+            if text:
+                yield text
+            held = None
+        if not line:
+            in_note = False
+            continue
+        if in_note or line.startswith("WEBVTT"):
+            continue
+        if line.startswith(("NOTE", "STYLE", "REGION")):
+            in_note = True
+            continue
+        held = line
+    if held is not None:
+        text = _caption_text(held)
+        if text:
+            yield text
+
+
+def _caption_text(line):
+    voice = VOICE_TAG.search(line)
+    text = MARKUP_TAG.sub("", line).strip()
+    return f"{voice.group(1).strip()}: {text}" if voice and text else text
+
+
+def iter_docx_lines(source, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Yields the paragraphs of a .docx in document order, streaming word/document.xml.
+
+    Table rows come out as one line with cells separated by " | ". Text boxes are read once
+    (the legacy VML copy Word stores next to each one is skipped).
+    """
+    with zipfile.ZipFile(source) as archive:
+        try:
+            info = archive.getinfo("word/document.xml")
+        except KeyError:
+            raise UnsupportedTranscript("Not a Word document: word/document.xml is missing.")
+        if max_bytes:
+            _check_size(info.file_size, max_bytes * DOCX_EXPANSION_LIMIT, "Document text")
+        with archive.open(info) as document:
+            yield from _iter_document_xml(document)
+
+
+def _iter_document_xml(document):
+    paragraph_tag, table_cell_tag, table_row_tag = W_NS + "p", W_NS + "tc", W_NS + "tr"
+    text_tag, tab_tag, break_tag = W_NS + "t", W_NS + "tab", W_NS + "br"
+    body_tag = W_NS + "body"
+
+    body = None
+    fallback_depth = 0
+    # One list of cell texts per open table row and one list of paragraph texts per open cell.
+    rows, cells = [], []
+    # Text of every open paragraph; nested text-box paragraphs push onto this stack.
+    paragraphs = []
+
+    for event, element in ET.iterparse(document, events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            if tag == body_tag:
+                body = element
+            elif tag == MC_FALLBACK:
+                fallback_depth += 1
+            elif fallback_depth:
+                continue
+            elif tag == paragraph_tag:
+                paragraphs.append([])
+            elif tag == table_row_tag:
+                rows.append([])
+            elif tag == table_cell_tag:
+                cells.append([])
+            continue
+
+        if tag == MC_FALLBACK:
+            fallback_depth -= 1
+            element.clear()
+        elif fallback_depth:
+            continue
+        elif tag == text_tag and paragraphs:
+            paragraphs[-1].append(element.text or "")
+        elif tag == tab_tag and paragraphs:
+            paragraphs[-1].append("\t")
+        elif tag == break_tag and paragraphs:
+            paragraphs[-1].append("\n")
+        elif tag == paragraph_tag and paragraphs:
+            text = "".join(paragraphs.pop())
+            if cells:
+                cells[-1].append(text)
+            else:
+                for line in text.split("\n"):
+                    yield line
+        elif tag == table_cell_tag and cells:
+            cell = " ".join(part.strip() for part in cells.pop() if part.strip())
+            if rows:
+                rows[-1].append(cell)
+        elif tag == table_row_tag and rows:
+            row = " | ".join(rows.pop())
+            if cells:
+                cells[-1].append(row)
+            elif row.strip(" |"):
+                yield row
+
+        # Drop finished top-level blocks so memory stays flat for long documents.
+        if body is not None and not paragraphs and not rows and tag in (paragraph_tag, W_NS + "tbl", W_NS + "sectPr"):
+            body.clear()
+
+
+def iter_transcript(source, file_name=None, max_bytes=DEFAULT_MAX_BYTES, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the normalized lines of a transcript, collapsing runs of blank lines to one.
+
+    Args:
+        source: A path, or a binary file object such as a Streamlit UploadedFile.
+        file_name (str): Used to pick the format; defaults to the path or the object's name.
+        max_bytes (int): Size limit; 0 disables it.
+        chunk_size (int): Bytes read per step from text files.
+    """
+    file_name = file_name or (os.fspath(source) if isinstance(source, (str, os.PathLike)) else getattr(source, "name", ""))
+    extension = os.path.splitext(file_name.lower())[1]
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise UnsupportedTranscript(f"Unsupported file type: {extension or file_name!r}.")
+    _check_size(_reported_size(source), max_bytes, os.path.basename(file_name) or "Transcript")
+
+    if extension in DOCX_EXTENSIONS:
+        lines = iter_docx_lines(source, max_bytes)
+        yield from _normalized(lines)
+        return
+
+    stream = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        lines = iter_text_lines(stream, max_bytes=max_bytes, chunk_size=chunk_size)
+        if extension in CAPTION_EXTENSIONS:
+            lines = iter_caption_lines(lines)
+        yield from _normalized(lines)
+    finally:
+        if stream is not source:
+            stream.close()
+
+
+def _normalized(lines):
+    blank = True  # also drops leading blank lines
+    for line in lines:
+        line = normalize_line(line)
+        if line:
+            blank = False
+            yield line
+        elif not blank:
+            blank = True
+            yield ""
+
+
+def read_transcript(source, file_name=None, max_bytes=DEFAULT_MAX_BYTES):
+    """Reads a whole transcript into normalized text; see iter_transcript."""
+    text = "\n".join(iter_transcript(source, file_name, max_bytes=max_bytes)).rstrip("\n")
+    logging.getLogger(__name__).info(f"Ingested {file_name or getattr(source, 'name', source)}: {len(text)} characters.")
+    return text
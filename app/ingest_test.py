@@ -0,0 +1,79 @@
+import io
+import zipfile
+
+import pytest
+
+from ingest import TranscriptTooLarge, UnsupportedTranscript, iter_text_lines, iter_transcript, read_transcript
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def _read(data, file_name, **kwargs):
+    return list(iter_transcript(io.BytesIO(data), file_name, **kwargs))
+
+
+def _docx(body):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        archive.writestr("word/document.xml", f"<w:document {W}><w:body>{body}</w:body></w:document>")
+    return data.getvalue()
+
+
+def _paragraph(text):
+    return f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+def test_text_lines_are_normalized_and_blank_runs_collapsed():
+    data = "\ufeffAlice: Hello there.\r\n\r\n\r\nBob: Hi\u200b.\r\n".encode("utf-8")
+    assert _read(data, "notes.txt") == ["Alice: Hello there.", "", "Bob: Hi."]
+
+
+def test_windows_1252_text_is_detected():
+    assert _read("Café at 9’o clock".encode("cp1252"), "notes.txt") == ["Café at 9’o clock"]
+
+
+def test_lines_split_across_chunks_are_joined():
+    data = ("first line\r\n" + "é" * 10 + "\r\nlast").encode("utf-8")
+    assert list(iter_text_lines(io.BytesIO(data), chunk_size=3)) == ["first line", "é" * 10, "last"]
+
+
+def test_srt_cue_numbers_and_timings_are_dropped_but_spoken_numbers_kept():
+    data = b"1\n00:00:01,000 --> 00:00:03,000\nHow many tickets are open?\n\n" \
+           b"2\n00:00:04,000 --> 00:00:05,000\n42\n\n3\n00:00:06,000 --> 00:00:07,000\n<i>Too many.</i>\n"
+    assert _read(data, "call.srt") == ["How many tickets are open?", "42", "Too many."]
+
+
+def test_vtt_voice_tags_become_speakers_and_notes_are_skipped():
+    data = b"WEBVTT\n\nNOTE exported by Teams\nsecond note line\n\nintro\n" \
+           b"00:00:01.000 --> 00:00:02.000 align:start\n<v Alice Smith>We ship Friday.</v>\n\n" \
+           b"00:00:03.000 --> 00:00:04.000\n<v.loud Bob>Agreed.\n"
+    assert _read(data, "call.vtt") == ["Alice Smith: We ship Friday.", "Bob: Agreed."]
+
+
+def test_docx_paragraphs_and_tables_come_out_in_order():
+    body = _paragraph("Agenda") + (
+        "<w:tbl><w:tr><w:tc>" + _paragraph("Owner") + "</w:tc><w:tc>" + _paragraph("Task") + "</w:tc></w:tr>"
+        "<w:tr><w:tc>" + _paragraph("Bob") + "</w:tc><w:tc>" + _paragraph("Release notes") + "</w:tc></w:tr></w:tbl>"
+    ) + "<w:p><w:r><w:t>Line one</w:t><w:br/><w:t>Line two</w:t></w:r></w:p>"
+    assert _read(_docx(body), "minutes.docx") == ["Agenda", "Owner | Task", "Bob | Release notes", "Line one", "Line two"]
+
+
+def test_docx_without_a_document_is_refused():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        archive.writestr("other.xml", "<x/>")
+    with pytest.raises(UnsupportedTranscript):
+        _read(data.getvalue(), "minutes.docx")
+
+
+def test_size_limits_and_unsupported_types():
+    with pytest.raises(TranscriptTooLarge):
+        _read(b"x" * 2048, "notes.txt", max_bytes=1024)
+    with pytest.raises(UnsupportedTranscript):
+        _read(b"%PDF", "notes.pdf")
+
+
+def test_read_transcript_joins_the_lines(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"Alice: One.\n\nBob: Two.\n\n")
+    assert read_transcript(str(path)) == "Alice: One.\n\nBob: Two."
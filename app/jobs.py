@@ -0,0 +1,145 @@
+"""
+Summary jobs shared by the worker processes of the HTTP service.
+
+A job is submitted to one worker and runs there, but can be polled or streamed from any of
+them, so job state lives in a SQLite file every worker opens (in WAL mode, so readers do not
+block the writer). The running worker writes the text generated so far every
+partial_interval seconds; streams read it back and send what is new.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    user TEXT,
+    template TEXT,
+    engine TEXT,
+    pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    queue_position INTEGER,
+    queue_wait REAL,
+    partial TEXT NOT NULL DEFAULT '',
+    result TEXT,
+    error TEXT,
+    error_status INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """
+    Jobs in a SQLite file, one connection per thread.
+
+    Args:
+        path (str): The database file, shared by every worker.
+        retention_seconds (float): Finished jobs older than this are deleted by purge().
+    """
+
+    def __init__(self, path, retention_seconds=24 * 3600):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def create(self, user, template, engine):
+        """Records a new queued job for this process and returns its id."""
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, user, template, engine, pid, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, user, template, engine, os.getpid(), time.time()),
+        )
+        return job_id
+
+    def queued(self, job_id, position, wait):
+        self._connect().execute(
+            "UPDATE jobs SET queue_position = ?, queue_wait = ? WHERE id = ? AND status = ?",
+            (position, wait, job_id, QUEUED),
+        )
+
+    def start(self, job_id):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, started_at = ?, queue_position = 0, queue_wait = 0 WHERE id = ?",
+            (RUNNING, time.time(), job_id),
+        )
+
+    def progress(self, job_id, partial):
+        self._connect().execute("UPDATE jobs SET partial = ? WHERE id = ?", (partial, job_id))
+
+    def finish(self, job_id, result):
+        """Marks a job done with its result (a JSON-serializable dict)."""
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ?, partial = '' WHERE id = ?",
+            (DONE, time.time(), json.dumps(result), job_id),
+        )
+
+    def fail(self, job_id, error, error_status=500):
+        """Marks a job failed, with a message for the client and the HTTP status it maps to."""
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, error = ?, error_status = ? WHERE id = ?",
+            (FAILED, time.time(), error, error_status, job_id),
+        )
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None."""
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def abandon(self, pids=None, reason="The service restarted before the job finished."):
+        """
+        Fails the unfinished jobs of the given worker processes (all of them if None).
+
+        Returns:
+            int: The number of jobs failed.
+        """
+        query = "UPDATE jobs SET status = ?, finished_at = ?, error = ?, error_status = 503 WHERE status IN (?, ?)"
+        parameters = [FAILED, time.time(), reason, QUEUED, RUNNING]
+        if pids is not None:
+            pids = list(pids)
+            if not pids:
+                return 0
+            query += f" AND pid IN ({', '.join('?' * len(pids))})"
+            parameters += pids
+        count = self._connect().execute(query, parameters).rowcount
+        if count:
+            self.logger.warning(f"Failed {count} unfinished job(s): {reason}")
+        return count
+
+    def purge(self):
+        """Deletes finished jobs older than the retention period."""
+        cutoff = time.time() - self.retention_seconds
+        placeholders = ", ".join("?" * len(FINISHED))
+        return self._connect().execute(
+            f"DELETE FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?", (*FINISHED, cutoff)
+        ).rowcount
@@ -0,0 +1,289 @@
+"""
+Incremental summarization of meetings that are still going.
+
+Re-summarizing the whole transcript every time a few minutes are appended costs
+O(length^2) over a meeting. A LiveMeeting instead keeps a rolling summary and the tail of
+segments not yet summarized. Once the tail holds fold_tokens, it is folded in: one request
+rewrites the summary to cover the tail, and a concurrent one writes notes on the tail alone.
+Both depend only on the summary and the tail, so an update costs about the same at minute
+5 and minute 90.
+
+Folding a summary into itself again and again can drift, so every consolidate_every folds
+the summary is rebuilt from all the notes, on a background thread so appends are not
+delayed. If a fold lands while it runs, the rebuilt summary is dropped (it no longer
+covers everything) and the next fold schedules another one.
+
+The model is never called under the meeting's lock: a fold takes the tail as it is, and
+segments appended meanwhile wait for the next fold. Folds run one at a time per meeting.
+
+Segments are append-only. Callers may number them; a repeated sequence number is ignored
+(a retried upload) and a skipped one is rejected.
+"""
+import logging
+import threading
+import time
+
+from async_runtime import run_sync
+from metrics import increment, record_span
+from token_accounting import count_tokens
+from utils import split_transcript
+
+
+class UnknownMeeting(KeyError):
+    """Raised for a meeting id that was never started or has been finished."""
+
+
+class SegmentOutOfOrder(ValueError):
+    """Raised when a segment's sequence number skips ahead of the last one received."""
+
+
+class LiveMeeting:
+    """
+    The summary state of one meeting in progress.
+
+    Attributes:
+        summary (str): The rolling summary; empty until the first fold.
+        notes (list): Notes on each folded part, in order.
+        tail (list): Segments received but not yet folded.
+    """
+
+    def __init__(self, meeting_id, prompt, handler, fold_tokens=1500, consolidate_every=5):
+        self.meeting_id = meeting_id
+        self.prompt = prompt
+        self.handler = handler
+        self.fold_tokens = fold_tokens
+        self.consolidate_every = consolidate_every
+        self.summary = ""
+        self.notes = []
+        self.tail = []
+        self.tail_tokens = 0
+        self.segments = 0
+        self.last_sequence = 0
+        self.folds = 0
+        self.consolidations = 0
+        self.last_fold_seconds = None
+        self.started_at = time.time()
+        self.updated_at = self.started_at
+        self.logger = logging.getLogger(__name__)
+        # Guards the state; held only to read or publish it, never across a model call.
+        self._lock = threading.Lock()
+        # Held for a whole fold, so folds of one meeting run one at a time and in order.
+        self._fold_lock = threading.Lock()
+        self._tail_counts = []
+        self._consolidating = False
+
+    def append(self, text, sequence=None, fold=True):
+        """
+        Appends a segment and folds the tail in once it holds fold_tokens.
+
+        Args:
+            text (str): The new transcript text.
+            sequence (int): The segment's number, counting from 1; None appends unconditionally.
+            fold (bool): Whether to fold now if the tail is large enough. Without it, call
+                fold_if_due() later, e.g. on another thread.
+
+        Returns:
+            bool: False if the segment was a repeat of one already received.
+        """
+        text = text.strip()
+        tokens = count_tokens(text) if text else 0
+        with self._lock:
+            if sequence is not None:
+                if sequence <= self.last_sequence:
+                    return False
+                if sequence != self.last_sequence + 1:
+                    raise SegmentOutOfOrder(f"Expected segment {self.last_sequence + 1}, got {sequence}.")
+                self.last_sequence = sequence
+            if text:
+                self.tail.append(text)
+                self._tail_counts.append(tokens)
+                self.tail_tokens += tokens
+            self.segments += 1
+            self.updated_at = time.time()
+        if fold:
+            self.fold_if_due()
+        return True
+
+    def fold_if_due(self):
+        """Folds the tail if it holds fold_tokens, unless a fold is already running (which picks it up)."""
+        # Retried after each fold, so a segment appended while one was finishing is not left behind.
+        while self._due() and self._fold_lock.acquire(blocking=False):
+            try:
+                self._fold_tail(self.fold_tokens)
+            finally:
+                self._fold_lock.release()
+        return self.summary
+
+    def fold(self):
+        """Folds the whole tail into the summary, in parts of at most max_chunk_tokens."""
+        with self._fold_lock:
+            self._fold_tail(0)
+        return self.fold_if_due()
+
+    def consolidate(self):
+        """Rebuilds the summary from the notes now, after folding any tail."""
+        with self._fold_lock:
+            self._fold_tail(0)
+            # Notes only change in a fold, so these are all of them until the lock is released.
+            notes = list(self.notes)
+            if len(notes) > 1:
+                summary = run_sync(self.handler.aconsolidate_live_summary(notes, self.prompt))
+                with self._lock:
+                    self.summary = summary
+                    self.consolidations += 1
+        return self.summary
+
+    def finish(self):
+        """Folds the tail and returns the final, consolidated summary."""
+        return self.consolidate()
+
+    def _due(self):
+        with self._lock:
+            return bool(self.tail) and self.tail_tokens >= self.fold_tokens
+
+    def _fold_tail(self, min_tokens):
+        """Folds while the tail holds at least min_tokens; the caller holds _fold_lock."""
+        while True:
+            with self._lock:
+                if not self.tail or self.tail_tokens < min_tokens:
+                    return
+                taken, summary, index = len(self.tail), self.summary, len(self.notes)
+                tail_text = "\n".join(self.tail)
+            notes = []
+            for part in split_transcript(tail_text, self.handler.max_chunk_tokens):
+                start_time = time.perf_counter()
+                summary, part_notes = run_sync(
+                    self.handler.afold_live_segment(summary, part, self.prompt, index + len(notes) + 1)
+                )
+                notes.append(part_notes)
+                fold_seconds = time.perf_counter() - start_time
+                record_span("live_fold", fold_seconds)
+                increment("live_folds_total")
+            with self._lock:
+                self.summary = summary
+                self.notes.extend(notes)
+                del self.tail[:taken]
+                self.tail_tokens -= sum(self._tail_counts[:taken])
+                del self._tail_counts[:taken]
+                self.folds += len(notes)
+                self.last_fold_seconds = fold_seconds
+                if self.consolidate_every and self.folds % self.consolidate_every == 0:
+                    self._start_consolidation()
+            self.logger.info(
+                f"Live meeting {self.meeting_id}: fold {self.folds} took {fold_seconds:.2f}s "
+                f"({len(self.notes)} parts so far)."
+            )
+
+    def _start_consolidation(self):
+        # Called with _lock held.
+        if self._consolidating or len(self.notes) < 2:
+            return
+        self._consolidating = True
+        threading.Thread(
+            target=self._consolidate_in_background, args=(list(self.notes),),
+            name=f"live-consolidate-{self.meeting_id}", daemon=True,
+        ).start()
+
+    def _consolidate_in_background(self, notes):
+        start_time = time.perf_counter()
+        try:
+            summary = run_sync(self.handler.aconsolidate_live_summary(notes, self.prompt))
+        except Exception:
+            self.logger.error(f"Live meeting {self.meeting_id}: consolidation failed", exc_info=True)
+            summary = None
+        record_span("live_consolidate", time.perf_counter() - start_time)
+        with self._lock:
+            self._consolidating = False
+            if summary is None:
+                return
+            if len(self.notes) != len(notes):
+                increment("live_consolidations_total", outcome="stale")
+                self.logger.info(f"Live meeting {self.meeting_id}: consolidation overtaken by a fold; dropped.")
+                return
+            self.summary = summary
+            self.consolidations += 1
+            increment("live_consolidations_total", outcome="applied")
+
+    def snapshot(self):
+        """Returns the summary and progress counters."""
+        with self._lock:
+            return {
+                "meeting_id": self.meeting_id,
+                "summary": self.summary,
+                "segments": self.segments,
+                "last_sequence": self.last_sequence,
+                "parts": len(self.notes),
+                "tail_tokens": self.tail_tokens,
+                "folds": self.folds,
+                "consolidations": self.consolidations,
+                "last_fold_seconds": round(self.last_fold_seconds, 2) if self.last_fold_seconds else None,
+                "consolidating": self._consolidating,
+            }
+
+
+class LiveSummarizer:
+    """
+    The live meetings of one process, by id.
+
+    Args:
+        handler (AIHandler): Used for every fold and consolidation.
+        fold_tokens (int): Tail size that triggers a fold.
+        consolidate_every (int): Folds between rebuilds of the summary from the notes; 0 never.
+        idle_seconds (float): Meetings without an append for this long are dropped.
+    """
+
+    def __init__(self, handler, fold_tokens=1500, consolidate_every=5, idle_seconds=6 * 3600):
+        self.handler = handler
+        self.fold_tokens = fold_tokens
+        self.consolidate_every = consolidate_every
+        self.idle_seconds = idle_seconds
+        self._meetings = {}
+        self._lock = threading.Lock()
+
+    def start(self, meeting_id, prompt):
+        """Starts a meeting, or returns it if it is already running."""
+        with self._lock:
+            self._evict_idle()
+            meeting = self._meetings.get(meeting_id)
+            if meeting is None:
+                meeting = self._meetings[meeting_id] = LiveMeeting(
+                    meeting_id, prompt, self.handler, self.fold_tokens, self.consolidate_every
+                )
+            return meeting
+
+    def get(self, meeting_id):
+        with self._lock:
+            meeting = self._meetings.get(meeting_id)
+        if meeting is None:
+            raise UnknownMeeting(meeting_id)
+        return meeting
+
+    def append(self, meeting_id, text, sequence=None, fold=True):
+        """Appends a segment to a running meeting; returns its snapshot afterwards."""
+        meeting = self.get(meeting_id)
+        meeting.append(text, sequence, fold)
+        return meeting.snapshot()
+
+    def finish(self, meeting_id):
+        """Returns the meeting's final summary and forgets the meeting."""
+        summary = self.get(meeting_id).finish()
+        with self._lock:
+            self._meetings.pop(meeting_id, None)
+        return summary
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.idle_seconds
+        for meeting_id in [m for m, meeting in self._meetings.items() if meeting.updated_at < cutoff]:
+            del self._meetings[meeting_id]
+
+
+_summarizers = {}
+_summarizers_lock = threading.Lock()
+
+
+def get_live_summarizer(handler, **kwargs):
+    """Returns the process-wide live summarizer for a handler."""
+    with _summarizers_lock:
+        if id(handler) not in _summarizers:
+            _summarizers[id(handler)] = LiveSummarizer(handler, **kwargs)
+        return _summarizers[id(handler)]
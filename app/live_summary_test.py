@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from live_summary import LiveSummarizer, SegmentOutOfOrder
+
+
+class _Handler:
+    """Folds by appending the segment's first words; folding waits until release is set."""
+
+    max_chunk_tokens = 3000
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+        self.folding = threading.Event()
+        self.folded = []
+
+    async def afold_live_segment(self, summary, segment, prompt, index):
+        self.folding.set()
+        while not self.release.is_set():
+            await asyncio.sleep(0.01)
+        self.folded.append(segment)
+        return f"{summary} [{index}: {segment.split()[0]}]".strip(), f"notes {index}"
+
+    async def aconsolidate_live_summary(self, notes, prompt):
+        return f"consolidated {len(notes)}"
+
+
+def _segment(word, words=10):
+    return " ".join([word] * words)
+
+
+def test_segments_are_folded_once_the_tail_is_large_enough(word_tokens):
+    live = LiveSummarizer(_Handler(), fold_tokens=15, consolidate_every=0)
+    live.start("m", "Summarize.")
+    assert live.append("m", _segment("alpha"), sequence=1)["folds"] == 0
+    snapshot = live.append("m", _segment("beta"), sequence=2)
+    assert (snapshot["folds"], snapshot["tail_tokens"], snapshot["summary"]) == (1, 0, "[1: alpha]")
+
+
+def test_repeated_and_skipped_segments(word_tokens):
+    live = LiveSummarizer(_Handler(), fold_tokens=100)
+    meeting = live.start("m", "Summarize.")
+    assert meeting.append(_segment("alpha"), sequence=1)
+    assert not meeting.append(_segment("alpha"), sequence=1)
+    with pytest.raises(SegmentOutOfOrder):
+        meeting.append(_segment("gamma"), sequence=3)
+    assert meeting.snapshot()["segments"] == 1
+
+
+def test_appends_do_not_wait_for_a_running_fold(word_tokens):
+    handler = _Handler()
+    live = LiveSummarizer(handler, fold_tokens=10, consolidate_every=0)
+    meeting = live.start("m", "Summarize.")
+    handler.release.clear()
+    folder = threading.Thread(target=meeting.append, args=(_segment("alpha"), 1), daemon=True)
+    folder.start()
+    assert handler.folding.wait(5)
+
+    start_time = time.perf_counter()
+    meeting.append(_segment("beta"), sequence=2)
+    assert time.perf_counter() - start_time < 0.5
+    assert meeting.snapshot()["tail_tokens"] == 20
+
+    handler.release.set()
+    folder.join(5)
+    # The segment appended during the first fold is folded right after it.
+    assert handler.folded == [_segment("alpha"), _segment("beta")]
+    assert meeting.snapshot()["summary"] == "[1: alpha] [2: beta]"
+
+
+def test_finish_folds_the_rest_and_consolidates(word_tokens):
+    live = LiveSummarizer(_Handler(), fold_tokens=10, consolidate_every=0)
+    live.start("m", "Summarize.")
+    live.append("m", _segment("alpha"), sequence=1)
+    live.append("m", _segment("beta", 3), sequence=2)
+    assert live.finish("m") == "consolidated 2"
@@ -0,0 +1,403 @@
+"""
+Routing of Ollama requests across several servers.
+
+OllamaRouter sends each request to the healthy endpoint with the fewest requests in
+flight. Endpoints are taken out of rotation after consecutive failures or a failed health
+check, and put back when a background health check (GET /api/tags) or a request to them
+succeeds again.
+
+Requests can be hedged: if an endpoint has not produced its first chunk within
+hedge_after seconds, the same request is sent to a second endpoint and whichever answers
+first is used and the other is cancelled, closing its connection.
+
+Requests run as asyncio tasks on the shared loop from async_runtime, with at most
+max_concurrency generations in flight per endpoint; generate() and stream() are blocking
+wrappers for synchronous callers.
+"""
+import asyncio
+import contextlib
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+import ollama
+
+from async_runtime import iterate_sync, run_sync
+from metrics import increment, record_span
+
+# Latency samples kept per endpoint for the percentiles in stats().
+LATENCY_WINDOW = 200
+# A request whose reported load_duration exceeds this had to load the model: a cold start.
+COLD_LOAD_SECONDS = 0.5
+
+
+class NoHealthyEndpoint(RuntimeError):
+    """Raised when every endpoint has been tried for a request and none succeeded."""
+
+
+class Endpoint:
+    """One Ollama server with its clients, health state and request statistics."""
+
+    def __init__(self, url, request_timeout=None, health_timeout=2.0, max_concurrency=None):
+        self.url = url.rstrip("/")
+        self.async_client = ollama.AsyncClient(host=url, timeout=request_timeout)
+        # Process-wide cap on concurrent generations here; the rest wait in line on the event loop.
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+        self.health_client = ollama.Client(host=url, timeout=health_timeout)
+        self.healthy = True
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.last_error = None
+        self.cold_starts = 0
+        self.last_request_at = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.first_chunk_latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "healthy": self.healthy,
+                "outstanding": self.outstanding,
+                "requests": self.requests,
+                "errors": self.errors,
+                "cancelled": self.cancelled,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "cold_starts": self.cold_starts,
+                "latency_p50": _percentile(self.latencies, 50),
+                "latency_p95": _percentile(self.latencies, 95),
+                "first_chunk_p50": _percentile(self.first_chunk_latencies, 50),
+                "first_chunk_p95": _percentile(self.first_chunk_latencies, 95),
+                "last_error": self.last_error,
+            }
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))], 4)
+
+
+class _Attempt:
+    """One try of a request against one endpoint."""
+
+    def __init__(self, endpoint, hedge=False):
+        self.endpoint = endpoint
+        self.hedge = hedge
+        self.task = None
+        self.finished = False
+
+
+class OllamaRouter:
+    """
+    Spreads generate requests over several Ollama servers.
+
+    Args:
+        urls (list): Base URLs of the Ollama servers.
+        model (str): Model to request; an endpoint that does not list it fails its health check.
+        hedge_after (float): Seconds without a first chunk before the request is duplicated on
+            a second endpoint; None disables hedging.
+        failure_threshold (int): Consecutive request failures that take an endpoint out of rotation.
+        health_interval (float): Seconds between background health checks; 0 disables them.
+        request_timeout (float): HTTP timeout for generate requests; None waits indefinitely.
+        health_timeout (float): HTTP timeout for health checks.
+        max_concurrency (int): Generations in flight per endpoint; None leaves it to the server.
+        keep_alive: Default keep_alive sent with requests (e.g. "30m"); None uses Ollama's default.
+    """
+
+    def __init__(self, urls, model, hedge_after=None, failure_threshold=2, health_interval=15.0,
+                 request_timeout=None, health_timeout=2.0, max_concurrency=None, keep_alive=None):
+        if not urls:
+            raise ValueError("At least one Ollama endpoint is required.")
+        self.endpoints = [Endpoint(url, request_timeout, health_timeout, max_concurrency) for url in urls]
+        self.model = model
+        self.hedge_after = hedge_after
+        self.keep_alive = keep_alive
+        self.failure_threshold = failure_threshold
+        self.health_interval = health_interval
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._tiebreak = itertools.count()
+        self._stop = threading.Event()
+        self._health_thread = None
+        # Also run for a single endpoint: the warm-up manager only pings endpoints marked healthy.
+        if health_interval:
+            self._health_thread = threading.Thread(target=self._health_loop, name="llm-router-health", daemon=True)
+            self._health_thread.start()
+
+    def generate(self, prompt, options=None, prefer=None, keep_alive=None, timeout=None):
+        """Blocking wrapper around agenerate(), for synchronous callers."""
+        return run_sync(self.agenerate(prompt, options, prefer, keep_alive, timeout))
+
+    def stream(self, prompt, options=None, prefer=None, keep_alive=None, timeout=None):
+        """Blocking wrapper around astream(); closing the generator aborts the request."""
+        return iterate_sync(self.astream(prompt, options, prefer, keep_alive, timeout))
+
+    async def agenerate(self, prompt, options=None, prefer=None, keep_alive=None, timeout=None):
+        """
+        Runs a prompt to completion; the arguments are as for astream().
+
+        Returns:
+            tuple: The generated text and Ollama's metadata for the request (token counts,
+            durations and the endpoint that served it).
+        """
+        parts, generation_info = [], None
+        async for endpoint_url, chunk in self.astream(prompt, options, prefer, keep_alive, timeout):
+            parts.append(chunk.response or "")
+            if chunk.done:
+                generation_info = generation_info_from(chunk, endpoint_url)
+        return "".join(parts), generation_info
+
+    async def astream(self, prompt, options=None, prefer=None, keep_alive=None, timeout=None):
+        """
+        Streams a prompt's response as (endpoint URL, ollama GenerateResponse chunk) pairs.
+
+        The endpoint that produced the first chunk serves the whole stream. If an endpoint
+        fails before producing anything the request moves to another endpoint; a failure
+        after the first chunk is raised. Closing the stream, cancelling the task consuming it
+        or passing the deadline cancels every attempt and closes its HTTP stream.
+
+        Args:
+            prefer (str): URL of the endpoint to use while it is healthy, e.g. one that has a
+                prompt prefix cached. Such requests are not hedged.
+            keep_alive: How long Ollama keeps the model loaded afterwards (seconds or "5m");
+                defaults to the router's keep_alive.
+            timeout (float): Deadline in seconds for the whole stream; TimeoutError when passed.
+        """
+        keep_alive = keep_alive if keep_alive is not None else self.keep_alive
+        results = asyncio.Queue()
+        tried = []
+        attempts = []
+        winner = None
+
+        def start(hedge=False):
+            endpoint = self._acquire(exclude=tried, prefer=None if hedge or tried else prefer)
+            if endpoint is None:
+                return None
+            tried.append(endpoint)
+            if hedge:
+                with endpoint._lock:
+                    endpoint.hedges += 1
+            attempt = _Attempt(endpoint, hedge)
+            attempt.task = asyncio.create_task(self._run(attempt, prompt, options, keep_alive, results))
+            # A done callback, not a finally block: a task cancelled before it starts never runs its body.
+            attempt.task.add_done_callback(lambda task: self._release(endpoint, task))
+            attempts.append(attempt)
+            return attempt
+
+        now = time.monotonic()
+        deadline = now + timeout if timeout is not None else None
+        hedge_deadline = now + self.hedge_after if self.hedge_after and not prefer else None
+        if start() is None:
+            raise NoHealthyEndpoint("No Ollama endpoint is configured.")
+        try:
+            while True:
+                wakeups = [t for t in (deadline, hedge_deadline if winner is None else None) if t is not None]
+                wait = max(0.0, min(wakeups) - time.monotonic()) if wakeups else None
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(results.get(), wait)
+                except asyncio.TimeoutError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        increment("llm_router_timeouts_total")
+                        raise TimeoutError(f"Ollama request did not finish within {timeout:.1f}s.") from None
+                    hedge_deadline = None
+                    hedged = start(hedge=True)
+                    if hedged:
+                        self.logger.info(f"Hedging request from {tried[0].url} to {hedged.endpoint.url}.")
+                        increment("llm_router_hedges_total")
+                    continue
+
+                if kind != "chunk":
+                    attempt.finished = True
+                if winner is None:
+                    if kind == "chunk":
+                        winner = attempt
+                        for other in attempts:
+                            if other is not attempt:
+                                other.task.cancel()
+                        if attempt.hedge:
+                            with attempt.endpoint._lock:
+                                attempt.endpoint.hedge_wins += 1
+                    elif kind == "error":
+                        if any(not other.finished for other in attempts):
+                            continue
+                        self.logger.warning(f"Ollama request failed on {attempt.endpoint.url}: {payload}")
+                        if start() is None:
+                            raise payload
+                        continue
+                    else:
+                        # Finished without a single chunk; nothing to wait for.
+                        return
+                if attempt is not winner:
+                    continue
+                if kind == "error":
+                    raise payload
+                if kind == "done":
+                    return
+                yield attempt.endpoint.url, payload
+        finally:
+            for attempt in attempts:
+                attempt.task.cancel()
+
+    def _acquire(self, exclude=(), prefer=None):
+        """Reserves the preferred endpoint if healthy, else the least loaded one not in exclude."""
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+            # With nothing healthy left, try the rest anyway rather than failing outright.
+            candidates = healthy or candidates
+            if not candidates:
+                return None
+            preferred = [endpoint for endpoint in healthy if endpoint.url == (prefer or "").rstrip("/")]
+            offset = next(self._tiebreak)
+            endpoint = preferred[0] if preferred else min(
+                candidates,
+                key=lambda e: (e.outstanding, (self.endpoints.index(e) - offset) % len(self.endpoints)),
+            )
+            with endpoint._lock:
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+            return endpoint
+
+    async def _run(self, attempt, prompt, options, keep_alive, results):
+        endpoint = attempt.endpoint
+        try:
+            # Waiting here still counts as outstanding, so the endpoint looks as busy as it is.
+            async with endpoint.semaphore:
+                start_time = time.perf_counter()
+                first_chunk_seconds = None
+                chunks = await endpoint.async_client.generate(
+                    self.model, prompt, stream=True, options=options, keep_alive=keep_alive
+                )
+                cold = False
+                async for chunk in chunks:
+                    if first_chunk_seconds is None:
+                        first_chunk_seconds = time.perf_counter() - start_time
+                    if chunk.done:
+                        cold = is_cold_start(chunk.load_duration)
+                    results.put_nowait((attempt, "chunk", chunk))
+                self._record_success(endpoint, time.perf_counter() - start_time, first_chunk_seconds, cold)
+                results.put_nowait((attempt, "done", None))
+        except Exception as e:
+            self._record_failure(endpoint, e)
+            results.put_nowait((attempt, "error", e))
+
+    def _release(self, endpoint, task):
+        with endpoint._lock:
+            endpoint.outstanding -= 1
+            if task.cancelled():
+                # Cancelling closed the HTTP stream, so the server stops generating.
+                endpoint.cancelled += 1
+
+    def _record_success(self, endpoint, seconds, first_chunk_seconds, cold=False):
+        with endpoint._lock:
+            endpoint.consecutive_failures = 0
+            # Requests still reach an unhealthy endpoint when nothing is healthy; one that succeeds is back.
+            put_back = not endpoint.healthy
+            endpoint.healthy = True
+            endpoint.last_request_at = time.monotonic()
+            endpoint.latencies.append(seconds)
+            if first_chunk_seconds is not None:
+                endpoint.first_chunk_latencies.append(first_chunk_seconds)
+            if cold:
+                endpoint.cold_starts += 1
+        # The cold label keeps model loads apart from slow generations in the latency histograms.
+        record_span("llm_endpoint", seconds, endpoint=endpoint.url, cold=cold)
+        if cold:
+            increment("llm_cold_starts_total", endpoint=endpoint.url)
+        if put_back:
+            self.logger.warning(f"Ollama endpoint {endpoint.url} is back in rotation after a successful request.")
+
+    def _record_failure(self, endpoint, error):
+        with endpoint._lock:
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            endpoint.last_error = f"{type(error).__name__}: {error}"
+            take_out = endpoint.healthy and endpoint.consecutive_failures >= self.failure_threshold
+            if take_out:
+                endpoint.healthy = False
+        increment("llm_endpoint_errors_total", endpoint=endpoint.url)
+        if take_out:
+            self.logger.warning(f"Ollama endpoint {endpoint.url} taken out of rotation after {self.failure_threshold} failures.")
+
+    def check_health(self):
+        """Checks every endpoint now; returns {url: healthy}."""
+        for endpoint in self.endpoints:
+            try:
+                models = endpoint.health_client.list().models
+                healthy = any(m.model == self.model or m.model.startswith(self.model + ":") for m in models)
+                error = None if healthy else f"model {self.model} not available"
+            except Exception as e:
+                healthy, error = False, f"{type(e).__name__}: {e}"
+            with endpoint._lock:
+                changed = endpoint.healthy != healthy
+                endpoint.healthy = healthy
+                if healthy:
+                    endpoint.consecutive_failures = 0
+                else:
+                    endpoint.last_error = error
+            if changed:
+                self.logger.warning(
+                    f"Ollama endpoint {endpoint.url} is {'back in rotation' if healthy else 'unhealthy: ' + error}."
+                )
+        return {endpoint.url: endpoint.healthy for endpoint in self.endpoints}
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            try:
+                self.check_health()
+            except Exception:
+                self.logger.error("Ollama health check failed", exc_info=True)
+
+    def stats(self):
+        """Returns per-endpoint health, load, error and latency statistics."""
+        return {endpoint.url: endpoint.stats() for endpoint in self.endpoints}
+
+    def close(self):
+        self._stop.set()
+
+
+def is_cold_start(load_duration):
+    """Whether Ollama's reported load_duration (nanoseconds) means the model had to be loaded."""
+    return bool(load_duration) and load_duration / 1e9 > COLD_LOAD_SECONDS
+
+
+def generation_info_from(chunk, endpoint_url):
+    """Builds the metadata dict kept for a request from its final chunk."""
+    info = chunk.model_dump(exclude={"response", "context"})
+    info["endpoint"] = endpoint_url
+    info["cold_start"] = is_cold_start(info.get("load_duration"))
+    return info
+
+
+def parse_urls(urls):
+    """Accepts a list of URLs or a comma-separated string of them."""
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    return [url.strip() for url in urls if url and url.strip()]
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(urls, model, **kwargs):
+    """
+    Returns the process-wide router for these endpoints, model and settings, so load is shared
+    across sessions. Callers asking for different settings (hedge_after, max_concurrency,
+    keep_alive, ...) get a router of their own.
+    """
+    key = (tuple(parse_urls(urls)), model, tuple(sorted(kwargs.items())))
+    with _routers_lock:
+        if key not in _routers:
+            _routers[key] = OllamaRouter(list(key[0]), model, **kwargs)
+        return _routers[key]
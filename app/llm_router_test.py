@@ -0,0 +1,114 @@
+import time
+
+import ollama as ollama_client
+import pytest
+
+from llm_router import OllamaRouter, get_router
+from stubs import StubOllamaServer
+
+
+def _fast_server():
+    return StubOllamaServer(first_token_latency=0.01, tokens_per_second=1000, output_tokens=5)
+
+
+@pytest.fixture
+def ollama():
+    server = _fast_server().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def backup():
+    server = _fast_server().start()
+    yield server
+    server.stop()
+
+
+def test_a_single_endpoint_is_put_back_after_a_successful_request(ollama):
+    router = OllamaRouter([ollama.url], ollama.model, failure_threshold=2, health_interval=0)
+    ollama.available = False
+    for _ in range(2):
+        with pytest.raises(Exception):
+            router.generate("Summarize.")
+    assert not router.endpoints[0].healthy
+
+    # With nothing healthy the request still goes out, and its success restores the endpoint.
+    ollama.available = True
+    text, info = router.generate("Summarize.")
+    assert text.startswith("token0") and info["endpoint"] == ollama.url
+    assert router.endpoints[0].healthy and router.endpoints[0].consecutive_failures == 0
+
+
+def test_a_single_endpoint_gets_background_health_checks(ollama):
+    router = OllamaRouter([ollama.url], ollama.model, health_interval=30)
+    try:
+        assert router._health_thread is not None
+    finally:
+        router.close()
+
+
+def test_routers_are_shared_only_between_callers_with_the_same_settings(ollama):
+    shared = get_router(ollama.url, ollama.model, hedge_after=None, max_concurrency=2, keep_alive="5m")
+    assert get_router([ollama.url], ollama.model, hedge_after=None, max_concurrency=2, keep_alive="5m") is shared
+    hedged = get_router(ollama.url, ollama.model, hedge_after=1.0, max_concurrency=2, keep_alive="5m")
+    assert hedged is not shared and hedged.hedge_after == 1.0
+    for router in (shared, hedged):
+        router.close()
+
+
+def _settled(router, url, timeout=2.0):
+    """Endpoint stats once cancelled attempts have been released on the event loop."""
+    deadline = time.monotonic() + timeout
+    while router.stats()[url]["outstanding"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return router.stats()[url]
+
+
+def test_idle_endpoints_take_turns_and_a_preferred_one_is_used_while_healthy(ollama, backup):
+    router = OllamaRouter([ollama.url, backup.url], ollama.model, health_interval=0)
+    served = [router.generate("Summarize.")[1]["endpoint"] for _ in range(4)]
+    assert sorted(served) == sorted([ollama.url, backup.url] * 2)
+
+    assert {router.generate("Summarize.", prefer=backup.url)[1]["endpoint"] for _ in range(3)} == {backup.url}
+    router.endpoints[1].healthy = False
+    assert router.generate("Summarize.", prefer=backup.url)[1]["endpoint"] == ollama.url
+
+
+def test_a_failing_endpoint_is_skipped_and_taken_out_of_rotation(ollama, backup):
+    router = OllamaRouter([ollama.url, backup.url], ollama.model, failure_threshold=2, health_interval=0)
+    ollama.available = False
+    for _ in range(4):
+        text, info = router.generate("Summarize.")
+        assert text.startswith("token0") and info["endpoint"] == backup.url
+    assert not router.endpoints[0].healthy
+    # Out of rotation, it is no longer tried first.
+    assert router.stats()[ollama.url]["errors"] == 2
+
+    backup.available = False
+    with pytest.raises(ollama_client.ResponseError):
+        router.generate("Summarize.")
+
+
+def test_a_slow_request_is_hedged_to_another_endpoint(backup):
+    with StubOllamaServer(first_token_latency=0.5, output_tokens=5) as slow:
+        router = OllamaRouter([slow.url, backup.url], slow.model, hedge_after=0.05, health_interval=0)
+        started = time.monotonic()
+        text, info = router.generate("Summarize.")
+        assert time.monotonic() - started < 0.4
+        assert info["endpoint"] == backup.url
+        stats = router.stats()
+        assert (stats[backup.url]["hedges"], stats[backup.url]["hedge_wins"]) == (1, 1)
+        # The losing attempt is cancelled rather than left to finish.
+        assert _settled(router, slow.url)["cancelled"] == 1
+
+        # Preferring an endpoint turns hedging off.
+        assert router.generate("Summarize.", prefer=slow.url, timeout=5)[1]["endpoint"] == slow.url
+
+
+def test_a_request_past_its_deadline_times_out():
+    with StubOllamaServer(first_token_latency=0.5, output_tokens=5) as slow:
+        router = OllamaRouter([slow.url], slow.model, health_interval=0)
+        with pytest.raises(TimeoutError):
+            router.generate("Summarize.", timeout=0.1)
+        assert _settled(router, slow.url)["cancelled"] == 1
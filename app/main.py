@@ -1,12 +1,27 @@
+import time
+
+# Streamlit reruns this script on every interaction; imports and the cached resources below are
+# only paid for on the first run in the process, and the rerun spans show what is left.
+rerun_start = time.perf_counter()
+
 import streamlit as st
 import os
 import logging
 import datetime
-import time
-from ai_handlers import AIHandler
-from utils import load_env_variables, log_tokens, DBOracle
-import google.generativeai as genai
-import docx
+import math
+import uuid
+import zipfile
+from utils import load_env_variables, DBOracle
+from template_cache import get_template_cache
+from audit_log import get_audit_writer
+from metrics import increment, record_span, span, start_metrics_server
+from ingest import read_transcript, TranscriptTooLarge, UnsupportedTranscript
+from analytics import get_usage_rollup
+from scheduler import Overloaded
+from summarize import EXTRACTIVE, SummaryRequest, available_engines, summarizer_from_env
+from service_client import SummaryServiceClient
+
+record_span("rerun", time.perf_counter() - rerun_start, phase="imports")
 
 # Configure logger
 logging.basicConfig(
@@ -15,9 +30,9 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
 )
 
-# Load environment variables
-google_api_key = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=google_api_key)
+# Expose span histograms and counters for scraping when a port is configured
+if os.getenv("METRICS_PORT"):
+    start_metrics_server(int(os.getenv("METRICS_PORT")))
 
 # Database credentials
 DB_USER = os.getenv("DB_USER")
@@ -25,14 +40,70 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_DSN = "UATGVPDB.ITRANS.INT/GVPUAT2"
 # os.getenv("DB_DSN")
 
+# With SUMMARY_SERVICE_URL set, the app is a thin client of the summary service (see service.py)
+# and does no summarizing, template reads or logging itself.
+SUMMARY_SERVICE_URL = os.getenv("SUMMARY_SERVICE_URL")
+
+
+@st.cache_resource(show_spinner=False)
+def load_db():
+    """The database handle, built once per process (sessions come from a pool shared by all Streamlit sessions)."""
+    return DBOracle(
+        DB_USER,
+        DB_PASSWORD,
+        DB_DSN,
+        pool_min=int(os.getenv("DB_POOL_MIN", "1")),
+        pool_max=int(os.getenv("DB_POOL_MAX", "4")),
+        acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def load_summarizer():
+    """
+    The summarize pipeline, built once per process (see summarize.py), with its templates and
+    audit log. The Ollama settings (OLLAMA_URLS, OLLAMA_TIMEOUT, ...), the scheduler budgets and
+    the retrieval and fallback settings are read from the environment there.
+    """
+    db = load_db()
+    # Usage rollups for the analytics page are brought up to date in the background
+    analytics_refresh_seconds = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "300"))
+    if analytics_refresh_seconds:
+        get_usage_rollup(db).start(analytics_refresh_seconds)
+    # Log and feedback rows are written in batches by a background thread, off the request path
+    audit_log = get_audit_writer(db)
+    # Templates are cached for the whole process and re-read only when INTELLINOTES_PROMPTS changes
+    template_cache = get_template_cache(db, ttl=int(os.getenv("TEMPLATE_CACHE_TTL", "300")))
+    return summarizer_from_env(db, audit_log, template_cache)
+
+
+@st.cache_resource(show_spinner=False)
+def load_service_client():
+    return SummaryServiceClient(SUMMARY_SERVICE_URL)
+
+
+# The summarizer and the service client take the same requests and give the same results; the
+# client also stands in for the template cache and the audit log (for feedback).
+if SUMMARY_SERVICE_URL:
+    summarizer = template_cache = audit_log = load_service_client()
+else:
+    summarizer = load_summarizer()
+    template_cache, audit_log = summarizer.template_cache, summarizer.audit_log
+
+record_span("rerun", time.perf_counter() - rerun_start, phase="setup")
+
+# RETRIEVAL_ENABLED sets the default of the sidebar checkbox for Custom Prompt passage selection.
+retrieval_enabled = os.getenv("RETRIEVAL_ENABLED", "true").lower() in ("1", "true", "yes")
 
-# Initialize database connection
-db = DBOracle(DB_USER, DB_PASSWORD, DB_DSN)
+# Behind an authenticating proxy, users are told apart by this header rather than by session.
+scheduler_user_header = os.getenv("SCHEDULER_USER_HEADER")
+
+
+def scheduler_user():
+    if scheduler_user_header and st.context.headers.get(scheduler_user_header):
+        return st.context.headers[scheduler_user_header]
+    return st.session_state.setdefault("scheduler_user", uuid.uuid4().hex)
 
-# Initialize AI handler
-ollama_base_url = "http://uatml1.itrans.int:11434/"
-ollama_model = "llama3.1"
-ai_handler = AIHandler(ollama_base_url, ollama_model)
 
 # Streamlit page configuration
 st.set_page_config(
@@ -45,6 +116,8 @@ st.set_page_config(
 # Sidebar: Template Selection
 uploaded_file = None
 meeting_type = None
+custom_prompt = ""
+use_retrieval = False
 
 
 with st.sidebar:
@@ -53,20 +126,18 @@ with st.sidebar:
     st.subheader("1. Input Transcript")
     input_method = st.radio("Choose input method", ["Upload File", "Paste Text"])
     if input_method == "Upload File":
-        uploaded_file = st.file_uploader("Upload file:", type=["txt", "docx"])
+        uploaded_file = st.file_uploader("Upload file:", type=["txt", "docx", "vtt", "srt"])
     else:
         transcript_text = st.text_area("Paste transcript here:", height=200)
 
     st.subheader("2. Select Meeting Type")
 
     try:
-        templates = db.fetch_templates()
-        if templates:
-            template_names = [template["name"] for template in templates]
-            meeting_type = st.selectbox("Choose Template", options= template_names, index=template_names.index("General Meeting"))
-            selected_prompt = next(
-                (t["prompt"] for t in templates if t["name"] == meeting_type), ""
-            )
+        with span("template_fetch", source="cache"):
+            templates = template_cache.get()
+        if templates.names:
+            meeting_type = st.selectbox("Choose Template", options= templates.names, index=templates.index_of("General Meeting"))
+            selected_prompt = templates.get(meeting_type)["prompt"] or ""
             st.info(selected_prompt, icon="ℹ️")
         else:
             st.error("No templates found in the database.")
@@ -79,79 +150,128 @@ with st.sidebar:
         custom_prompt = st.text_area("Enter your custom prompt:")
         if not custom_prompt.strip():
             st.warning("Please provide a custom prompt.")
+        use_retrieval = st.checkbox(
+            "Answer from the most relevant passages",
+            value=retrieval_enabled,
+            help="For long transcripts, sends only the passages that match the prompt. "
+                 "Untick to send the full transcript.",
+        )
 
-    # st.subheader("3. Choose AI Model")
-    # model_choice = st.radio("Select Processing Engine", ["Ollama", "Gemini Pro"], index=0)
+    # Extra templates are summarized in the same run, reusing Ollama's evaluation of the transcript.
+    extra_templates = []
+    if meeting_type:
+        extra_templates = st.multiselect(
+            "Also summarize with",
+            options=[name for name in templates.names if name not in (meeting_type, "Custom Prompt")],
+        )
 
-    model_choice = "Ollama"
+    compact_input = st.checkbox(
+        "Compact transcript before summarizing",
+        value=True,
+        help="Removes timestamps, fillers and repeated speaker labels to cut prompt tokens.",
+    )
+
+    st.subheader("3. Choose AI Model")
+    model_choice = st.radio(
+        "Select Processing Engine",
+        available_engines(),
+        index=0,
+        help=f"{EXTRACTIVE} picks key sentences, decisions and action items from the transcript "
+             "in under a second, without an AI model.",
+    )
 
 # Main Content Area
 # st.title("Meeting Summary Generator")
 if st.button("Generate Summary"):
     start_time = time.time()
     transcript = ""
-    custom_prompt = ""
-
-    if input_method == "Upload File" and uploaded_file:
-        if uploaded_file.type == "text/plain":
-            transcript = uploaded_file.read().decode("utf-8")
-        elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            doc = docx.Document(uploaded_file)
-            transcript = "\n".join(p.text for p in doc.paragraphs)
+
+    with span("ingest", source="upload" if input_method == "Upload File" else "paste"):
+        if input_method == "Upload File" and uploaded_file:
+            try:
+                transcript = read_transcript(uploaded_file, uploaded_file.name)
+            except TranscriptTooLarge as e:
+                st.error(str(e))
+                logging.warning(f"Transcript rejected: {e}")
+            except (UnsupportedTranscript, zipfile.BadZipFile):
+                st.error("Unsupported file format.")
+                logging.warning("Unsupported file uploaded.")
         else:
-            st.error("Unsupported file format.")
-            logging.warning("Unsupported file uploaded.")
-    else:
-        transcript = transcript_text.strip()
+            transcript = transcript_text.strip()
 
     if transcript:
-        with st.spinner("Processing your transcript..."):
-            prompt = custom_prompt if meeting_type == "Custom Prompt" else selected_prompt
-            try:
-                if model_choice == "Gemini Pro":
-                    response = ai_handler.generate_summary_gemini(transcript, prompt)
+        request = SummaryRequest(
+            transcript,
+            meeting_type,
+            custom_prompt=custom_prompt,
+            extra_templates=extra_templates,
+            engine=model_choice,
+            compact=compact_input,
+            retrieval=use_retrieval,
+            user=scheduler_user(),
+            user_id=int(start_time),
+        )
+        queue_pane = st.empty()
+        summary_pane = st.empty()
+
+        def show_queue(position, wait):
+            if position:
+                queue_pane.info(f"Waiting in the queue: position {position}, about {math.ceil(wait)}s to go.")
+            else:
+                queue_pane.empty()
+
+        try:
+            # Tokens are rendered as they arrive; the pane is swapped for the text area below once done.
+            with st.spinner("Processing your transcript..."):
+                result = summarizer.run(request, on_text=summary_pane.markdown, on_queue=show_queue)
+        except ValueError as e:
+            st.warning(str(e))
+        except Overloaded as e:
+            increment("summary_errors_total", model=model_choice, reason="overloaded")
+            st.warning(f"The summarizer is busy: {e} Please try again in about {math.ceil(e.retry_after)}s.")
+            logging.warning(f"Summary request refused: {e}")
+        except TimeoutError as e:
+            increment("summary_errors_total", model=model_choice, reason="timeout")
+            st.error("The summary took too long and was cancelled. Please try again.")
+            logging.warning(f"Summary generation timed out: {e}")
+        except Exception as e:
+            increment("summary_errors_total", model=model_choice)
+            st.error("Error generating summary.")
+            logging.error("Error during summary generation", exc_info=True)
+        else:
+            queue_pane.empty()
+            for kind, note in result.notes:
+                if kind == "warning":
+                    st.warning(note)
                 else:
-                    response = ai_handler.generate_summary_ollama(transcript, prompt)
-                input_tokens, output_tokens = log_tokens(transcript, response)
-                duration = round(time.time() - start_time, 2)
-
-                # Save to session state (for feedback)
-                st.session_state.update(
-                    {
-                        "transcript": transcript,
-                        "response": response,
-                        "input_tokens": input_tokens,
-                        "output_tokens": output_tokens,
-                        "duration": duration,
-                        "user_id" : int(time.time()),
-                    }
-                )       
+                    st.caption(note)
+
+            # Feedback applies to the primary template's summary.
+            st.session_state.update(
+                {
+                    "transcript": transcript,
+                    "response": result.summary,
+                    "input_tokens": result.input_tokens,
+                    "output_tokens": result.output_tokens,
+                    "duration": result.duration,
+                    "time_to_first_token": result.time_to_first_token,
+                    "user_id": int(start_time),
+                }
+            )
 
+            if len(result.summaries) > 1:
+                summary_pane.empty()
+                tabs = st.tabs(list(result.summaries))
+                for tab, (name, summary) in zip(tabs, result.summaries.items()):
+                    with tab:
+                        st.text_area(f"📋 {name} Summary", value=summary, height=300)
+                        st.download_button("Download Summary", summary, f"summary-{name}.txt", "text/plain", key=f"download-{name}")
+            else:
                 # st.subheader("📋 Meeting Summary")
                 # st.write(response)
 
-                st.text_area("📋 Generated Meeting Summary", value=response, height=300)
-
-                db.log_entry(
-                    event="Meeting Summary",
-                    model=model_choice,
-                    input_message=st.session_state.get("transcript", ""),
-                    output_message=st.session_state.get("response", ""),
-                    input_tokens=st.session_state.get("input_tokens", 0),
-                    output_tokens=st.session_state.get("output_tokens", 0),
-                    duration=st.session_state.get("duration", 0),
-                    error_message=None,
-                    user_id=st.session_state.get("user_id", ""),
-                    user_rating= None,
-                    # st.session_state.get("user_rating", None),
-                    user_feedback= "",
-                    # st.session_state.get("user_feedback", ""),
-                    created_date=datetime.datetime.now(),
-                    custom_prompt=custom_prompt if meeting_type == "Custom Prompt" else None,
-                )
-
-
-                st.download_button("Download Summary", response, "summary.txt", "text/plain")
+                summary_pane.text_area("📋 Generated Meeting Summary", value=result.summary, height=300)
+                st.download_button("Download Summary", result.summary, "summary.txt", "text/plain")
 
                 # col1, col2 = st.columns([1, 1])
 
@@ -163,11 +283,6 @@ if st.button("Generate Summary"):
                 #         for key in st.session_state.keys():
                 #             del st.session_state[key]
                 #         st.experimental_rerun()
-
-                logging.info("Summary generated successfully.")
-            except Exception as e:
-                st.error("Error generating summary.")
-                logging.error("Error during summary generation", exc_info=True)
     else:
         st.warning("Please provide a transcript.")
 
@@ -177,8 +292,8 @@ def handle_feedback_submission():
         # Generate a unique logid (you can replace this with a specific value if required)
         logid = int(time.time())  # Example: Use a timestamp as a unique identifier
 
-        # Log the feedback into the IntelliNotes_Feedback table
-        feedback_logged = db.log_feedback(
+        # Queue the feedback for the IntelliNotes_Feedback table
+        feedback_logged = audit_log.log_feedback(
             logid=logid,
             user_id=st.session_state.get("user_id", ""),  # Replace with the actual user_id if dynamic user management is implemented
             user_feedback=st.session_state.get("user_feedback", ""),
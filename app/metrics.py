@@ -0,0 +1,172 @@
+"""
+Lightweight timing spans, counters and histograms for the summarize request.
+
+Spans are timed with perf_counter, added to a fixed-bucket histogram and written to the
+application log as one JSON record each. Counters and histograms can be scraped in the
+Prometheus text format, either through render_prometheus() or the optional HTTP
+endpoint started by start_metrics_server(). Everything is in-process and lock-protected;
+recording a span costs a few microseconds, so it can stay on in production.
+"""
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds, in seconds, of the span histogram buckets.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+span_logger = logging.getLogger("metrics")
+
+
+class Histogram:
+    """A cumulative histogram with fixed bucket bounds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, keyed by name and label set."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def snapshot(self):
+        """Returns counters and histogram summaries as plain dictionaries."""
+        with self._lock:
+            return {
+                "counters": {_series(name, labels): value for (name, labels), value in self._counters.items()},
+                "histograms": {
+                    _series(name, labels): {"count": h.count, "sum": round(h.sum, 6)}
+                    for (name, labels), h in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"intellinotes_{name}{_format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"intellinotes_{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"intellinotes_{name}_count{_format_labels(labels)} {histogram.count}")
+                lines.append(f"intellinotes_{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _series(name, labels):
+    return name + _format_labels(labels)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+registry = MetricsRegistry()
+
+
+def record_span(name, seconds, **labels):
+    """Records a span that was timed elsewhere, e.g. time to first token."""
+    registry.observe("span_seconds", seconds, span=name, **labels)
+    if span_logger.isEnabledFor(logging.INFO):
+        span_logger.info("span " + json.dumps({"span": name, "duration_ms": round(seconds * 1000, 3), **labels}))
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Times the enclosed block as a named span.
+
+    The span is recorded with status="error" if the block raises.
+    """
+    start_time = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record_span(name, time.perf_counter() - start_time, status=status, **labels)
+
+
+def timed(name, **labels):
+    """Decorator that records every call of the function as a named span."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, value=1, **labels):
+    """Adds value to a counter."""
+    registry.increment(name, value, **labels)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serves /metrics in the Prometheus text format on a background thread, once per process."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        _server = ThreadingHTTPServer((host, port), Handler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
@@ -0,0 +1,81 @@
+import streamlit as st
+import os
+import datetime
+import logging
+from utils import DBOracle
+from analytics import DIMENSIONS, fetch_usage, get_usage_rollup
+
+# Usage dashboard for administrators. Everything here is read from the hourly rollups
+# (see analytics.py), never from INTELLINOTES_LOG itself.
+
+st.set_page_config(page_title="IntelliNotes Usage", page_icon="assets/favico.ico", layout="wide")
+
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_DSN = os.getenv("DB_DSN", "UATGVPDB.ITRANS.INT/GVPUAT2")
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+
+
+@st.cache_resource(show_spinner=False)
+def load_db():
+    return DBOracle(DB_USER, DB_PASSWORD, DB_DSN)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_usage(since, until, group_by, model, template, event):
+    return fetch_usage(load_db(), since, until, group_by, model or None, template or None, event or None)
+
+
+if ADMIN_PASSWORD and st.session_state.get("admin_password") != ADMIN_PASSWORD:
+    st.text_input("Admin password", type="password", key="admin_password")
+    st.stop()
+
+st.title("Usage Analytics")
+
+with st.sidebar:
+    days = st.selectbox("Period", [1, 7, 30, 90], index=1, format_func=lambda d: f"Last {d} day{'s' * (d > 1)}")
+    group_by = st.multiselect("Group by", list(DIMENSIONS), default=["model", "template"])
+    model = st.text_input("Model")
+    template = st.text_input("Template")
+    event = st.text_input("Event")
+    rollup = get_usage_rollup(load_db())
+    if st.button("Refresh rollups now"):
+        try:
+            counted = rollup.refresh_all()
+            load_usage.clear()
+            st.success(f"Added {counted} log rows.")
+        except Exception:
+            st.error("Refreshing the rollups failed.")
+            logging.error("Usage rollup refresh failed", exc_info=True)
+    if rollup.last_refresh:
+        st.caption(f"Last refreshed by this server at {rollup.last_refresh:%H:%M:%S}.")
+
+now = datetime.datetime.now()
+since = (now - datetime.timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+try:
+    totals = load_usage(since, None, (), model, template, event)
+    by_hour = load_usage(since, None, ("hour",), model, template, event)
+    rows = load_usage(since, None, tuple(group_by), model, template, event)
+except Exception:
+    st.error("Error reading usage rollups.")
+    logging.error("Error reading usage rollups", exc_info=True)
+    st.stop()
+
+if not totals:
+    st.info("No usage recorded in this period.")
+    st.stop()
+
+total = totals[0]
+columns = st.columns(5)
+columns[0].metric("Requests", f"{total['requests']:,}")
+columns[1].metric("Errors", f"{total['errors']:,}")
+columns[2].metric("p50 / p95 latency", f"{total['p50_latency']}s / {total['p95_latency']}s")
+columns[3].metric("Output tokens/s", total["output_tokens_per_second"])
+columns[4].metric("Avg rating", total["avg_rating"] or "-")
+
+st.subheader("Requests and latency by hour")
+st.line_chart(by_hour, x="hour", y=["requests", "errors"])
+st.line_chart(by_hour, x="hour", y=["p50_latency", "p95_latency"])
+
+st.subheader("Breakdown")
+st.dataframe(rows, use_container_width=True)
@@ -0,0 +1,210 @@
+"""
+Query-focused passage selection for narrow questions over long transcripts.
+
+A Custom Prompt such as "what did we decide about pricing?" only needs the parts of the
+transcript that talk about pricing. PassageIndex splits a transcript into passages of a few
+speaker turns (with split_transcript, so passages never cut a turn that fits), indexes
+them for BM25, and select() keeps the best-scoring passages that fit a token budget, in
+their original order. Passages that start in the middle of a turn are labelled with the
+speaker, and omitted stretches are marked, so the model still knows who said what.
+
+Scoring is lexical and local: no embedding service. The index is a set of numpy postings
+arrays, so a query costs a few vectorized operations per query term.
+"""
+import hashlib
+import logging
+import re
+import time
+
+import numpy as np
+
+from token_accounting import count_tokens, count_tokens_batch
+from utils import SPEAKER_LINE_PATTERN, split_transcript
+
+DEFAULT_PASSAGE_TOKENS = 200
+# BM25 term-frequency saturation and length normalization.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Inserted where selected passages are not adjacent in the transcript.
+GAP_MARKER = "[...]"
+
+WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+# "Mike Kenny: text" as written by compaction.
+SPEAKER_PREFIX = re.compile(r"^([^:\n]{1,60}):\s")
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here
+hers him his how i if in into is it its itself just let me more most my no nor not now of off on once only
+or other our ours out over own same she should so some such than that the their them then there these they
+this those through to too under until up very was we were what when where which while who whom why will
+with would you your yours yeah okay ok um uh so like just get got going know think
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word stems with stopwords removed."""
+    return [_stem(word) for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def _stem(word):
+    # A light suffix stripper: enough for "prices"/"pricing"/"priced" to meet.
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: len(word) - len(suffix)] + replacement
+    return word
+
+
+class Selection:
+    """The text chosen for a query and what it was chosen from."""
+
+    def __init__(self, text, passages, tokens, total_passages, total_tokens, full_transcript):
+        self.text = text
+        self.passages = passages
+        self.tokens = tokens
+        self.total_passages = total_passages
+        self.total_tokens = total_tokens
+        self.full_transcript = full_transcript
+
+    def describe(self):
+        if self.full_transcript:
+            return f"full transcript ({self.total_tokens} tokens)"
+        return (
+            f"{len(self.passages)} of {self.total_passages} passages, "
+            f"{self.tokens} of {self.total_tokens} tokens"
+        )
+
+
+class PassageIndex:
+    """
+    A BM25 index over the passages of one transcript.
+
+    Args:
+        text (str): The transcript, as it will be sent to the model.
+        passage_tokens (int): Target passage size in tokens.
+        encoding_name (str): Encoding used to measure passages, as in log_tokens.
+    """
+
+    def __init__(self, text, passage_tokens=DEFAULT_PASSAGE_TOKENS, encoding_name="cl100k_base"):
+        start_time = time.perf_counter()
+        self.key = transcript_key(text)
+        self.text = text
+        self.encoding_name = encoding_name
+        self.passages = split_transcript(text, passage_tokens, encoding_name) if text.strip() else []
+        self.passage_tokens = np.array(count_tokens_batch(self.passages, encoding_name), dtype=np.int64)
+        self.total_tokens = count_tokens(text, encoding_name)
+        self.speakers = _leading_speakers(self.passages)
+        self._build([tokenize(passage) for passage in self.passages])
+        self.build_seconds = time.perf_counter() - start_time
+        logging.getLogger(__name__).info(
+            f"Indexed {len(self.passages)} passages ({len(self.vocabulary)} terms) in {self.build_seconds:.2f}s."
+        )
+
+    def _build(self, passage_terms):
+        self.vocabulary = {}
+        doc_ids, term_ids = [], []
+        for doc_id, terms in enumerate(passage_terms):
+            for term in terms:
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+            doc_ids.extend([doc_id] * len(terms))
+        count = len(passage_terms)
+        self.lengths = np.array([len(terms) for terms in passage_terms], dtype=np.float64)
+        self.average_length = self.lengths.mean() if count and self.lengths.any() else 1.0
+
+        # Postings sorted by term, then passage: one (passage, frequency) pair per distinct pair.
+        codes = np.array(term_ids, dtype=np.int64) * max(count, 1) + np.array(doc_ids, dtype=np.int64)
+        codes, frequencies = np.unique(codes, return_counts=True)
+        self.posting_docs = codes % max(count, 1)
+        self.posting_frequencies = frequencies.astype(np.float64)
+        self.term_starts = np.searchsorted(codes // max(count, 1), np.arange(len(self.vocabulary) + 1))
+        document_frequencies = np.diff(self.term_starts)
+        self.idf = np.log1p((count - document_frequencies + 0.5) / (document_frequencies + 0.5))
+
+    def scores(self, query):
+        """BM25 score of every passage for the query."""
+        scores = np.zeros(len(self.passages))
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / self.average_length)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_starts[term_id], self.term_starts[term_id + 1]
+            docs = self.posting_docs[start:end]
+            frequencies = self.posting_frequencies[start:end]
+            scores[docs] += self.idf[term_id] * frequencies * (BM25_K1 + 1) / (frequencies + norms[docs])
+        return scores
+
+    def select(self, query, token_budget):
+        """
+        Returns the passages most relevant to query that fit in token_budget, in order.
+
+        The whole transcript is returned when it already fits, or when nothing in it matches
+        the query (the question is then presumably about the meeting as a whole).
+        """
+        if self.total_tokens <= token_budget or not self.passages:
+            return self._full()
+        scores = self.scores(query)
+        ranked = [index for index in np.argsort(-scores, kind="stable") if scores[index] > 0]
+        if not ranked:
+            return self._full()
+
+        chosen, used = [], 0
+        for index in ranked:
+            # Speaker labels and gap markers cost a few tokens each.
+            cost = int(self.passage_tokens[index]) + 8
+            if used + cost > token_budget:
+                continue
+            chosen.append(int(index))
+            used += cost
+        chosen.sort()
+
+        parts, expected = [], 0
+        for index in chosen:
+            passage = self.passages[index]
+            if index != expected:
+                parts.append(GAP_MARKER)
+                # The turn this passage continues was left out; say whose it is.
+                speaker = self.speakers[index]
+                if speaker and not _starts_turn(passage):
+                    passage = f"({speaker}, continuing) {passage}"
+            parts.append(passage)
+            expected = index + 1
+        if expected < len(self.passages):
+            parts.append(GAP_MARKER)
+        text = "\n\n".join(parts)
+        return Selection(
+            text, chosen, count_tokens(text, self.encoding_name), len(self.passages), self.total_tokens, False
+        )
+
+    def _full(self):
+        return Selection(
+            self.text, list(range(len(self.passages))), self.total_tokens,
+            len(self.passages), self.total_tokens, True,
+        )
+
+
+def transcript_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _speaker_of(line):
+    match = SPEAKER_PREFIX.match(line)
+    if match:
+        return match.group(1).strip()
+    match = SPEAKER_LINE_PATTERN.match(line)
+    if match:
+        return line[:match.start(1)].strip()
+    return None
+
+
+def _starts_turn(passage):
+    return _speaker_of(passage.split("\n", 1)[0]) is not None
+
+
+def _leading_speakers(passages):
+    """For each passage, the speaker whose turn is in progress where it starts."""
+    speakers, current = [], None
+    for passage in passages:
+        speakers.append(current)
+        for line in passage.split("\n"):
+            current = _speaker_of(line) or current
+    return speakers
@@ -0,0 +1,59 @@
+import pytest
+
+from retrieval import GAP_MARKER, PassageIndex, tokenize
+
+TURNS = [
+    "Alice: Welcome everyone, today we review the launch plan and the budget.",
+    "Bob: The pricing for the premium tier is still open, we priced it too high.",
+    "Carol: Marketing has the campaign assets ready for the launch announcement.",
+    "Bob: Support wants a training session before the launch goes out.",
+    "Alice: Final pricing decision: premium prices drop ten percent next month.",
+    "Carol: I will update the website copy and the partner newsletter.",
+]
+
+
+@pytest.fixture
+def index(word_tokens):
+    # One turn per passage: each is eleven to fifteen words, so two never fit in sixteen.
+    return PassageIndex("\n\n".join(TURNS), passage_tokens=16)
+
+
+def test_tokenize_drops_stopwords_and_meets_word_forms():
+    assert tokenize("What did we decide about the prices?") == ["decide", "pric"]
+    assert tokenize("pricing") == tokenize("priced") == tokenize("prices")
+
+
+def test_passages_are_ranked_by_bm25(index):
+    assert index.passages == TURNS
+    scores = index.scores("premium pricing")
+    # Both match both terms; without its stopwords the second turn is the shorter one.
+    assert scores[1] > scores[4] > 0
+    assert scores[0] == scores[2] == scores[3] == scores[5] == 0
+    # "launch" is in half the passages, "newsletter" in one: the rare term counts for more.
+    assert index.scores("newsletter")[5] > index.scores("launch").max()
+
+
+def test_selection_keeps_the_best_passages_within_the_budget_in_order(index):
+    # Each passage costs its tokens plus eight for labels and markers: 23 and 19 here.
+    selection = index.select("premium pricing", token_budget=45)
+    assert selection.passages == [1, 4] and not selection.full_transcript
+    assert selection.text.split("\n\n") == [GAP_MARKER, TURNS[1], GAP_MARKER, TURNS[4], GAP_MARKER]
+    assert selection.describe() == f"2 of 6 passages, {selection.tokens} of {index.total_tokens} tokens"
+
+    # Room for one passage only: the best one.
+    assert index.select("premium pricing", token_budget=25).passages == [1]
+
+
+def test_a_passage_that_continues_a_turn_is_labelled_with_its_speaker(word_tokens):
+    long_turn = "Alice: " + " ".join(["filler"] * 20) + "\n" + " ".join(["filler"] * 5) + " the budget is frozen."
+    index = PassageIndex(long_turn + "\n\nBob: Noted.", passage_tokens=22)
+    selection = index.select("budget frozen", token_budget=20)
+    assert selection.passages == [1]
+    assert selection.text.startswith(f"{GAP_MARKER}\n\n(Alice, continuing) filler")
+
+
+def test_the_whole_transcript_is_used_when_it_fits_or_nothing_matches(index):
+    assert index.select("premium pricing", token_budget=1000).full_transcript
+    unmatched = index.select("quarterly headcount", token_budget=45)
+    assert unmatched.full_transcript and unmatched.text == index.text
+    assert unmatched.describe() == f"full transcript ({index.total_tokens} tokens)"
@@ -0,0 +1,373 @@
+"""
+Admission control and fair scheduling for summary requests.
+
+Every Streamlit session used to call Ollama directly, so one user's 50k-token transcript
+could hold up everyone else's short ones. FairScheduler sits in front of AIHandler:
+
+- Each request's cost is estimated up front in tokens (prompt and transcript, counted with
+  the log_tokens encoder, plus the expected output of every request it fans out to).
+- Requests start only within the token-per-minute budgets, global and per user, and with at
+  most max_running in flight.
+- Waiting requests are ordered by weighted fair queueing on cost: each user's requests get
+  virtual finish times that advance by their cost, and the smallest finish time starts
+  first. A user with one short request is not stuck behind another user's long queue.
+- When the queue is full, a user has too much queued, or the estimated wait is too long,
+  submit() fails straight away with Overloaded and a retry-after hint.
+
+Tickets report their queue position and estimated wait while they wait, for the UI.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from metrics import increment, record_span
+from token_accounting import count_tokens_batch
+
+# Output tokens assumed per request when estimating cost.
+EXPECTED_OUTPUT_TOKENS = 600
+# How often waiting tickets wake up to report progress, in seconds.
+PROGRESS_INTERVAL = 1.0
+
+
+class Overloaded(RuntimeError):
+    """Raised when a request is refused; retry_after is a hint in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_cost(transcript, prompts, max_chunk_tokens=3000, output_tokens=EXPECTED_OUTPUT_TOKENS):
+    """
+    Estimates the tokens a summary will cost: everything it sends plus what it generates.
+
+    Args:
+        transcript (str): The transcript as it will be sent.
+        prompts (list): The prompt(s) it will be summarized with.
+        max_chunk_tokens (int): Chunk size of the map-reduce path, to count its requests.
+        output_tokens (int): Expected output per request.
+    """
+    transcript_tokens, *prompt_tokens = count_tokens_batch([transcript, *prompts])
+    chunks = max(1, math.ceil(transcript_tokens / max_chunk_tokens))
+    # One request per chunk and prompt, plus a reduce request over the partial summaries.
+    requests = chunks if chunks == 1 else chunks + 1
+    reduce_tokens = 0 if chunks == 1 else chunks * output_tokens
+    return sum(
+        transcript_tokens + requests * tokens + reduce_tokens + requests * output_tokens
+        for tokens in prompt_tokens
+    )
+
+
+class TokenBucket:
+    """
+    A token-per-minute budget that refills continuously.
+
+    A request larger than the whole bucket may start once the bucket is full, leaving it in
+    debt; later requests then wait for the debt to be paid off.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = tokens_per_minute
+        self.level = float(tokens_per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, now):
+        """Seconds until cost can be taken; 0 if it can be now."""
+        self._refill(now)
+        needed = min(cost, self.capacity)
+        return max(0.0, (needed - self.level) / self.rate)
+
+    def take(self, cost, now):
+        self._refill(now)
+        self.level -= cost
+
+
+class Ticket:
+    """One request's place in the scheduler; use it as a context manager around the work."""
+
+    def __init__(self, scheduler, user, cost):
+        self.scheduler = scheduler
+        self.user = user
+        self.cost = cost
+        self.finish_tag = 0.0
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished = False
+
+    @property
+    def started(self):
+        return self.started_at is not None
+
+    def wait(self, timeout=None, on_progress=None):
+        """
+        Blocks until the request may start.
+
+        Args:
+            timeout (float): Seconds to wait at most; None waits as long as it takes.
+            on_progress (callable): Called with (position, estimated wait in seconds) while
+                waiting, about once a second.
+
+        Raises:
+            TimeoutError: If timeout passes first; the ticket is withdrawn.
+        """
+        return self.scheduler._wait(self, timeout, on_progress)
+
+    def release(self):
+        self.scheduler._release(self)
+
+    def __enter__(self):
+        if not self.started:
+            self.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+
+class FairScheduler:
+    """
+    Admission control and weighted fair queueing across users.
+
+    Args:
+        max_running (int): Requests in flight at once.
+        global_tokens_per_minute (int): Budget across all users; None for no limit.
+        user_tokens_per_minute (int): Budget per user; None for no limit.
+        max_queue (int): Waiting requests beyond which new ones are refused.
+        max_queued_per_user (int): Waiting requests one user may have.
+        max_wait (float): Refuse requests whose estimated wait is longer than this, in seconds.
+    """
+
+    def __init__(self, max_running=4, global_tokens_per_minute=None, user_tokens_per_minute=None,
+                 max_queue=50, max_queued_per_user=3, max_wait=300.0):
+        self.max_running = max_running
+        self.global_bucket = TokenBucket(global_tokens_per_minute) if global_tokens_per_minute else None
+        self.user_tokens_per_minute = user_tokens_per_minute
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.max_wait = max_wait
+        self.logger = logging.getLogger(__name__)
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._user_buckets = {}
+        self._user_finish_tags = {}
+        self._virtual_time = 0.0
+        self._running = set()
+        # Tokens processed per second by the backend, smoothed over completed requests.
+        self._throughput = None
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def submit(self, user, cost):
+        """
+        Queues a request, or refuses it straight away.
+
+        Returns:
+            Ticket: Wait on it, then run the request inside it (with ticket: ...).
+
+        Raises:
+            Overloaded: If the queue is full, the user has too many requests waiting, or the
+                estimated wait exceeds max_wait.
+        """
+        with self._condition:
+            now = time.monotonic()
+            waiting = sum(len(queue) for queue in self._queues.values())
+            user_waiting = len(self._queues.get(user, ()))
+            if waiting >= self.max_queue:
+                self._reject(user, "queue_full")
+                raise Overloaded("Too many requests are waiting.", self._drain_seconds(now))
+            if user_waiting >= self.max_queued_per_user:
+                self._reject(user, "user_queue_full")
+                raise Overloaded("You already have requests waiting.", self._drain_seconds(now, user))
+
+            ticket = Ticket(self, user, cost)
+            start_tag = max(self._virtual_time, self._user_finish_tags.get(user, 0.0))
+            ticket.finish_tag = start_tag + cost
+            estimate = self._estimate_wait(ticket, now, extra=[ticket])
+            if self.max_wait and estimate > self.max_wait and (waiting or self._running):
+                self._reject(user, "wait_too_long")
+                raise Overloaded(f"The estimated wait is {estimate:.0f}s.", estimate)
+
+            self._user_finish_tags[user] = ticket.finish_tag
+            self._queues.setdefault(user, deque()).append(ticket)
+            self.admitted += 1
+            increment("scheduler_admitted_total")
+            self._dispatch(now)
+            return ticket
+
+    def stats(self):
+        with self._condition:
+            return {
+                "running": len(self._running),
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "users_waiting": sum(1 for queue in self._queues.values() if queue),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "tokens_per_second": round(self._throughput, 1) if self._throughput else None,
+            }
+
+    def position(self, ticket):
+        """1-based place among waiting requests in dispatch order; 0 once started."""
+        with self._condition:
+            if ticket.started:
+                return 0
+            return 1 + sum(1 for other in self._waiting() if other.finish_tag < ticket.finish_tag)
+
+    def _wait(self, ticket, timeout, on_progress):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not ticket.started:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    self._withdraw(ticket)
+                    raise TimeoutError(f"Still queued after {timeout}s.")
+                if on_progress is not None:
+                    position = 1 + sum(1 for other in self._waiting() if other.finish_tag < ticket.finish_tag)
+                    estimate = self._estimate_wait(ticket, now)
+                    self._condition.release()
+                    try:
+                        on_progress(position, estimate)
+                    finally:
+                        self._condition.acquire()
+                    if ticket.started:
+                        break
+                pause = PROGRESS_INTERVAL if deadline is None else min(PROGRESS_INTERVAL, max(0.0, deadline - now))
+                self._condition.wait(pause)
+                self._dispatch(time.monotonic())
+        record_span("scheduler_wait", ticket.started_at - ticket.submitted_at)
+        return ticket
+
+    def _release(self, ticket):
+        with self._condition:
+            if ticket.finished:
+                return
+            ticket.finished = True
+            now = time.monotonic()
+            if ticket in self._running:
+                self._running.discard(ticket)
+                self.completed += 1
+                elapsed = now - ticket.started_at
+                if elapsed > 0:
+                    # Tokens per second across the concurrent slots, smoothed.
+                    rate = ticket.cost / elapsed * max(1, min(self.max_running, len(self._running) + 1))
+                    self._throughput = rate if self._throughput is None else 0.8 * self._throughput + 0.2 * rate
+            else:
+                self._withdraw(ticket)
+            self._dispatch(now)
+
+    def _withdraw(self, ticket):
+        queue = self._queues.get(ticket.user)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self._condition.notify_all()
+
+    def _waiting(self):
+        return [ticket for queue in self._queues.values() for ticket in queue]
+
+    def _dispatch(self, now):
+        """Starts waiting requests while there are free slots and budget, smallest finish tag first."""
+        started = False
+        while len(self._running) < self.max_running:
+            ticket = None
+            for candidate in sorted((queue[0] for queue in self._queues.values() if queue), key=lambda t: t.finish_tag):
+                if self.global_bucket and self.global_bucket.wait_time(candidate.cost, now):
+                    # Hold the global budget for this one rather than let smaller requests starve it.
+                    break
+                if self.user_tokens_per_minute and self._user_bucket(candidate.user).wait_time(candidate.cost, now):
+                    # Over its own budget; other users go ahead meanwhile.
+                    continue
+                ticket = candidate
+                break
+            if ticket is None:
+                break
+            self._queues[ticket.user].popleft()
+            if self.global_bucket:
+                self.global_bucket.take(ticket.cost, now)
+            if self.user_tokens_per_minute:
+                self._user_bucket(ticket.user).take(ticket.cost, now)
+            self._virtual_time = max(self._virtual_time, ticket.finish_tag - ticket.cost)
+            ticket.started_at = now
+            self._running.add(ticket)
+            started = True
+        for user in [user for user, queue in self._queues.items() if not queue]:
+            del self._queues[user]
+        self._forget_idle_users(now)
+        if started:
+            self._condition.notify_all()
+
+    def _forget_idle_users(self, now):
+        """
+        Drops the budget and finish tag of users with nothing queued or running.
+
+        A user's bucket is kept until it is full again, since a new one would hand back the
+        tokens just spent. Its finish tag goes with it: a user who has been idle that long
+        starts again from the virtual time, like a new one.
+        """
+        busy = {*self._queues, *(ticket.user for ticket in self._running)}
+        for user in [user for user in {*self._user_buckets, *self._user_finish_tags} if user not in busy]:
+            bucket = self._user_buckets.get(user)
+            if bucket is not None:
+                bucket._refill(now)
+                if bucket.level < bucket.capacity:
+                    continue
+                del self._user_buckets[user]
+            self._user_finish_tags.pop(user, None)
+
+    def _user_bucket(self, user):
+        bucket = self._user_buckets.get(user)
+        if bucket is None:
+            bucket = self._user_buckets[user] = TokenBucket(self.user_tokens_per_minute)
+        return bucket
+
+    def _budget_wait(self, ticket, now):
+        wait = 0.0
+        if self.global_bucket:
+            wait = self.global_bucket.wait_time(ticket.cost, now)
+        if self.user_tokens_per_minute:
+            wait = max(wait, self._user_bucket(ticket.user).wait_time(ticket.cost, now))
+        return wait
+
+    def _estimate_wait(self, ticket, now, extra=()):
+        """Seconds until ticket starts: the work ahead of it at the observed rate, and its budgets."""
+        ahead = [other for other in self._waiting() + list(extra)
+                 if other is not ticket and other.finish_tag < ticket.finish_tag]
+        tokens_ahead = sum(other.cost for other in ahead)
+        if len(self._running) >= self.max_running:
+            # Roughly half of the running work is left, on average.
+            tokens_ahead += sum(other.cost for other in self._running) / 2
+        estimate = tokens_ahead / self._throughput if self._throughput else 0.0
+        if self.global_bucket:
+            estimate = max(estimate, (tokens_ahead + ticket.cost - self.global_bucket.level) / self.global_bucket.rate)
+        return max(estimate, self._budget_wait(ticket, now), 0.0)
+
+    def _drain_seconds(self, now, user=None):
+        waiting = [t for t in self._waiting() if user is None or t.user == user]
+        if not waiting:
+            return 1.0
+        return max(1.0, max(self._estimate_wait(ticket, now) for ticket in waiting))
+
+    def _reject(self, user, reason):
+        self.rejected += 1
+        increment("scheduler_rejected_total", reason=reason)
+        self.logger.warning(f"Request from {user} refused: {reason}.")
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name="summaries", **kwargs):
+    """Returns the process-wide scheduler with this name."""
+    with _schedulers_lock:
+        if name not in _schedulers:
+            _schedulers[name] = FairScheduler(**kwargs)
+        return _schedulers[name]
@@ -0,0 +1,165 @@
+import threading
+import time
+
+import pytest
+
+from ai_handlers import SummaryStream
+from scheduler import FairScheduler, Overloaded, TokenBucket
+from single_flight import SingleFlight
+from summarize import SummaryRequest, Summarizer
+from summary_cache import SummaryCache
+from template_cache import TemplateSnapshot
+
+
+def test_waiting_requests_start_smallest_finish_tag_first():
+    scheduler = FairScheduler(max_running=1, max_queue=10, max_queued_per_user=10, max_wait=0)
+    running = scheduler.submit("alice", 1000)
+    big = [scheduler.submit("alice", 1000) for _ in range(3)]
+    small = scheduler.submit("bob", 100)
+    assert running.started
+    assert scheduler.position(small) == 1
+    assert [scheduler.position(ticket) for ticket in big] == [2, 3, 4]
+
+    running.release()
+    assert small.started and not any(ticket.started for ticket in big)
+    small.release()
+    assert big[0].started and not big[1].started
+    assert (scheduler.stats()["running"], scheduler.stats()["waiting"]) == (1, 2)
+
+
+def test_full_queue_is_refused_with_a_retry_hint():
+    scheduler = FairScheduler(max_running=1, max_queue=2, max_queued_per_user=5, max_wait=0)
+    scheduler.submit("alice", 10)
+    scheduler.submit("alice", 10)
+    scheduler.submit("bob", 10)
+    with pytest.raises(Overloaded) as refused:
+        scheduler.submit("carol", 10)
+    assert refused.value.retry_after >= 1.0
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_one_user_cannot_fill_the_queue():
+    scheduler = FairScheduler(max_running=1, max_queue=10, max_queued_per_user=1, max_wait=0)
+    scheduler.submit("alice", 10)
+    scheduler.submit("alice", 10)
+    with pytest.raises(Overloaded):
+        scheduler.submit("alice", 10)
+    assert not scheduler.submit("bob", 10).started
+
+
+def test_long_estimated_wait_is_refused():
+    scheduler = FairScheduler(max_running=1, global_tokens_per_minute=600, max_wait=30)
+    scheduler.submit("alice", 600)
+    with pytest.raises(Overloaded) as refused:
+        scheduler.submit("bob", 600)
+    assert refused.value.retry_after > 30
+
+
+def test_wait_timeout_withdraws_the_ticket():
+    scheduler = FairScheduler(max_running=1, max_wait=0)
+    running = scheduler.submit("alice", 10)
+    waiting = scheduler.submit("bob", 10)
+    with pytest.raises(TimeoutError):
+        waiting.wait(timeout=0.1)
+    assert scheduler.stats()["waiting"] == 0
+    running.release()
+    assert not waiting.started
+
+
+def test_release_starts_the_next_waiter():
+    scheduler = FairScheduler(max_running=1, max_wait=0)
+    first = scheduler.submit("alice", 10)
+    second = scheduler.submit("bob", 10)
+    progress = []
+    threading.Timer(0.1, first.release).start()
+    second.wait(timeout=5, on_progress=lambda position, wait: progress.append(position))
+    assert second.started
+    assert progress[0] == 1
+
+
+def test_token_bucket_allows_one_oversized_request_then_waits_for_the_debt():
+    bucket = TokenBucket(600)
+    assert bucket.wait_time(1200, now=bucket.updated) == 0
+    bucket.take(1200, now=bucket.updated)
+    assert bucket.wait_time(10, now=bucket.updated) == pytest.approx(61.0)
+
+
+def test_idle_users_are_forgotten_once_their_budget_has_refilled():
+    scheduler = FairScheduler(max_running=1, user_tokens_per_minute=600, max_wait=0)
+    with scheduler.submit("alice", 60):
+        waiting = scheduler.submit("bob", 60)
+    with waiting:
+        # Alice has spent her budget; forgetting it would hand the tokens back.
+        assert set(scheduler._user_buckets) == set(scheduler._user_finish_tags) == {"alice", "bob"}
+
+    # Six seconds at ten tokens a second puts the 60 back.
+    later = time.monotonic() + 6
+    scheduler._dispatch(later)
+    assert scheduler._user_buckets == {} and scheduler._user_finish_tags == {}
+
+
+def test_without_user_budgets_users_are_forgotten_when_done():
+    scheduler = FairScheduler(max_running=1, max_wait=0)
+    with scheduler.submit("alice", 60):
+        assert set(scheduler._user_finish_tags) == {"alice"}
+    assert scheduler._user_finish_tags == {}
+
+
+class _Handler:
+    ollama_model = "stub"
+    max_chunk_tokens = 3000
+
+    def __init__(self):
+        self.calls = 0
+
+    def stream_summary_ollama(self, transcript, prompt):
+        self.calls += 1
+
+        def fragments():
+            for word in ("The", " summary."):
+                time.sleep(0.1)
+                yield word
+
+        return SummaryStream(fragments())
+
+
+class _Templates:
+    def get(self):
+        return TemplateSnapshot([{"name": "Brief", "prompt": "Summarize briefly."}])
+
+
+class _AuditLog:
+    def __init__(self):
+        self.entries = []
+
+    def log_entry(self, **entry):
+        self.entries.append(entry)
+
+
+def test_identical_requests_do_not_deadlock_on_one_slot(word_tokens):
+    handler, audit_log = _Handler(), _AuditLog()
+    scheduler = FairScheduler(max_running=1, max_wait=0)
+    summarizer = Summarizer(handler, _Templates(), audit_log, SummaryCache(), SingleFlight("test"), scheduler)
+    request = SummaryRequest("Alice: We ship on Friday.", "Brief", compact=False, user="alice")
+    first, second = summarizer.prepare(request), summarizer.prepare(request)
+    assert first.ticket.started and not second.ticket.started
+
+    results = {}
+
+    def execute(name, prepared):
+        results[name] = summarizer.execute(prepared)
+
+    # The queued request leads the single flight, so the running one has to give up its slot.
+    leader = threading.Thread(target=execute, args=("second", second), daemon=True)
+    leader.start()
+    time.sleep(0.2)
+    follower = threading.Thread(target=execute, args=("first", first), daemon=True)
+    follower.start()
+    leader.join(5)
+    follower.join(5)
+
+    assert not leader.is_alive() and not follower.is_alive()
+    assert handler.calls == 1
+    assert results["first"].summary == results["second"].summary == "The summary."
+    assert results["first"].coalesced and not results["second"].coalesced
+    assert scheduler.stats()["running"] == scheduler.stats()["waiting"] == 0
@@ -0,0 +1,615 @@
+"""
+HTTP API for summaries, so the summarize pipeline can be scaled apart from the Streamlit UI.
+
+Endpoints:
+    GET  /healthz                 Liveness, with this worker's scheduler and job counts.
+    GET  /v1/templates            The templates, as read from INTELLINOTES_PROMPTS.
+    GET  /v1/engines              The engines a request may name.
+    POST /v1/jobs                 Submits a SummaryRequest (JSON, see summarize.py). 202 with the
+                                  job; 400 if it is invalid; 429 with Retry-After if refused.
+    GET  /v1/jobs/<id>            The job: status, queue position, text so far, and its result.
+    GET  /v1/jobs/<id>/stream     Server-sent events: "queued" while it waits, "text" with each
+                                  new piece of the summary, then "done" or "failed" with the job.
+    POST /v1/feedback             Records feedback on a summary, as the app's feedback form does.
+    POST /v1/meetings/<id>/segments
+                                  Appends a segment ({"text", "sequence", and "template" or
+                                  "custom_prompt" to start the meeting}) to a live meeting; its
+                                  summary is folded in the background (see live_summary.py).
+    GET  /v1/meetings/<id>        The live meeting's rolling summary and progress.
+    POST /v1/meetings/<id>/finish Folds what is left and returns the final summary.
+
+The parent process binds the port and forks --workers processes that all accept on it. Each
+worker has its own AIHandler, database pool, caches and scheduler (so SCHEDULER_* budgets apply
+per worker), and runs the jobs it accepts on a thread pool. Jobs are kept in a SQLite file
+shared by the workers (see jobs.py), so any of them can answer for any job. SIGTERM or SIGINT
+shuts down gracefully: workers stop accepting, finish running jobs for up to --drain-seconds,
+flush the audit log and exit. A worker that dies is replaced and its jobs are failed; audit
+records it had spilled (audit_spill.<pid>.jsonl in AUDIT_SPILL_DIR) are replayed by the next
+worker to start.
+
+A live meeting's state is in the memory of one worker, picked by hashing its id. Each worker
+also listens on a private port of its own, and forwards meeting requests it accepts for
+another worker's meetings there. Meetings of a worker that dies are lost.
+
+Configuration comes from the same environment variables as the app (OLLAMA_*, SCHEDULER_*,
+DB_*, ...). With --stub, it runs against a StubOllamaServer and a StubDB instead.
+
+Example:
+    python app/service.py --port 8600 --workers 4
+    python app/service.py --stub --port 8600 --workers 2
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from audit_log import get_audit_writer
+from jobs import DONE, FINISHED, QUEUED, JobStore
+from live_summary import SegmentOutOfOrder, UnknownMeeting, get_live_summarizer
+from metrics import increment, start_metrics_server
+from scheduler import Overloaded
+from summarize import SummaryRequest, available_engines, resolve_prompts, summarizer_from_env
+from template_cache import get_template_cache
+
+JOB_PATH = re.compile(r"^/v1/jobs/([0-9a-f]{32})(/stream)?$")
+MEETING_PATH = re.compile(r"^/v1/meetings/([A-Za-z0-9_.-]{1,64})(?:/(segments|finish))?$")
+# How long a forwarded meeting request may take; finishing a meeting waits for its last fold.
+MEETING_FORWARD_TIMEOUT = 600
+# Each worker spills audit records it cannot write to its own file; see _adopt_orphaned_spills().
+SPILL_FILE = re.compile(r"^audit_spill\.(\d+)\.jsonl$")
+# How often a running job's text is saved for pollers, and how often streams look for it.
+PARTIAL_INTERVAL = 0.25
+STREAM_POLL_INTERVAL = 0.2
+
+
+class SummaryService:
+    """
+    The jobs of one worker process.
+
+    Args:
+        summarizer (Summarizer): Runs the jobs.
+        jobs (JobStore): Where job state is shared with the other workers.
+        audit_log (AuditLogWriter): Receives feedback.
+        max_jobs (int): Jobs run at once; further ones wait in the scheduler's order.
+        live (LiveSummarizer): Holds the live meetings of this worker.
+        meeting_peers (list): The private address of every worker, by index; None if this is the only one.
+        worker_index (int): This worker's place in meeting_peers.
+    """
+
+    def __init__(self, summarizer, jobs, audit_log, max_jobs=16, live=None, meeting_peers=None, worker_index=0):
+        self.summarizer = summarizer
+        self.jobs = jobs
+        self.audit_log = audit_log
+        self.live = live
+        self.meeting_peers = meeting_peers or []
+        self.worker_index = worker_index
+        self.logger = logging.getLogger(__name__)
+        self.stopping = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="summary-job")
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def submit(self, payload):
+        """
+        Validates and admits a request, then runs it in the background.
+
+        Returns:
+            dict: The queued job.
+
+        Raises:
+            ValueError: If the request is invalid.
+            Overloaded: If the scheduler refused it and there is no fallback.
+        """
+        if self.stopping.is_set():
+            raise Overloaded("The service is shutting down.", 1.0)
+        request = SummaryRequest.from_dict(payload)
+        prepared = self.summarizer.prepare(request)
+        try:
+            job_id = self.jobs.create(request.user, request.template, request.engine)
+            future = self._executor.submit(self._run, job_id, prepared)
+        except BaseException:
+            if prepared.ticket is not None:
+                prepared.ticket.release()
+            raise
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        increment("service_jobs_total", engine=request.engine)
+        return self.jobs.get(job_id)
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _run(self, job_id, prepared):
+        saved_at = 0.0
+
+        def on_text(text):
+            nonlocal saved_at
+            if time.monotonic() - saved_at >= PARTIAL_INTERVAL:
+                self.jobs.progress(job_id, text)
+                saved_at = time.monotonic()
+
+        def on_queue(position, wait):
+            if position:
+                self.jobs.queued(job_id, position, round(wait, 1))
+            else:
+                self.jobs.start(job_id)
+
+        if prepared.ticket is None:
+            self.jobs.start(job_id)
+        try:
+            result = self.summarizer.execute(prepared, on_text, on_queue)
+        except ValueError as e:
+            self.jobs.fail(job_id, str(e), 400)
+        except Overloaded as e:
+            self.jobs.fail(job_id, f"The summarizer is busy: {e}", 429)
+        except TimeoutError:
+            self.jobs.fail(job_id, "The summary took too long and was cancelled. Please try again.", 504)
+        except Exception:
+            self.logger.error(f"Job {job_id} failed", exc_info=True)
+            self.jobs.fail(job_id, "Error generating summary.", 500)
+        else:
+            self.jobs.finish(job_id, result.to_dict())
+
+    def meeting_owner(self, meeting_id):
+        """The private address of the worker holding a meeting, or None if it is this one."""
+        if len(self.meeting_peers) < 2:
+            return None
+        owner = zlib.crc32(meeting_id.encode("utf-8")) % len(self.meeting_peers)
+        return None if owner == self.worker_index else self.meeting_peers[owner]
+
+    def append_segment(self, meeting_id, payload):
+        """
+        Appends a segment to a live meeting, starting the meeting with its first segment.
+
+        Returns:
+            dict: The meeting's progress, and whether the segment was new ("accepted").
+
+        Raises:
+            ValueError: If the segment is invalid, or a new meeting names no valid template.
+            SegmentOutOfOrder: If the segment's sequence number skips ahead.
+        """
+        text, sequence = payload.get("text"), payload.get("sequence")
+        if not isinstance(text, str):
+            raise ValueError("Please provide the segment's text.")
+        if sequence is not None and (not isinstance(sequence, int) or isinstance(sequence, bool) or sequence < 1):
+            raise ValueError("sequence must be a positive integer.")
+        try:
+            meeting = self.live.get(meeting_id)
+        except UnknownMeeting:
+            template = payload.get("template")
+            if not isinstance(template, str):
+                raise ValueError("Name a template to start the meeting with.")
+            prompts = resolve_prompts(self.summarizer.template_cache.get(), template, payload.get("custom_prompt") or "")
+            meeting = self.live.start(meeting_id, prompts[template])
+        accepted = meeting.append(text, sequence, fold=False)
+        # Folding calls the model, so it runs on the job threads rather than holding up the upload.
+        if meeting.tail_tokens >= meeting.fold_tokens:
+            self._executor.submit(self._fold, meeting)
+        return dict(meeting.snapshot(), accepted=accepted)
+
+    def _fold(self, meeting):
+        try:
+            meeting.fold_if_due()
+        except Exception:
+            self.logger.error(f"Live meeting {meeting.meeting_id}: fold failed", exc_info=True)
+
+    def finish_meeting(self, meeting_id):
+        """Folds a meeting's remaining segments and returns its progress with the final summary."""
+        meeting = self.live.get(meeting_id)
+        summary = self.live.finish(meeting_id)
+        increment("service_meetings_finished_total")
+        return dict(meeting.snapshot(), summary=summary)
+
+    def drain(self, timeout):
+        """Stops taking jobs and waits up to timeout seconds for running ones; the rest are failed."""
+        self.stopping.set()
+        with self._lock:
+            futures = set(self._futures)
+        if futures:
+            self.logger.info(f"Waiting up to {timeout}s for {len(futures)} job(s) to finish.")
+            wait(futures, timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.jobs.abandon([os.getpid()], "The service shut down before the job finished.")
+
+    def stats(self):
+        with self._lock:
+            running = len(self._futures)
+        scheduler = self.summarizer.scheduler
+        return {"pid": os.getpid(), "jobs": running, "scheduler": scheduler.stats() if scheduler else None}
+
+
+class _SharedSocketServer(ThreadingHTTPServer):
+    """A threading HTTP server on a listening socket that other worker processes also accept on."""
+
+    daemon_threads = True
+
+    def get_request(self):
+        # The listener is non-blocking, so a worker that loses the race for a connection
+        # returns to its loop (and notices a shutdown) instead of blocking in accept().
+        connection, address = self.socket.accept()
+        connection.setblocking(True)
+        return connection, address
+
+
+def _handler_class(service, template_cache):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            match = JOB_PATH.match(path)
+            meeting = MEETING_PATH.match(path)
+            if meeting and not meeting.group(2):
+                self._meeting(meeting.group(1), None, b"")
+            elif path == "/healthz":
+                self._send_json(dict(service.stats(), status="stopping" if service.stopping.is_set() else "ok"))
+            elif path == "/v1/templates":
+                self._send_json({"templates": template_cache.get().templates})
+            elif path == "/v1/engines":
+                self._send_json({"engines": available_engines()})
+            elif match and match.group(2):
+                self._stream(match.group(1))
+            elif match:
+                job = service.jobs.get(match.group(1))
+                if job is None:
+                    self._send_json({"error": "No such job."}, status=404)
+                else:
+                    self._send_json(job)
+            else:
+                self._send_json({"error": "Not found."}, status=404)
+
+        def do_POST(self):
+            path = self.path.split("?", 1)[0]
+            try:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            except ValueError:
+                body = b""
+            meeting = MEETING_PATH.match(path)
+            if meeting and meeting.group(2):
+                self._meeting(meeting.group(1), meeting.group(2), body)
+                return
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                self._send_json({"error": "The body must be a JSON object."}, status=400)
+                return
+            if path == "/v1/jobs":
+                try:
+                    job = service.submit(payload)
+                except ValueError as e:
+                    self._send_json({"error": str(e)}, status=400)
+                except Overloaded as e:
+                    retry_after = max(1, math.ceil(e.retry_after))
+                    self._send_json(
+                        {"error": str(e), "retry_after": retry_after}, status=429,
+                        headers={"Retry-After": str(retry_after)},
+                    )
+                else:
+                    self._send_json(job, status=202, headers={"Location": f"/v1/jobs/{job['id']}"})
+            elif path == "/v1/feedback":
+                queued = service.audit_log.log_feedback(
+                    logid=int(time.time()),
+                    user_id=payload.get("user_id", ""),
+                    user_feedback=payload.get("user_feedback", ""),
+                    user_rating=payload.get("user_rating", 3),
+                )
+                self._send_json({"queued": queued}, status=202 if queued else 503)
+            else:
+                self._send_json({"error": "Not found."}, status=404)
+
+        def _meeting(self, meeting_id, action, body):
+            owner = service.meeting_owner(meeting_id)
+            if owner is not None:
+                self._forward(owner, body)
+                return
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                self._send_json({"error": "The body must be a JSON object."}, status=400)
+                return
+            try:
+                if action == "segments":
+                    self._send_json(service.append_segment(meeting_id, payload))
+                elif action == "finish":
+                    self._send_json(service.finish_meeting(meeting_id))
+                else:
+                    self._send_json(service.live.get(meeting_id).snapshot())
+            except UnknownMeeting:
+                self._send_json({"error": "No such meeting."}, status=404)
+            except SegmentOutOfOrder as e:
+                self._send_json({"error": str(e)}, status=409)
+            except ValueError as e:
+                self._send_json({"error": str(e)}, status=400)
+            except Exception:
+                logging.getLogger(__name__).error(f"Live meeting {meeting_id} failed", exc_info=True)
+                self._send_json({"error": "Error updating the meeting summary."}, status=500)
+
+        def _forward(self, address, body):
+            """Relays this request to the worker at address and its answer back."""
+            connection = HTTPConnection(*address, timeout=MEETING_FORWARD_TIMEOUT)
+            try:
+                connection.request(self.command, self.path, body=body or None,
+                                   headers={"Content-Type": "application/json"})
+                response = connection.getresponse()
+                data = response.read()
+            except OSError as e:
+                self._send_json({"error": f"The worker holding this meeting did not answer: {e}"}, status=503)
+                return
+            finally:
+                connection.close()
+            self.send_response(response.status)
+            self.send_header("Content-Type", response.getheader("Content-Type", "application/json"))
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, job_id):
+            job = service.jobs.get(job_id)
+            if job is None:
+                self._send_json({"error": "No such job."}, status=404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            sent, queue = 0, None
+            try:
+                while True:
+                    if job["status"] == QUEUED and job["queue_position"] and (job["queue_position"], job["queue_wait"]) != queue:
+                        queue = (job["queue_position"], job["queue_wait"])
+                        self._send_event("queued", {"position": queue[0], "wait": queue[1]})
+                    if len(job["partial"]) > sent:
+                        self._send_event("text", {"text": job["partial"][sent:]})
+                        sent = len(job["partial"])
+                    if job["status"] in FINISHED:
+                        self._send_event("done" if job["status"] == DONE else "failed", job)
+                        return
+                    time.sleep(STREAM_POLL_INTERVAL)
+                    job = service.jobs.get(job_id)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client went away; the job carries on and can still be polled.
+                pass
+
+        def _send_event(self, event, data):
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def _send_json(self, payload, status=200, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logging.getLogger(__name__).debug(f"{self.address_string()} {format % args}")
+
+    return Handler
+
+
+def _build_backends(stub):
+    if stub:
+        from stubs import StubDB
+        return StubDB(latency=0.001)
+    from utils import DBOracle
+    return DBOracle(
+        os.getenv("DB_USER"),
+        os.getenv("DB_PASSWORD"),
+        os.getenv("DB_DSN", "UATGVPDB.ITRANS.INT/GVPUAT2"),
+        pool_min=int(os.getenv("DB_POOL_MIN", "1")),
+        pool_max=int(os.getenv("DB_POOL_MAX", "4")),
+        acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+    )
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _adopt_orphaned_spills(audit_log, spill_dir):
+    """Takes over the audit spill files of workers that are gone, so their records are replayed."""
+    for name in sorted(os.listdir(spill_dir)):
+        match = SPILL_FILE.match(name)
+        if match and int(match.group(1)) != os.getpid() and not _alive(int(match.group(1))):
+            audit_log.adopt_spill(os.path.join(spill_dir, name))
+
+
+def run_worker(listener, args, index=0, meeting_listeners=None):
+    """
+    Serves requests on an already-bound listening socket until SIGTERM or SIGINT.
+
+    With several workers, meeting_listeners holds each one's private listener, by index.
+    """
+    logger = logging.getLogger(__name__)
+    if os.getenv("METRICS_PORT"):
+        # Each worker exposes its own metrics, on consecutive ports.
+        start_metrics_server(int(os.getenv("METRICS_PORT")) + index)
+    db = _build_backends(args.stub)
+    # The spill file is per process: the writer's lock only covers its own threads.
+    spill_dir = os.getenv("AUDIT_SPILL_DIR", ".")
+    audit_log = get_audit_writer(db, spill_path=os.path.join(spill_dir, f"audit_spill.{os.getpid()}.jsonl"))
+    _adopt_orphaned_spills(audit_log, spill_dir)
+    template_cache = get_template_cache(db, ttl=int(os.getenv("TEMPLATE_CACHE_TTL", "300")))
+    summarizer = summarizer_from_env(db, audit_log, template_cache)
+    # A live meeting's tail is folded once it holds LIVE_FOLD_TOKENS tokens, and its summary is
+    # rebuilt from the notes every LIVE_CONSOLIDATE_EVERY folds.
+    live = get_live_summarizer(
+        summarizer.handler,
+        fold_tokens=int(os.getenv("LIVE_FOLD_TOKENS", "1500")),
+        consolidate_every=int(os.getenv("LIVE_CONSOLIDATE_EVERY", "5")),
+    )
+    service = SummaryService(
+        summarizer,
+        JobStore(args.job_db),
+        audit_log,
+        max_jobs=args.max_jobs,
+        live=live,
+        meeting_peers=[peer.getsockname()[:2] for peer in meeting_listeners or []],
+        worker_index=index,
+    )
+
+    handler_class = _handler_class(service, template_cache)
+    server = _SharedSocketServer(listener.getsockname()[:2], handler_class, bind_and_activate=False)
+    server.socket = listener
+    servers = [server]
+    if meeting_listeners:
+        private = _SharedSocketServer(meeting_listeners[index].getsockname()[:2], handler_class, bind_and_activate=False)
+        private.socket = meeting_listeners[index]
+        servers.append(private)
+        threading.Thread(target=private.serve_forever, kwargs={"poll_interval": 0.5}, daemon=True).start()
+
+    def shut_down(signum, frame):
+        if not service.stopping.is_set():
+            logger.info(f"Worker {os.getpid()} shutting down (signal {signum}).")
+            service.stopping.set()
+            # shutdown() waits for serve_forever(), which this handler interrupted; call it from a thread.
+            for stopped in servers:
+                threading.Thread(target=stopped.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, shut_down)
+    signal.signal(signal.SIGINT, shut_down)
+    logger.info(f"Worker {os.getpid()} serving on port {listener.getsockname()[1]}.")
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        service.drain(args.drain_seconds)
+        audit_log.close()
+        logger.info(f"Worker {os.getpid()} stopped.")
+
+
+def serve(args):
+    """Binds the port, runs the workers and replaces any that die, until SIGTERM or SIGINT."""
+    logger = logging.getLogger(__name__)
+    listener = socket.create_server((args.host, args.port), backlog=args.backlog)
+    listener.setblocking(False)
+    store = JobStore(args.job_db, retention_seconds=args.retention_hours * 3600)
+    store.abandon()
+    store.purge()
+
+    stub_server = None
+    if args.stub:
+        from stubs import StubOllamaServer
+        # Bound now so the workers inherit its address; it starts serving after they are forked.
+        stub_server = StubOllamaServer(tokens_per_second=args.stub_tokens_per_second)
+        os.environ["OLLAMA_URLS"] = stub_server.url
+        os.environ["OLLAMA_MODEL"] = stub_server.model
+
+    if args.workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        if stub_server:
+            stub_server.start()
+        run_worker(listener, args)
+        return
+
+    context = multiprocessing.get_context("fork")
+    stopping = threading.Event()
+    # Private listeners for forwarding live meeting requests to the worker that holds them; a
+    # replacement worker takes over its predecessor's.
+    meeting_listeners = [socket.create_server(("127.0.0.1", 0)) for _ in range(args.workers)]
+    for meeting_listener in meeting_listeners:
+        meeting_listener.setblocking(False)
+
+    def spawn(index):
+        process = context.Process(target=run_worker, args=(listener, args, index, meeting_listeners),
+                                  name=f"service-worker-{index}")
+        process.start()
+        return process
+
+    workers = [spawn(index) for index in range(args.workers)]
+    if stub_server:
+        stub_server.start()
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(f"Serving on {args.host}:{args.port} with {args.workers} workers.")
+    print(f"Summary service listening on http://{args.host}:{listener.getsockname()[1]} with {args.workers} workers.")
+    last_purge = time.monotonic()
+    while not stopping.wait(1.0):
+        for index, process in enumerate(workers):
+            if not process.is_alive():
+                logger.warning(f"Worker {process.pid} exited with {process.exitcode}; starting another.")
+                store.abandon([process.pid], "The worker running the job exited.")
+                workers[index] = spawn(index)
+        if time.monotonic() - last_purge > 3600:
+            store.purge()
+            last_purge = time.monotonic()
+
+    logger.info("Shutting down workers.")
+    for process in workers:
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGTERM)
+    deadline = time.monotonic() + args.drain_seconds + 15
+    for process in workers:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"Worker {process.pid} did not stop in time; killing it.")
+            process.kill()
+            process.join()
+    store.abandon([process.pid for process in workers], "The service shut down before the job finished.")
+    listener.close()
+    for meeting_listener in meeting_listeners:
+        meeting_listener.close()
+    if stub_server:
+        stub_server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the summarize pipeline over HTTP.")
+    parser.add_argument("--host", default=os.getenv("SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVICE_PORT", "8600")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVICE_WORKERS", "2")),
+                        help="Worker processes accepting on the port.")
+    parser.add_argument("--max-jobs", type=int, default=int(os.getenv("SERVICE_MAX_JOBS", "16")),
+                        help="Jobs each worker runs at once.")
+    parser.add_argument("--job-db", default=os.getenv("SERVICE_JOB_DB", "summary_jobs.sqlite3"),
+                        help="SQLite file the workers share job state through.")
+    parser.add_argument("--retention-hours", type=float, default=24.0, help="How long finished jobs are kept.")
+    parser.add_argument("--drain-seconds", type=float, default=float(os.getenv("SERVICE_DRAIN_SECONDS", "60")),
+                        help="How long running jobs get to finish on shutdown.")
+    parser.add_argument("--backlog", type=int, default=128)
+    parser.add_argument("--stub", action="store_true", help="Run against a stub Ollama server and database.")
+    parser.add_argument("--stub-tokens-per-second", type=float, default=50.0)
+    args = parser.parse_args(argv)
+
+    # Replaces the app.log configuration that importing utils sets up.
+    logging.basicConfig(
+        filename=os.getenv("SERVICE_LOG", "service.log"),
+        level=logging.INFO,
+        format="%(asctime)s - %(process)d - %(levelname)s - %(message)s",
+        force=True,
+    )
+    serve(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Client for the summary service (service.py), used by the Streamlit app when SUMMARY_SERVICE_URL
+is set. It mirrors the parts of Summarizer, TemplateCache and AuditLogWriter the app calls, and
+raises the same exceptions, so the app does not care which one it talks to.
+"""
+import json
+import logging
+import threading
+import time
+
+import httpx
+
+from scheduler import Overloaded
+from summarize import SummaryResult
+from template_cache import TemplateSnapshot
+
+# How often to poll a job when its event stream is lost.
+POLL_INTERVAL = 0.5
+
+
+class ServiceError(RuntimeError):
+    """The service failed a job or could not be reached."""
+
+
+class SummaryServiceClient:
+    """
+    Args:
+        base_url (str): The service, e.g. "http://127.0.0.1:8600".
+        timeout (float): Seconds to wait for a response (streams wait as long as the job runs).
+        template_ttl (float): Seconds the templates are cached between reruns.
+    """
+
+    def __init__(self, base_url, timeout=10.0, template_ttl=60.0):
+        self.base_url = base_url.rstrip("/")
+        self.template_ttl = template_ttl
+        self.logger = logging.getLogger(__name__)
+        self._client = httpx.Client(base_url=self.base_url, timeout=timeout)
+        self._templates = None
+        self._templates_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The templates as a TemplateSnapshot, cached for template_ttl; the last good ones if the service is down."""
+        with self._lock:
+            if self._templates is None or time.monotonic() - self._templates_at >= self.template_ttl:
+                try:
+                    response = self._client.get("/v1/templates")
+                    response.raise_for_status()
+                    self._templates = TemplateSnapshot(response.json()["templates"])
+                    self._templates_at = time.monotonic()
+                except httpx.HTTPError:
+                    if self._templates is None:
+                        raise
+                    self.logger.warning("Template fetch from the summary service failed; serving cached templates.")
+            return self._templates
+
+    def submit(self, request):
+        """Submits a SummaryRequest and returns the job."""
+        try:
+            response = self._client.post("/v1/jobs", json=request.to_dict())
+        except httpx.TransportError as e:
+            raise ServiceError(f"The summary service could not be reached: {e}") from e
+        return self._json(response)
+
+    def job(self, job_id):
+        return self._json(self._client.get(f"/v1/jobs/{job_id}"))
+
+    def run(self, request, on_text=None, on_queue=None):
+        """
+        Submits a request and waits for its result, like Summarizer.run().
+
+        Raises:
+            ValueError: If the service rejected the request.
+            Overloaded: If the service is too busy to take it.
+            TimeoutError: If the model missed its deadline.
+            ServiceError: If the job failed otherwise.
+        """
+        job = self.submit(request)
+        try:
+            job = self._follow(job["id"], on_text, on_queue)
+        except httpx.TransportError:
+            self.logger.warning(f"Lost the event stream of job {job['id']}; polling it instead.")
+            job = self._poll(job["id"], on_queue)
+        return self._result(job)
+
+    def log_feedback(self, logid, user_id, user_feedback, user_rating, created_date=None):
+        """Sends feedback to the service; True if it was accepted. logid and created_date are set there."""
+        try:
+            response = self._client.post(
+                "/v1/feedback",
+                json={"user_id": user_id, "user_feedback": user_feedback, "user_rating": user_rating},
+            )
+            return response.status_code == 202
+        except httpx.HTTPError:
+            self.logger.error("Sending feedback to the summary service failed", exc_info=True)
+            return False
+
+    def _follow(self, job_id, on_text, on_queue):
+        text, event = "", None
+        with self._client.stream("GET", f"/v1/jobs/{job_id}/stream", timeout=httpx.Timeout(10.0, read=None)) as response:
+            self._raise_for_status(response)
+            for line in response.iter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):])
+                    if event == "queued" and on_queue is not None:
+                        on_queue(data["position"], data["wait"] or 0.0)
+                    elif event == "text":
+                        if not text and on_queue is not None:
+                            on_queue(0, 0.0)
+                        text += data["text"]
+                        if on_text is not None:
+                            on_text(text)
+                    elif event in ("done", "failed"):
+                        return data
+        raise httpx.RemoteProtocolError("The event stream ended before the job finished.")
+
+    def _poll(self, job_id, on_queue):
+        while True:
+            job = self.job(job_id)
+            if job["status"] in ("done", "failed"):
+                return job
+            if job["status"] == "queued" and job["queue_position"] and on_queue is not None:
+                on_queue(job["queue_position"], job["queue_wait"] or 0.0)
+            time.sleep(POLL_INTERVAL)
+
+    def _result(self, job):
+        if job["status"] == "done":
+            return SummaryResult.from_dict(job["result"])
+        error, status = job["error"], job["error_status"]
+        if status == 400:
+            raise ValueError(error)
+        if status == 429:
+            raise Overloaded(error, 30.0)
+        if status == 504:
+            raise TimeoutError(error)
+        raise ServiceError(error)
+
+    def _json(self, response):
+        self._raise_for_status(response)
+        return response.json()
+
+    def _raise_for_status(self, response):
+        if response.status_code < 400:
+            return
+        response.read()
+        try:
+            error = response.json().get("error", response.text)
+        except ValueError:
+            error = response.text
+        if response.status_code == 400:
+            raise ValueError(error)
+        if response.status_code == 429:
+            raise Overloaded(error, float(response.headers.get("Retry-After", 30)))
+        raise ServiceError(f"The summary service answered {response.status_code}: {error}")
@@ -0,0 +1,153 @@
+import socket
+import threading
+
+import httpx
+import pytest
+
+from audit_log import AuditLogWriter
+from jobs import JobStore
+from live_summary import LiveSummarizer
+from scheduler import FairScheduler
+from service import SummaryService, _SharedSocketServer, _adopt_orphaned_spills, _handler_class
+from service_client import SummaryServiceClient
+from stubs import StubDB, StubOllamaServer
+from summarize import EXTRACTIVE, OLLAMA, SummaryRequest, summarizer_from_env
+from template_cache import TemplateCache
+
+TRANSCRIPT = """Alice: Thanks for joining. We need to settle the launch date for the mobile app.
+Bob: QA found two crash bugs in the payment flow, so Friday looks risky to me.
+Alice: Then we decided to move the launch to next Wednesday and fix both bugs first.
+Carol: I will send the updated release notes to marketing by Monday.
+Bob: I'll check the crash reports again tomorrow and share a summary with the team.
+"""
+
+
+def _serve(service, template_cache):
+    listener = socket.create_server(("127.0.0.1", 0))
+    listener.setblocking(False)
+    server = _SharedSocketServer(listener.getsockname()[:2], _handler_class(service, template_cache),
+                                 bind_and_activate=False)
+    server.socket = listener
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.1}, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch, word_tokens):
+    ollama = StubOllamaServer(first_token_latency=0.01, tokens_per_second=40, output_tokens=30).start()
+    monkeypatch.setenv("OLLAMA_URLS", ollama.url)
+    monkeypatch.setenv("OLLAMA_MODEL", ollama.model)
+    monkeypatch.setenv("OLLAMA_WARM_INTERVAL", "0")
+    db = StubDB(latency=0)
+    audit_log = AuditLogWriter(db, flush_interval=0.1, spill_path=str(tmp_path / "audit_spill.jsonl"))
+    template_cache = TemplateCache(db)
+    summarizer = summarizer_from_env(db, audit_log, template_cache)
+    summarizer.scheduler = FairScheduler(max_running=2)
+    live = LiveSummarizer(summarizer.handler, fold_tokens=40, consolidate_every=0)
+    service = SummaryService(summarizer, JobStore(str(tmp_path / "jobs.sqlite3")), audit_log, max_jobs=4, live=live)
+    server = _serve(service, template_cache)
+    service.url = f"http://127.0.0.1:{server.server_address[1]}"
+    service.db = db
+    service.template_cache = template_cache
+    yield service
+
+    server.shutdown()
+    server.server_close()
+    service.drain(5)
+    audit_log.close()
+    ollama.stop()
+
+
+def test_summary_round_trip(service):
+    client = SummaryServiceClient(service.url)
+    template = client.get().names[0]
+    streamed = []
+    result = client.run(SummaryRequest(TRANSCRIPT, template, engine=OLLAMA, user="alice"), on_text=streamed.append)
+
+    assert result.engine == OLLAMA and result.summary
+    assert streamed and result.summary.startswith(streamed[-1])
+    assert not result.cache_hit
+
+    again = client.run(SummaryRequest(TRANSCRIPT, template, engine=OLLAMA, user="bob"))
+    assert again.cache_hit and again.summary == result.summary
+
+    extractive = client.run(SummaryRequest(TRANSCRIPT, template, engine=EXTRACTIVE))
+    assert extractive.engine == EXTRACTIVE and "Wednesday" in extractive.summary
+
+    service.audit_log.close()
+    assert [row["event"] for row in service.db.log_rows] == [
+        "Meeting Summary", "Meeting Summary (Cache Hit)", "Meeting Summary",
+    ]
+
+
+def test_invalid_requests_are_refused(service):
+    client = SummaryServiceClient(service.url)
+    with pytest.raises(ValueError):
+        client.run(SummaryRequest(TRANSCRIPT, "No such template"))
+    with pytest.raises(ValueError):
+        client.submit(SummaryRequest(" ", "Custom Prompt"))
+
+
+def test_feedback_is_queued(service):
+    client = SummaryServiceClient(service.url)
+    assert client.log_feedback(None, 7, "Useful", 5)
+    service.audit_log.close()
+    assert service.db.feedback_rows[0]["user_feedback"] == "Useful"
+
+
+def test_live_meeting_round_trip(service):
+    client = httpx.Client(base_url=service.url, timeout=10)
+    template = client.get("/v1/templates").json()["templates"][0]["name"]
+    lines = TRANSCRIPT.splitlines()
+
+    response = client.post("/v1/meetings/standup-1/segments", json={"text": lines[0], "sequence": 1})
+    assert response.status_code == 400
+    response = client.post("/v1/meetings/standup-1/segments",
+                           json={"text": lines[0], "sequence": 1, "template": template})
+    assert response.status_code == 200 and response.json()["accepted"]
+    assert not client.post("/v1/meetings/standup-1/segments", json={"text": lines[0], "sequence": 1}).json()["accepted"]
+    assert client.post("/v1/meetings/standup-1/segments", json={"text": lines[2], "sequence": 3}).status_code == 409
+    for sequence, line in enumerate(lines[1:], start=2):
+        assert client.post("/v1/meetings/standup-1/segments", json={"text": line, "sequence": sequence}).status_code == 200
+
+    assert client.get("/v1/meetings/standup-1").json()["segments"] == len(lines)
+    finished = client.post("/v1/meetings/standup-1/finish").json()
+    assert finished["summary"] and finished["tail_tokens"] == 0 and finished["parts"] >= 2
+    assert client.get("/v1/meetings/standup-1").status_code == 404
+
+
+def test_meeting_requests_are_forwarded_to_the_worker_holding_the_meeting(service):
+    other = SummaryService(service.summarizer, service.jobs, service.audit_log,
+                           live=LiveSummarizer(service.summarizer.handler, fold_tokens=10000))
+    private = [_serve(worker, service.template_cache) for worker in (service, other)]
+    peers = [server.server_address[:2] for server in private]
+    service.meeting_peers, other.meeting_peers = peers, peers
+    other.worker_index = 1
+    meeting_id = next(f"meeting-{n}" for n in range(100) if service.meeting_owner(f"meeting-{n}") is not None)
+
+    client = httpx.Client(base_url=service.url, timeout=10)
+    response = client.post(f"/v1/meetings/{meeting_id}/segments",
+                           json={"text": "Alice: Hello.", "sequence": 1, "template": "Custom Prompt",
+                                 "custom_prompt": "List the decisions."})
+    assert response.status_code == 200
+    assert other.live.get(meeting_id).snapshot()["segments"] == 1
+    assert client.get(f"/v1/meetings/{meeting_id}").json()["segments"] == 1
+    for server in private:
+        server.shutdown()
+        server.server_close()
+
+
+def test_orphaned_spill_files_are_adopted(tmp_path):
+    db = StubDB(latency=0)
+    writer = AuditLogWriter(db, flush_interval=60, spill_path=str(tmp_path / "audit_spill.1.jsonl"))
+    # No process has this pid, so its spill file is an orphan; the writer's own file is not.
+    (tmp_path / "audit_spill.4194305.jsonl").write_text(
+        '{"kind": "feedback", "record": {"logid": 1, "user_id": 7, "user_feedback": "Useful", '
+        '"user_rating": 5, "created_date": "2024-05-01T09:30:00"}}\n'
+    )
+    (tmp_path / "audit_spill.4194305.quarantine.jsonl").write_text("")
+    _adopt_orphaned_spills(writer, str(tmp_path))
+    writer.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["audit_spill.4194305.quarantine.jsonl"]
+    assert [row["user_feedback"] for row in db.feedback_rows] == ["Useful"]
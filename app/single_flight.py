@@ -0,0 +1,116 @@
+"""
+Coalescing of identical in-flight calls.
+
+When several Streamlit sessions (or one user clicking twice) ask for the same summary at
+the same time, only the first caller runs the generation; the others wait for it and get
+the same result, or the same exception.
+"""
+import logging
+import threading
+
+from metrics import increment
+
+
+class _Call:
+    """One in-flight call and the outcome its waiters receive."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and shares its outcome with concurrent callers.
+
+    Attributes:
+        name (str): Used as the label on the coalescing counters.
+    """
+
+    def __init__(self, name="default"):
+        self.name = name
+        self.leaders = 0
+        self.shared = 0
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, timeout=None, on_wait=None):
+        """
+        Runs fn() unless a call with the same key is already running, in which case that
+        call's result is awaited instead.
+
+        If the running call is interrupted rather than failing (its Streamlit session was
+        stopped, for example), one of the waiters runs fn() itself.
+
+        Args:
+            on_wait (callable): Called before waiting on another caller's call, e.g. to give
+                up resources a waiter does not need.
+
+        Returns:
+            tuple: fn's result and whether it was shared from another caller's call.
+
+        Raises:
+            TimeoutError: If timeout seconds pass while waiting for another caller's call.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.leaders += 1
+                else:
+                    call.waiters += 1
+
+            if leader:
+                return self._run(key, call, fn), False
+
+            if on_wait is not None:
+                on_wait()
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Timed out after {timeout}s waiting for an identical in-flight request.")
+            if call.abandoned:
+                continue
+            with self._lock:
+                self.shared += 1
+            increment("single_flight_shared_total", flight=self.name)
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+    def _run(self, key, call, fn):
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            if call.waiters:
+                self.logger.info(f"{call.waiters} identical request(s) coalesced into one {self.name} call.")
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "shared": self.shared}
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(name):
+    """Returns the process-wide SingleFlight with this name."""
+    with _flights_lock:
+        if name not in _flights:
+            _flights[name] = SingleFlight(name)
+        return _flights[name]
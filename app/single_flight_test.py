@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, callers):
+    results, errors = [None] * callers, [None] * callers
+
+    def call(index):
+        try:
+            results[index] = flight.do(key, fn)
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert not any(thread.is_alive() for thread in threads)
+    return results, errors
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test")
+    calls = []
+    release = threading.Event()
+
+    def generate():
+        calls.append(1)
+        release.wait(5)
+        return "summary"
+
+    threading.Timer(0.2, release.set).start()
+    results, errors = _run_concurrently(flight, "key", generate, 5)
+
+    assert calls == [1]
+    assert errors == [None] * 5
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert {result for result, _ in results} == {"summary"}
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "shared": 4}
+
+
+def test_waiters_receive_the_leaders_exception():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def generate():
+        release.wait(5)
+        raise TimeoutError("model missed its deadline")
+
+    threading.Timer(0.2, release.set).start()
+    results, errors = _run_concurrently(flight, "key", generate, 3)
+
+    assert all(isinstance(error, TimeoutError) for error in errors)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight("test")
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+    assert flight.stats()["leaders"] == 2
+
+
+def test_waiter_runs_the_call_when_the_leader_is_interrupted():
+    flight = SingleFlight("test")
+    leader_started = threading.Event()
+
+    def interrupted():
+        leader_started.set()
+        time.sleep(0.2)
+        raise KeyboardInterrupt
+
+    def leader():
+        with pytest.raises(KeyboardInterrupt):
+            flight.do("key", interrupted)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    leader_started.wait(5)
+    assert flight.do("key", lambda: "retried") == ("retried", False)
+    thread.join(5)
+
+
+def test_waiter_times_out():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    thread = threading.Thread(target=flight.do, args=("key", lambda: release.wait(5)))
+    thread.start()
+    time.sleep(0.05)
+    with pytest.raises(TimeoutError):
+        flight.do("key", lambda: None, timeout=0.1)
+    release.set()
+    thread.join(5)
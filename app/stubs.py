@@ -0,0 +1,306 @@
+"""
+Local stand-ins for the Ollama server and the Oracle database.
+
+Used by the benchmark and for running the app offline. StubOllamaServer speaks enough of
+Ollama's HTTP API (/api/generate, /api/tags, /api/ps) for AIHandler, with configurable
+latency and token rates. StubDB has the DBOracle methods the app calls and keeps rows in
+memory.
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from blob_store import MESSAGE_COLUMNS, compress, decompress, digest
+from templates import templates as DEFAULT_TEMPLATES
+
+
+class StubOllamaServer:
+    """
+    A threaded HTTP server that mimics Ollama's generate API.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind; 0 picks a free one (see url).
+        model (str): Model name reported by /api/tags and /api/ps.
+        first_token_latency (float): Seconds before the first token, on top of prompt evaluation.
+        prompt_tokens_per_second (float): Simulated prompt evaluation rate.
+        tokens_per_second (float): Simulated generation rate.
+        output_tokens (int): Tokens generated per request.
+        cache_slots (int): Prompts kept for prefix reuse.
+        load_seconds (float): Model load time, paid by the first request after the model's
+            keep_alive (Ollama's default is 5 minutes) has run out.
+
+    Like Ollama with OLLAMA_NUM_PARALLEL slots, the server keeps the last cache_slots prompts
+    evaluated and only charges (and reports in prompt_eval_count) the part of a new prompt
+    after the longest prefix it shares with one of them.
+
+    Set available to False to make every request fail with 503, e.g. to exercise failover.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, model="llama3.1", first_token_latency=0.2,
+                 prompt_tokens_per_second=2000.0, tokens_per_second=50.0, output_tokens=150, cache_slots=4,
+                 load_seconds=0.0):
+        self.model = model
+        self.first_token_latency = first_token_latency
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.available = True
+        self.requests = 0
+        self.aborted = 0
+        self.load_seconds = load_seconds
+        self.cold_loads = 0
+        self._loaded_until = 0.0
+        self._cached_prompts = deque(maxlen=cache_slots)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def generate(self, prompt, keep_alive=None):
+        """
+        Yields response chunks for a prompt, sleeping to simulate the configured rates.
+
+        An empty prompt only loads the model, as in Ollama.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            load_seconds = self.load_seconds if now >= self._loaded_until else 0.0
+            if load_seconds:
+                self.cold_loads += 1
+                self._cached_prompts.clear()
+            self._loaded_until = now + load_seconds + _keep_alive_seconds(keep_alive)
+            lengths = [len(os.path.commonprefix([cached_prompt, prompt])) for cached_prompt in self._cached_prompts]
+            cached = max(lengths, default=0)
+            if lengths and cached:
+                # The slot that served the prefix now holds this prompt.
+                del self._cached_prompts[lengths.index(cached)]
+            self._cached_prompts.append(prompt)
+        start_time = time.perf_counter()
+        time.sleep(load_seconds)
+        if not prompt:
+            yield {
+                "model": self.model,
+                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "response": "",
+                "done": True,
+                "done_reason": "load",
+                "total_duration": int((time.perf_counter() - start_time) * 1e9),
+                "load_duration": int(load_seconds * 1e9),
+            }
+            return
+        prompt_tokens = max(1, (len(prompt) - cached) // 4)
+        prompt_eval_seconds = prompt_tokens / self.prompt_tokens_per_second
+        time.sleep(self.first_token_latency + prompt_eval_seconds)
+
+        eval_start = time.perf_counter()
+        for index in range(self.output_tokens):
+            yield {"model": self.model, "response": f"token{index} ", "done": False}
+            time.sleep(1 / self.tokens_per_second)
+        eval_seconds = time.perf_counter() - eval_start
+
+        yield {
+            "model": self.model,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "response": "",
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((time.perf_counter() - start_time) * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_eval_seconds * 1e9),
+            "eval_count": self.output_tokens,
+            "eval_duration": int(eval_seconds * 1e9),
+        }
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if not stub.available:
+                    self._send_json({"error": "unavailable"}, status=503)
+                elif self.path == "/api/tags":
+                    self._send_json({"models": [{"name": stub.model, "model": stub.model}]})
+                elif self.path == "/api/ps":
+                    self._send_json({"models": [{"name": stub.model, "model": stub.model}]})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not stub.available:
+                    self._send_json({"error": "unavailable"}, status=503)
+                    return
+                if self.path != "/api/generate":
+                    self._send_json({"error": "not found"}, status=404)
+                    return
+                chunks = stub.generate(body.get("prompt") or "", body.get("keep_alive"))
+                if body.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    try:
+                        for chunk in chunks:
+                            line = json.dumps(chunk).encode("utf-8") + b"\n"
+                            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                            self.wfile.flush()
+                        self.wfile.write(b"0\r\n\r\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client hung up mid-stream (e.g. a hedged request that lost); stop generating.
+                        with stub._lock:
+                            stub.aborted += 1
+                        self.close_connection = True
+                else:
+                    chunks = list(chunks)
+                    final = dict(chunks[-1], response="".join(chunk["response"] for chunk in chunks))
+                    self._send_json(final)
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _keep_alive_seconds(keep_alive):
+    """Converts an Ollama keep_alive value (seconds, or "30s"/"5m"/"1h") to seconds; negative means forever."""
+    if keep_alive is None or keep_alive == "":
+        return 300.0
+    if isinstance(keep_alive, str) and keep_alive[-1:] in ("s", "m", "h"):
+        seconds = float(keep_alive[:-1]) * {"s": 1, "m": 60, "h": 3600}[keep_alive[-1]]
+    else:
+        seconds = float(keep_alive)
+    return float("inf") if seconds < 0 else seconds
+
+
+class StubDB:
+    """
+    An in-memory stand-in for DBOracle.
+
+    Templates come from templates.py; log and feedback rows are kept in lists, with their
+    texts in a content-addressed blob dict as DBOracle stores them. Every call sleeps for
+    latency seconds to approximate a database round trip.
+    """
+
+    def __init__(self, latency=0.005, templates=None):
+        self.user = "stub"
+        self.dsn = f"stub-{id(self)}"
+        self.latency = latency
+        self.templates = templates if templates is not None else [
+            {"name": name, "icon": t["icon"], "description": t["description"], "prompt": t["prompt"]}
+            for name, t in sorted(DEFAULT_TEMPLATES.items())
+        ]
+        self.log_rows = []
+        self.blobs = {}
+        self.feedback_rows = []
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def check_health(self):
+        self._round_trip()
+        return True
+
+    def pool_stats(self):
+        return {}
+
+    def fetch_templates(self):
+        self._round_trip()
+        return [dict(template) for template in self.templates]
+
+    def fetch_templates_version(self):
+        self._round_trip()
+        return (len(self.templates), 1)
+
+    def log_entry(self, event, model, input_message, **fields):
+        return self.log_entries([dict(fields, event=event, model=model, input_message=input_message)])
+
+    def log_entries(self, entries):
+        self._round_trip()
+        with self._lock:
+            for entry in entries:
+                row = dict(entry)
+                for field, column in MESSAGE_COLUMNS.items():
+                    text = row.pop(field, None)
+                    row[column.lower()] = blob_hash = digest(text) if text else None
+                    if blob_hash and blob_hash not in self.blobs:
+                        self.blobs[blob_hash] = compress(text)
+                row["logid"] = len(self.log_rows) + 1
+                self.log_rows.append(row)
+        return True
+
+    def fetch_log_entry(self, logid):
+        self._round_trip()
+        with self._lock:
+            if not 0 < logid <= len(self.log_rows):
+                return None
+            entry = dict(self.log_rows[logid - 1])
+            for field, column in MESSAGE_COLUMNS.items():
+                blob_hash = entry.pop(column.lower())
+                entry[field] = decompress(self.blobs[blob_hash]) if blob_hash else None
+            return entry
+
+    def blob_stats(self):
+        """Returns how many texts were logged and how many bytes the blobs take, versus plain storage."""
+        with self._lock:
+            hashes = [row[column.lower()] for row in self.log_rows for column in MESSAGE_COLUMNS.values()]
+            hashes = [blob_hash for blob_hash in hashes if blob_hash]
+            return {
+                "texts": len(hashes),
+                "blobs": len(self.blobs),
+                "stored_bytes": sum(len(content) for content in self.blobs.values()),
+                "original_bytes": sum(len(decompress(self.blobs[blob_hash]).encode("utf-8")) for blob_hash in hashes),
+            }
+
+    def log_feedback(self, logid, user_id, user_feedback, user_rating, created_date=None):
+        return self.log_feedback_batch([{
+            "logid": logid, "user_id": user_id, "user_feedback": user_feedback,
+            "user_rating": user_rating, "created_date": created_date,
+        }])
+
+    def log_feedback_batch(self, feedback):
+        self._round_trip()
+        with self._lock:
+            self.feedback_rows.extend(feedback)
+        return True
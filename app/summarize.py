@@ -0,0 +1,501 @@
+"""
+The summarize pipeline: what "Generate Summary" does, for the Streamlit app and the HTTP service.
+
+A SummaryRequest names a template (or a Custom Prompt), optional extra templates and an
+engine. Summarizer.run() resolves the prompts, compacts the transcript, selects passages for
+Custom Prompt questions, serves cache hits, coalesces identical requests, waits its turn with
+the fair scheduler, generates (streaming text to a callback as it arrives), falls back to an
+extractive summary when Ollama is unavailable, and writes the audit log.
+
+run() is prepare() then execute(). prepare() does the cheap part, including admission, so the
+service can refuse a job before accepting it; execute() does the generation.
+"""
+import collections
+import datetime
+import logging
+import os
+import threading
+import time
+
+from ai_handlers import UNAVAILABLE_ERRORS, AIHandler
+from compaction import compact_transcript
+from metrics import increment, record_span, span
+from retrieval import PassageIndex, transcript_key
+from scheduler import Overloaded, estimate_cost, get_scheduler
+from single_flight import get_single_flight
+from summary_cache import get_summary_cache
+from token_accounting import token_usage
+from warmup import get_warmup_manager
+
+OLLAMA = "Ollama"
+GEMINI = "Gemini Pro"
+EXTRACTIVE = "Extractive (fast)"
+CUSTOM_PROMPT = "Custom Prompt"
+
+
+def _flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def available_engines():
+    """The engines to offer: Gemini only when it has an API key."""
+    return [OLLAMA, EXTRACTIVE] + ([GEMINI] if os.getenv("GOOGLE_API_KEY") else [])
+
+
+class SummaryRequest:
+    """
+    One request to summarize a transcript.
+
+    Args:
+        transcript (str): The transcript text, as uploaded; the audit log keeps it as is.
+        template (str): Name of the template, or "Custom Prompt".
+        custom_prompt (str): The prompt for "Custom Prompt".
+        extra_templates (list): Further templates to summarize the same transcript with (Ollama only).
+        engine (str): "Ollama", "Gemini Pro" or "Extractive (fast)".
+        compact (bool): Compact the transcript before sending it (see compaction.py).
+        retrieval (bool): For long transcripts, answer Custom Prompts from the relevant passages only.
+        user (str): Who the request is scheduled as.
+        user_id: Stored with the audit log entries.
+    """
+
+    FIELDS = ("transcript", "template", "custom_prompt", "extra_templates", "engine", "compact", "retrieval",
+              "user", "user_id")
+
+    def __init__(self, transcript, template, custom_prompt="", extra_templates=(), engine=OLLAMA, compact=True,
+                 retrieval=True, user=None, user_id=None):
+        self.transcript = transcript
+        self.template = template
+        self.custom_prompt = custom_prompt or ""
+        self.extra_templates = list(extra_templates or ())
+        self.engine = engine
+        self.compact = compact
+        self.retrieval = retrieval
+        self.user = user
+        self.user_id = user_id
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a request from JSON; ValueError if it is malformed."""
+        if not isinstance(data, dict):
+            raise ValueError("The request must be a JSON object.")
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+        if not isinstance(data.get("transcript"), str) or not data["transcript"].strip():
+            raise ValueError("Please provide a transcript.")
+        if not isinstance(data.get("template"), str):
+            raise ValueError("Please choose a template.")
+        if not isinstance(data.get("extra_templates", []), list):
+            raise ValueError("extra_templates must be a list of template names.")
+        return cls(**data)
+
+
+class SummaryResult:
+    """
+    The outcome of a request.
+
+    Attributes:
+        summaries (dict): Summary text by template name; the requested template comes first.
+        engine (str): The engine that produced it; differs from the request's after a fallback.
+        notes (list): (kind, message) pairs to show alongside, kind being "caption" or "warning".
+    """
+
+    FIELDS = ("summaries", "template", "engine", "model_name", "input_tokens", "output_tokens", "duration",
+              "time_to_first_token", "cache_hit", "coalesced", "cold_start", "notes")
+
+    def __init__(self, summaries, template, engine, model_name, input_tokens=0, output_tokens=0, duration=0.0,
+                 time_to_first_token=None, cache_hit=False, coalesced=False, cold_start=False, notes=()):
+        self.summaries = summaries
+        self.template = template
+        self.engine = engine
+        self.model_name = model_name
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.duration = duration
+        self.time_to_first_token = time_to_first_token
+        self.cache_hit = cache_hit
+        self.coalesced = coalesced
+        self.cold_start = cold_start
+        self.notes = [tuple(note) for note in notes]
+
+    @property
+    def summary(self):
+        return self.summaries[self.template]
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+
+def resolve_prompts(templates, template, custom_prompt="", extra_templates=()):
+    """
+    Returns the prompt for each template of a request, the requested one first.
+
+    Args:
+        templates (TemplateSnapshot): The current templates.
+
+    Raises:
+        ValueError: For an unknown template, or a Custom Prompt without a prompt.
+    """
+    if template == CUSTOM_PROMPT:
+        if not custom_prompt.strip():
+            raise ValueError("Please provide a custom prompt.")
+        prompts = {template: custom_prompt}
+    elif templates.get(template) is None:
+        raise ValueError(f"Unknown template: {template}.")
+    else:
+        prompts = {template: templates.get(template)["prompt"] or ""}
+    for name in extra_templates:
+        if name in prompts or name == CUSTOM_PROMPT:
+            continue
+        if templates.get(name) is None:
+            raise ValueError(f"Unknown template: {name}.")
+        prompts[name] = templates.get(name)["prompt"] or ""
+    return prompts
+
+
+class PreparedSummary:
+    """A request after prepare(): its prompts, the transcript the model will see, and its ticket."""
+
+    def __init__(self, request, prompts, llm_transcript, model_name, start_time):
+        self.request = request
+        self.prompts = prompts
+        self.llm_transcript = llm_transcript
+        self.model_name = model_name
+        self.start_time = start_time
+        self.notes = []
+        self.cache_key = None
+        self.cached = None
+        self.ticket = None
+        # Why the model will not be asked, when prepare() already knows it has to fall back.
+        self.fallback = None
+
+    @property
+    def multi_template(self):
+        return len(self.prompts) > 1
+
+
+class Summarizer:
+    """
+    Runs summary requests against one AIHandler, with the process's caches and scheduler.
+
+    Args:
+        handler (AIHandler): Used for every engine.
+        template_cache (TemplateCache): Resolves template names to prompts.
+        audit_log (AuditLogWriter): Every summary is logged to it.
+        summary_cache (SummaryCache): Summaries by transcript, prompt and model.
+        flight (SingleFlight): Coalesces identical requests in flight.
+        scheduler (FairScheduler): Admits and orders Ollama requests; None runs them at once.
+        retrieval_token_budget (int): Custom Prompt transcripts longer than this are cut to
+            their most relevant passages.
+        retrieval_passage_tokens (int): Passage size for that selection.
+        extractive_fallback (bool): Fall back to an extractive summary when Ollama is unavailable.
+    """
+
+    def __init__(self, handler, template_cache, audit_log, summary_cache, flight, scheduler=None,
+                 retrieval_token_budget=4000, retrieval_passage_tokens=200, extractive_fallback=True):
+        self.handler = handler
+        self.template_cache = template_cache
+        self.audit_log = audit_log
+        self.summary_cache = summary_cache
+        self.flight = flight
+        self.scheduler = scheduler
+        self.retrieval_token_budget = retrieval_token_budget
+        self.retrieval_passage_tokens = retrieval_passage_tokens
+        self.extractive_fallback = extractive_fallback
+        self.logger = logging.getLogger(__name__)
+        # Follow-up questions on the same transcript reuse its passage index.
+        self._indexes = collections.OrderedDict()
+        self._indexes_lock = threading.Lock()
+
+    def run(self, request, on_text=None, on_queue=None):
+        """
+        Summarizes a request.
+
+        Args:
+            on_text (callable): Called with the summary text so far as it streams in.
+            on_queue (callable): Called with (position, estimated wait in seconds) while the
+                request waits for the scheduler, and with (0, 0.0) once it starts.
+
+        Raises:
+            ValueError: If the request names an unknown template or lacks its prompt.
+            Overloaded: If the scheduler refused it and there is no fallback.
+            TimeoutError: If the model missed its deadline and there is no fallback.
+        """
+        return self.execute(self.prepare(request), on_text, on_queue)
+
+    def model_name(self, engine):
+        if engine not in (OLLAMA, GEMINI, EXTRACTIVE):
+            raise ValueError(f"Unknown engine: {engine}.")
+        return {GEMINI: "gemini-pro", EXTRACTIVE: "extractive"}.get(engine, self.handler.ollama_model)
+
+    def prepare(self, request):
+        """Resolves, compacts and selects passages, checks the cache and admits the request."""
+        start_time = time.time()
+        extra_templates = request.extra_templates if request.engine == OLLAMA else []
+        prompts = resolve_prompts(self.template_cache.get(), request.template, request.custom_prompt, extra_templates)
+        prepared = PreparedSummary(request, prompts, request.transcript, self.model_name(request.engine), start_time)
+
+        # The model sees the compacted transcript; the audit log keeps the original.
+        if request.compact:
+            with span("compact"):
+                prepared.llm_transcript, compaction_stats = compact_transcript(request.transcript)
+            increment("compaction_tokens_saved_total", compaction_stats.tokens_saved)
+        prompt = prompts[request.template]
+        if request.retrieval and request.template == CUSTOM_PROMPT and not prepared.multi_template:
+            with span("retrieve"):
+                selection = self._passage_index(prepared.llm_transcript).select(prompt, self.retrieval_token_budget)
+            if not selection.full_transcript:
+                prepared.llm_transcript = selection.text
+                increment("retrieval_tokens_saved_total", selection.total_tokens - selection.tokens)
+                prepared.notes.append(("caption", f"Answering from {selection.describe()}."))
+            self.logger.info(f"Passage selection: {selection.describe()}")
+
+        if not prepared.multi_template:
+            prepared.cache_key = self.summary_cache.key(prepared.llm_transcript, prompt, prepared.model_name)
+            prepared.cached = self.summary_cache.get(prepared.cache_key)
+        if prepared.cached is None and request.engine == OLLAMA and self.scheduler is not None:
+            cost = estimate_cost(prepared.llm_transcript, list(prompts.values()), self.handler.max_chunk_tokens)
+            try:
+                prepared.ticket = self.scheduler.submit(request.user or "anonymous", cost)
+            except Overloaded as e:
+                if not self.extractive_fallback or prepared.multi_template:
+                    raise
+                prepared.fallback = e
+        return prepared
+
+    def execute(self, prepared, on_text=None, on_queue=None):
+        """Generates the summary for a prepared request; see run()."""
+        try:
+            if prepared.multi_template:
+                return self._summarize_multi(prepared, on_queue)
+            return self._summarize(prepared, on_text, on_queue)
+        finally:
+            if prepared.ticket is not None:
+                prepared.ticket.release()
+
+    def _summarize(self, prepared, on_text, on_queue):
+        request, transcript = prepared.request, prepared.llm_transcript
+        prompt = prepared.prompts[request.template]
+        engine, model_name = request.engine, prepared.model_name
+        response, time_to_first_token, generation_infos = prepared.cached, None, []
+        cache_hit, coalesced = response is not None, False
+        if cache_hit:
+            self.logger.info("Summary served from cache.")
+        else:
+            def generate():
+                if engine == EXTRACTIVE:
+                    summary = self.handler.generate_summary_extractive(transcript, prompt)
+                    self.summary_cache.put(prepared.cache_key, summary)
+                    return summary, None, []
+                if engine == GEMINI:
+                    summary = self.handler.generate_summary_gemini(transcript, prompt)
+                    self.summary_cache.put(prepared.cache_key, summary)
+                    return summary, None, []
+                self._wait_turn(prepared, on_queue)
+                stream = self.handler.stream_summary_ollama(transcript, prompt)
+                text = ""
+                for fragment in stream:
+                    text += fragment
+                    if on_text is not None:
+                        on_text(text)
+                self.summary_cache.put(prepared.cache_key, stream.text)
+                return stream.text, stream.time_to_first_token, stream.generation_infos
+
+            def release_ticket():
+                # A request waiting on an identical one holds no slot or budget of its own;
+                # otherwise it could hold the very slot the one it waits on is queued for.
+                if prepared.ticket is not None:
+                    prepared.ticket.release()
+
+            try:
+                if prepared.fallback is not None:
+                    raise prepared.fallback
+                # An identical request already running elsewhere is awaited, not regenerated.
+                (response, time_to_first_token, generation_infos), coalesced = self.flight.do(
+                    prepared.cache_key, generate, on_wait=release_ticket
+                )
+            except (*UNAVAILABLE_ERRORS, Overloaded) as e:
+                if not self.extractive_fallback or engine == EXTRACTIVE:
+                    raise
+                # Not cached, so the next request for it tries the model again.
+                increment("summary_fallbacks_total", model=model_name, reason=type(e).__name__)
+                self.logger.warning(f"{engine} unavailable ({type(e).__name__}: {e}); falling back to an extractive summary.")
+                prepared.notes.append((
+                    "warning",
+                    f"{engine} did not answer in time, so this summary was put together from sentences in "
+                    "the transcript. Try again later for a full AI summary.",
+                ))
+                response = self.handler.generate_summary_extractive(transcript, prompt)
+                time_to_first_token, generation_infos = None, []
+                engine, model_name = EXTRACTIVE, "extractive"
+            if coalesced:
+                time_to_first_token = None
+                self.logger.info("Summary shared with an identical in-flight request.")
+
+        # Prefer the token counts Ollama reports; fall back to tiktoken for cache hits and other engines.
+        with span("tokenize"):
+            usage = token_usage(transcript, response, generation_infos)
+        duration = round(time.time() - prepared.start_time, 2)
+        cold_start = any(info.get("cold_start") for info in generation_infos)
+        self.logger.info(f"Token usage: {usage.describe()}" + (" (model was loaded cold)" if cold_start else ""))
+        record_span("request", duration, model=model_name, cache_hit=cache_hit, coalesced=coalesced, cold_start=cold_start)
+        increment("summaries_total", model=model_name, cache_hit=cache_hit, coalesced=coalesced)
+        increment("input_tokens_total", usage.input_tokens, model=model_name)
+        increment("output_tokens_total", usage.output_tokens, model=model_name)
+
+        self.audit_log.log_entry(
+            event=(
+                "Meeting Summary (Cache Hit)" if cache_hit
+                else "Meeting Summary (Coalesced)" if coalesced
+                else "Meeting Summary (Extractive Fallback)" if engine != request.engine
+                else "Meeting Summary"
+            ),
+            model=engine,
+            input_message=request.transcript,
+            output_message=response,
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            duration=duration,
+            error_message=None,
+            user_id=request.user_id,
+            user_rating=None,
+            user_feedback="",
+            created_date=datetime.datetime.now(),
+            custom_prompt=prompt if request.template == CUSTOM_PROMPT else None,
+            template_name=request.template,
+        )
+        self.logger.info(
+            f"Summary generated successfully. Time to first token: {time_to_first_token}s, total: {duration}s."
+        )
+        return SummaryResult(
+            {request.template: response}, request.template, engine, model_name,
+            usage.input_tokens, usage.output_tokens, duration, time_to_first_token,
+            cache_hit, coalesced, cold_start, prepared.notes,
+        )
+
+    def _summarize_multi(self, prepared, on_queue):
+        request, transcript, prompts = prepared.request, prepared.llm_transcript, prepared.prompts
+        self._wait_turn(prepared, on_queue)
+        result = self.handler.generate_summaries_ollama(transcript, prompts)
+        duration = round(time.time() - prepared.start_time, 2)
+        record_span("request", duration, model=prepared.model_name, templates=len(prompts))
+        increment("summaries_total", len(prompts), model=prepared.model_name, multi_template=True)
+        prepared.notes.append(("caption", f"Shared transcript across {len(prompts)} templates: {result.describe()}"))
+
+        input_tokens = output_tokens = 0
+        for name, summary in result.summaries.items():
+            self.summary_cache.put(self.summary_cache.key(transcript, prompts[name], prepared.model_name), summary)
+            usage = token_usage(transcript, summary, result.generation_infos[name])
+            input_tokens += usage.input_tokens
+            output_tokens += usage.output_tokens
+            self.audit_log.log_entry(
+                event="Meeting Summary (Multi-Template)",
+                model=request.engine,
+                input_message=request.transcript,
+                output_message=summary,
+                input_tokens=usage.input_tokens,
+                output_tokens=usage.output_tokens,
+                duration=duration,
+                error_message=None,
+                user_id=request.user_id,
+                user_rating=None,
+                user_feedback="",
+                created_date=datetime.datetime.now(),
+                custom_prompt=prompts[name] if name == CUSTOM_PROMPT else None,
+                template_name=name,
+            )
+        self.logger.info(f"Multi-template summary generated in {duration}s: {result.describe()}")
+        summaries = {name: result.summaries[name] for name in prompts}
+        return SummaryResult(
+            summaries, request.template, request.engine, prepared.model_name,
+            input_tokens, output_tokens, duration, notes=prepared.notes,
+        )
+
+    def _wait_turn(self, prepared, on_queue):
+        if prepared.ticket is None:
+            return
+        if prepared.ticket.finished:
+            # Given up to wait on an identical request, which was then interrupted; queue again.
+            prepared.ticket = self.scheduler.submit(prepared.ticket.user, prepared.ticket.cost)
+        prepared.ticket.wait(on_progress=on_queue)
+        if on_queue is not None:
+            on_queue(0, 0.0)
+
+    def _passage_index(self, transcript):
+        key = transcript_key(transcript)
+        with self._indexes_lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        index = PassageIndex(transcript, self.retrieval_passage_tokens)
+        with self._indexes_lock:
+            self._indexes[key] = index
+            while len(self._indexes) > 8:
+                self._indexes.popitem(last=False)
+        return index
+
+
+def summarizer_from_env(db, audit_log, template_cache):
+    """
+    Builds a Summarizer configured from the environment, as the app and the service run it.
+
+    Starts the warm-up pings for its Ollama servers.
+    """
+    # OLLAMA_URLS may list several Ollama servers, comma-separated; requests go to the least busy one.
+    # Long transcripts are summarized in chunks of OLLAMA_MAX_CHUNK_TOKENS tokens, with
+    # OLLAMA_MAX_CONCURRENCY requests in flight; a request with no first token after
+    # OLLAMA_HEDGE_AFTER seconds is also sent to a second server. OLLAMA_BACKEND_CONCURRENCY caps
+    # generations per server across all requests, and OLLAMA_TIMEOUT is the deadline in seconds for
+    # one summary, after which the extractive fallback answers; set either to 0 to turn it off.
+    handler = AIHandler(
+        os.getenv("OLLAMA_URLS", "http://uatml1.itrans.int:11434/"),
+        os.getenv("OLLAMA_MODEL", "llama3.1"),
+        max_chunk_tokens=int(os.getenv("OLLAMA_MAX_CHUNK_TOKENS", "3000")),
+        max_concurrency=int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4")),
+        hedge_after=float(os.getenv("OLLAMA_HEDGE_AFTER", "0")) or None,
+        backend_concurrency=int(os.getenv("OLLAMA_BACKEND_CONCURRENCY", "4")) or None,
+        request_timeout=float(os.getenv("OLLAMA_TIMEOUT", "120")) or None,
+        keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+    )
+    # Idle servers are pinged every OLLAMA_WARM_INTERVAL seconds during OLLAMA_WARM_SCHEDULE
+    # (e.g. "mon-fri 07:00-19:00") so the model stays loaded.
+    warm_interval = float(os.getenv("OLLAMA_WARM_INTERVAL", "240"))
+    if warm_interval:
+        get_warmup_manager(handler.router, ping_interval=warm_interval, schedule=os.getenv("OLLAMA_WARM_SCHEDULE", ""))
+    # Ollama requests go through one fair scheduler per process (see scheduler.py): token budgets
+    # per minute, globally and per user, and a bounded queue that refuses work up front.
+    scheduler = get_scheduler(
+        max_running=int(os.getenv("SCHEDULER_MAX_RUNNING", "4")),
+        global_tokens_per_minute=int(os.getenv("SCHEDULER_GLOBAL_TPM", "0")) or None,
+        user_tokens_per_minute=int(os.getenv("SCHEDULER_USER_TPM", "0")) or None,
+        max_queue=int(os.getenv("SCHEDULER_MAX_QUEUE", "50")),
+        max_queued_per_user=int(os.getenv("SCHEDULER_MAX_QUEUED_PER_USER", "2")),
+        max_wait=float(os.getenv("SCHEDULER_MAX_WAIT", "300")),
+    )
+    return Summarizer(
+        handler,
+        template_cache,
+        audit_log,
+        # Summaries are cached by transcript, prompt and model, in memory and optionally on disk
+        get_summary_cache(
+            max_bytes=int(os.getenv("SUMMARY_CACHE_MB", "64")) * 1024 * 1024,
+            disk_path=os.getenv("SUMMARY_CACHE_PATH"),
+        ),
+        get_single_flight("summary"),
+        scheduler,
+        # Custom Prompt questions over transcripts longer than this many tokens only get the most
+        # relevant passages (see retrieval.py).
+        retrieval_token_budget=int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "4000")),
+        retrieval_passage_tokens=int(os.getenv("RETRIEVAL_PASSAGE_TOKENS", "200")),
+        # The extractive engine (see extractive.py) stands in when Ollama is unreachable,
+        # overloaded or misses its deadline, unless EXTRACTIVE_FALLBACK is off.
+        extractive_fallback=_flag("EXTRACTIVE_FALLBACK", "true"),
+    )
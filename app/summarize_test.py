@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from audit_log import AuditLogWriter
+from stubs import StubDB, StubOllamaServer
+from summarize import EXTRACTIVE, SummaryRequest, summarizer_from_env
+from template_cache import TemplateCache
+
+TRANSCRIPT = """Dana: The warehouse scanners keep dropping off the network on the night shift.
+Eli: We decided to replace the two oldest access points before the holiday peak.
+Dana: I will order the access points and schedule the install by Friday.
+Eli: The vendor also needs the floor plan to check the signal coverage.
+"""
+
+
+@pytest.fixture
+def ollama(monkeypatch):
+    # Slow enough to miss a short deadline before its first token.
+    server = StubOllamaServer(first_token_latency=2.0, output_tokens=5).start()
+    monkeypatch.setenv("OLLAMA_URLS", server.url)
+    monkeypatch.setenv("OLLAMA_MODEL", server.model)
+    monkeypatch.setenv("OLLAMA_WARM_INTERVAL", "0")
+    yield server
+    server.stop()
+
+
+def _summarizer(tmp_path):
+    db = StubDB(latency=0)
+    audit_log = AuditLogWriter(db, flush_interval=0.1, spill_path=str(tmp_path / "spill.jsonl"))
+    return summarizer_from_env(db, audit_log, TemplateCache(db)), db
+
+
+def test_ollama_has_a_deadline_and_a_backend_cap_by_default(tmp_path, ollama, monkeypatch):
+    monkeypatch.delenv("OLLAMA_TIMEOUT", raising=False)
+    monkeypatch.delenv("OLLAMA_BACKEND_CONCURRENCY", raising=False)
+    summarizer, _ = _summarizer(tmp_path)
+    assert summarizer.handler.request_timeout == 120
+    semaphore = summarizer.handler.router.endpoints[0].semaphore
+    assert isinstance(semaphore, asyncio.Semaphore) and semaphore._value == 4
+    summarizer.audit_log.close()
+
+
+def test_zero_turns_the_deadline_and_the_cap_off(tmp_path, ollama, monkeypatch):
+    monkeypatch.setenv("OLLAMA_TIMEOUT", "0")
+    monkeypatch.setenv("OLLAMA_BACKEND_CONCURRENCY", "0")
+    summarizer, _ = _summarizer(tmp_path)
+    assert summarizer.handler.request_timeout is None
+    assert not isinstance(summarizer.handler.router.endpoints[0].semaphore, asyncio.Semaphore)
+    summarizer.audit_log.close()
+
+
+def test_a_missed_deadline_falls_back_to_an_extractive_summary(tmp_path, ollama, monkeypatch, word_tokens):
+    monkeypatch.setenv("OLLAMA_TIMEOUT", "0.3")
+    summarizer, db = _summarizer(tmp_path)
+    request = SummaryRequest(TRANSCRIPT, "General Meeting", user="dana")
+
+    result = summarizer.run(request)
+    assert result.engine == EXTRACTIVE and result.model_name == "extractive"
+    assert "replace the two oldest access points" in result.summary
+    assert [kind for kind, _ in result.notes] == ["warning"]
+    # Not cached, so the next request tries the model again.
+    assert summarizer.summary_cache.get(summarizer.prepare(request).cache_key) is None
+
+    summarizer.audit_log.close()
+    assert db.log_rows[0]["event"] == "Meeting Summary (Extractive Fallback)"
+
+
+def test_a_missed_deadline_is_raised_without_the_fallback(tmp_path, ollama, monkeypatch, word_tokens):
+    monkeypatch.setenv("OLLAMA_TIMEOUT", "0.3")
+    monkeypatch.setenv("EXTRACTIVE_FALLBACK", "false")
+    summarizer, _ = _summarizer(tmp_path)
+    with pytest.raises(TimeoutError):
+        summarizer.run(SummaryRequest(TRANSCRIPT, "General Meeting", user="eli"))
+    summarizer.audit_log.close()
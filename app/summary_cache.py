@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def normalize_transcript(text: str) -> str:
+    """Normalizes a transcript so that cosmetic differences (line endings, spacing) map to the same key."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    lines = (re.sub(r"[ \t]+", " ", line).strip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def summary_cache_key(transcript: str, prompt: str, model: str) -> str:
+    """Returns the content hash identifying a summary of transcript with prompt on model."""
+    digest = hashlib.sha256()
+    for part in (model, prompt.strip(), normalize_transcript(transcript)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    """
+    Content-addressed cache of generated summaries.
+
+    Summaries are kept in an in-memory LRU tier bounded by max_bytes of summary text and,
+    if disk_path is given, in a SQLite file that survives restarts. Disk hits are promoted
+    back into memory.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_path=None):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+        if disk_path:
+            with self._connect() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT NOT NULL, created REAL NOT NULL)"
+                )
+
+    def key(self, transcript, prompt, model):
+        """Returns the cache key for a transcript, prompt and model."""
+        return summary_cache_key(transcript, prompt, model)
+
+    def get(self, key):
+        """Returns the cached summary for key, or None."""
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return summary
+
+        summary = self._get_from_disk(key)
+        with self._lock:
+            if summary is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._put_in_memory(key, summary)
+        return summary
+
+    def put(self, key, summary):
+        """Stores a summary in both tiers."""
+        if not summary:
+            return
+        with self._lock:
+            self._put_in_memory(key, summary)
+        if self.disk_path:
+            try:
+                with self._connect() as connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO summaries (key, summary, created) VALUES (?, ?, ?)",
+                        (key, summary, time.time()),
+                    )
+            except sqlite3.Error:
+                self.logger.error("Failed to write summary to disk cache", exc_info=True)
+
+    def stats(self):
+        """Returns hit/miss counts and memory tier usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _put_in_memory(self, key, summary):
+        size = len(summary.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key).encode("utf-8"))
+        self._entries[key] = summary
+        self._size += size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.encode("utf-8"))
+
+    def _get_from_disk(self, key):
+        if not self.disk_path:
+            return None
+        try:
+            with self._connect() as connection:
+                row = connection.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error:
+            self.logger.error("Failed to read summary from disk cache", exc_info=True)
+            return None
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.disk_path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+# The cache is shared across Streamlit sessions and reruns.
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_summary_cache(max_bytes=64 * 1024 * 1024, disk_path=None):
+    """Returns the process-wide summary cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SummaryCache(max_bytes, disk_path)
+        return _cache
@@ -0,0 +1,55 @@
+from summary_cache import SummaryCache, summary_cache_key
+
+
+def test_cosmetic_differences_share_a_key():
+    transcript = "Alice:  We ship on Friday.\r\nBob:\tOK.\r\n\r\n\r\n\r\nCarol: Agreed."
+    assert summary_cache_key(transcript, "Summarize.", "llama3.1") == summary_cache_key(
+        "Alice: We ship on Friday.\nBob: OK.\n\nCarol: Agreed.\n", "  Summarize.\n", "llama3.1"
+    )
+
+
+def test_the_prompt_the_model_and_the_words_change_the_key():
+    key = summary_cache_key("Alice: We ship on Friday.", "Summarize.", "llama3.1")
+    assert summary_cache_key("Alice: We ship on Monday.", "Summarize.", "llama3.1") != key
+    assert summary_cache_key("Alice: We ship on Friday.", "List the actions.", "llama3.1") != key
+    assert summary_cache_key("Alice: We ship on Friday.", "Summarize.", "mistral") != key
+    # The parts are separated, so text cannot move between them without changing the key.
+    assert summary_cache_key("b", "a", "m") != summary_cache_key("", "ab", "m")
+
+
+def test_the_memory_tier_evicts_the_least_recently_used_by_size():
+    cache = SummaryCache(max_bytes=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+    cache.put("c", "cccc")
+    assert cache.get("b") is None and cache.get("a") == "aaaa" and cache.get("c") == "cccc"
+    assert cache.stats()["bytes"] == 8
+
+    # Too large to keep at all; nothing else is evicted for it.
+    cache.put("d", "d" * 11)
+    assert cache.get("d") is None and cache.stats()["entries"] == 2
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (3, 2)
+
+
+def test_empty_summaries_are_not_cached():
+    cache = SummaryCache()
+    cache.put("a", "")
+    assert cache.get("a") is None and cache.stats()["entries"] == 0
+
+
+def test_the_disk_tier_survives_a_restart_and_refills_memory(tmp_path):
+    path = str(tmp_path / "summaries.sqlite")
+    SummaryCache(disk_path=path).put("a", "summary")
+
+    cache = SummaryCache(disk_path=path)
+    assert cache.stats()["entries"] == 0
+    assert cache.get("a") == "summary"
+    assert cache.stats()["entries"] == 1
+    assert cache.get("missing") is None
+
+
+def test_a_zero_byte_memory_tier_still_uses_the_disk(tmp_path):
+    cache = SummaryCache(max_bytes=0, disk_path=str(tmp_path / "summaries.sqlite"))
+    cache.put("a", "summary")
+    assert cache.get("a") == "summary" and cache.stats()["entries"] == 0
@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+
+
+class TemplateSnapshot:
+    """An immutable view of the templates with O(1) lookups by name."""
+
+    def __init__(self, templates, version=None):
+        self.templates = templates
+        self.version = version
+        self.names = [template["name"] for template in templates]
+        self.by_name = {template["name"]: template for template in templates}
+        self.positions = {name: index for index, name in enumerate(self.names)}
+        self.loaded_at = time.time()
+
+    def get(self, name):
+        """Returns the template with the given name, or None."""
+        return self.by_name.get(name)
+
+    def index_of(self, name, default=0):
+        """Returns the position of a template in names, e.g. for a selectbox index."""
+        return self.positions.get(name, default)
+
+
+class TemplateCache:
+    """
+    Process-wide cache of INTELLINOTES_PROMPTS.
+
+    Within the TTL the cached snapshot is served without touching the database. After the
+    TTL a cheap version query decides whether the templates (and their PROMPT CLOBs) need
+    to be read again. If the database cannot be reached, the last good snapshot is served.
+    """
+
+    def __init__(self, db, ttl=300):
+        self.db = db
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._snapshot = TemplateSnapshot([])
+        self._version = None
+        self._checked_at = None
+
+    def get(self):
+        """Returns the current template snapshot, refreshing it first if the TTL has expired."""
+        if self._checked_at is not None and time.time() - self._checked_at < self.ttl:
+            return self._snapshot
+
+        with self._lock:
+            # Another session may have refreshed while we waited for the lock.
+            if self._checked_at is None or time.time() - self._checked_at >= self.ttl:
+                self._refresh()
+            return self._snapshot
+
+    def invalidate(self):
+        """Forces the next get() to re-read the templates from the database."""
+        with self._lock:
+            self._checked_at = None
+            self._version = None
+
+    def _refresh(self):
+        version = self.db.fetch_templates_version()
+        if version is None:
+            self.logger.warning("Template version check failed; serving cached templates.")
+            self._checked_at = time.time() if self._snapshot.templates else None
+            return
+
+        if version == self._version:
+            self._checked_at = time.time()
+            return
+
+        templates = self.db.fetch_templates()
+        if not templates and version[0]:
+            # The table has rows but they could not be read; keep the last good snapshot.
+            self.logger.warning("Template fetch failed; serving cached templates.")
+            self._checked_at = time.time() if self._snapshot.templates else None
+            return
+
+        self._snapshot = TemplateSnapshot(templates, version)
+        self._version = version
+        self._checked_at = time.time()
+        self.logger.info(f"Template cache refreshed with {len(templates)} templates.")
+
+
+# Caches are shared across Streamlit sessions and reruns, keyed by (user, dsn).
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_template_cache(db, ttl=300):
+    """Returns the process-wide template cache for the database behind db."""
+    key = (db.user, db.dsn)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = TemplateCache(db, ttl)
+        return _caches[key]
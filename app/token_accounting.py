@@ -0,0 +1,121 @@
+import functools
+
+NANOSECONDS = 1e9
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base"):
+    """Returns the tiktoken encoding, importing tiktoken and loading the encoding once per process."""
+    import tiktoken
+
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """Returns the number of tokens in text."""
+    return len(get_encoding(encoding_name).encode_ordinary(text))
+
+
+def count_tokens_batch(texts, encoding_name: str = "cl100k_base", num_threads: int = 8):
+    """
+    Returns the number of tokens in each text, encoding them in parallel.
+
+    Args:
+        texts (list): Texts to count.
+        encoding_name (str): Name of the encoding to use. Default is 'cl100k_base'.
+        num_threads (int): Threads tiktoken may use for the batch.
+
+    Returns:
+        list: Token counts, in the order of texts.
+    """
+    encoded = get_encoding(encoding_name).encode_ordinary_batch(list(texts), num_threads=num_threads)
+    return [len(tokens) for tokens in encoded]
+
+
+class TokenUsage:
+    """
+    Token counts and throughput for one summary.
+
+    Counts come from Ollama's generation metadata (prompt_eval_count / eval_count) when it is
+    available, and from tiktoken otherwise; source records which one was used. Durations are
+    in seconds and are None when the backend did not report them.
+    """
+
+    def __init__(self, input_tokens, output_tokens, source, prompt_eval_seconds=None,
+                 eval_seconds=None, load_seconds=None, requests=1):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.source = source
+        self.prompt_eval_seconds = prompt_eval_seconds
+        self.eval_seconds = eval_seconds
+        self.load_seconds = load_seconds
+        self.requests = requests
+
+    @classmethod
+    def from_generation_info(cls, generation_infos):
+        """
+        Builds usage from Ollama generation metadata, summing over several requests if given a list.
+
+        Returns:
+            TokenUsage: The combined usage, or None if no request reported token counts.
+        """
+        if isinstance(generation_infos, dict):
+            generation_infos = [generation_infos]
+        infos = [info for info in generation_infos or [] if info and info.get("eval_count") is not None]
+        if not infos:
+            return None
+
+        def total(field, scale=1):
+            values = [info.get(field) for info in infos if info.get(field) is not None]
+            return sum(values) / scale if values else None
+
+        return cls(
+            input_tokens=int(total("prompt_eval_count") or 0),
+            output_tokens=int(total("eval_count")),
+            source="ollama",
+            prompt_eval_seconds=total("prompt_eval_duration", NANOSECONDS),
+            eval_seconds=total("eval_duration", NANOSECONDS),
+            load_seconds=total("load_duration", NANOSECONDS),
+            requests=len(infos),
+        )
+
+    @property
+    def prompt_tokens_per_second(self):
+        if not self.prompt_eval_seconds:
+            return None
+        return round(self.input_tokens / self.prompt_eval_seconds, 2)
+
+    @property
+    def output_tokens_per_second(self):
+        if not self.eval_seconds:
+            return None
+        return round(self.output_tokens / self.eval_seconds, 2)
+
+    def describe(self):
+        """Returns a one-line description for the application log."""
+        return (
+            f"input_tokens={self.input_tokens} output_tokens={self.output_tokens} source={self.source} "
+            f"requests={self.requests} prompt_tps={self.prompt_tokens_per_second} "
+            f"output_tps={self.output_tokens_per_second}"
+        )
+
+
+def token_usage(input_text: str, output_text: str, generation_infos=None, encoding_name: str = "cl100k_base"):
+    """
+    Returns the token usage of a summary.
+
+    Args:
+        input_text (str): Input text.
+        output_text (str): Output text.
+        generation_infos (dict or list, optional): Ollama generation metadata for the request(s)
+            that produced output_text. Its counts are used when present.
+        encoding_name (str): Encoding used when the backend did not report counts.
+
+    Returns:
+        TokenUsage: Token counts and, when reported by Ollama, throughput.
+    """
+    usage = TokenUsage.from_generation_info(generation_infos)
+    if usage is not None:
+        return usage
+    input_tokens, output_tokens = count_tokens_batch([input_text, output_text], encoding_name)
+    return TokenUsage(input_tokens, output_tokens, source="tiktoken")
@@ -1,9 +1,14 @@
 import os
 from dotenv import load_dotenv
-import tiktoken
 import oracledb
 import logging
 import datetime
+import re
+import threading
+import time
+from blob_store import BlobWriter, MESSAGE_COLUMNS, read_blobs
+from metrics import timed
+from token_accounting import count_tokens_batch, get_encoding
 
 # Configure logging
 logging.basicConfig(
@@ -13,29 +18,193 @@ logging.basicConfig(
 )
 
 
+# The texts are stored once in INTELLINOTES_BLOBS; rows reference them by hash (see blob_store.py).
+LOG_INSERT_SQL = """
+    INSERT INTO INTELLINOTES_LOG (
+        LOGID, EVENT, MODEL, INPUT_HASH, OUTPUT_HASH,
+        INPUT_TOKENS, OUTPUT_TOKENS, DURATION, ERRORMESSAGE,
+        USERID, USER_RATING, USER_FEEDBACK, CREATEDATE, CUSTOM_PROMPT_HASH, TEMPLATE_NAME
+    ) VALUES (
+        SQ_INTELLINOTES_LOG.NEXTVAL, :event, :model, :input_hash, :output_hash,
+        :input_tokens, :output_tokens, :duration, :error_message,
+        :user_id, :user_rating, :user_feedback, :created_date, :custom_prompt_hash, :template_name
+    )
+"""
+
+LOG_SELECT_SQL = """
+    SELECT LOGID, EVENT, MODEL, INPUT_MESSAGE, OUTPUT_MESSAGE, CUSTOM_PROMPT,
+           INPUT_HASH, OUTPUT_HASH, CUSTOM_PROMPT_HASH,
+           INPUT_TOKENS, OUTPUT_TOKENS, DURATION, ERRORMESSAGE AS ERROR_MESSAGE,
+           USERID AS USER_ID, USER_RATING, USER_FEEDBACK, CREATEDATE AS CREATED_DATE, TEMPLATE_NAME
+    FROM INTELLINOTES_LOG
+    WHERE LOGID = :logid
+"""
+
+FEEDBACK_INSERT_SQL = """
+    INSERT INTO IntelliNotes_Feedback (
+        LOGID, USERID, USER_FEEDBACK, USER_RATING, CREATED_DATE
+    ) VALUES (
+        :logid, :user_id, :user_feedback, :user_rating, :created_date
+    )
+"""
+
+
+class ConnectionPool:
+    """
+    A session pool shared by every DBOracle with the same user and DSN in this process.
+
+    Wraps an oracledb pool and keeps acquire statistics so the pool can be sized under load.
+    """
+
+    def __init__(self, user, password, dsn, min_size, max_size, increment, acquire_timeout, ping_interval):
+        self.pool = oracledb.create_pool(
+            user=user,
+            password=password,
+            dsn=dsn,
+            min=min_size,
+            max=max_size,
+            increment=increment,
+            getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+            wait_timeout=int(acquire_timeout * 1000),
+            ping_interval=ping_interval,
+        )
+        # Blob hashes known to be committed in this database, shared by every writer.
+        self.blob_writer = BlobWriter()
+        self.lock = threading.Lock()
+        self.acquires = 0
+        self.waits = 0
+        self.failed_acquires = 0
+        self.total_acquire_time = 0.0
+        self.max_acquire_time = 0.0
+
+    def acquire(self):
+        """Acquires a connection, waiting at most the acquire timeout for one to be released."""
+        # Every session is checked out: this caller has to wait for a release or a new session.
+        waited = self.pool.busy >= self.pool.max
+        start_time = time.perf_counter()
+        try:
+            connection = self.pool.acquire()
+        except oracledb.DatabaseError:
+            with self.lock:
+                self.waits += int(waited)
+                self.failed_acquires += 1
+            raise
+        elapsed = time.perf_counter() - start_time
+        with self.lock:
+            self.acquires += 1
+            self.waits += int(waited)
+            self.total_acquire_time += elapsed
+            self.max_acquire_time = max(self.max_acquire_time, elapsed)
+        return connection
+
+    def stats(self):
+        """Returns a snapshot of pool usage and acquire latency."""
+        with self.lock:
+            return {
+                "min": self.pool.min,
+                "max": self.pool.max,
+                "opened": self.pool.opened,
+                "in_use": self.pool.busy,
+                "acquires": self.acquires,
+                "waits": self.waits,
+                "failed_acquires": self.failed_acquires,
+                "avg_acquire_ms": round(1000 * self.total_acquire_time / self.acquires, 2) if self.acquires else 0.0,
+                "max_acquire_ms": round(1000 * self.max_acquire_time, 2),
+            }
+
+
+# Pools are shared across Streamlit sessions and reruns, keyed by (user, dsn).
+_pools = {}
+_pools_lock = threading.Lock()
+
+
 class DBOracle:
-    def __init__(self, user: str, password: str, dsn: str):
+    def __init__(self, user: str, password: str, dsn: str, pool_min: int = 1, pool_max: int = 4,
+                 pool_increment: int = 1, acquire_timeout: float = 5, ping_interval: int = 60):
+        """
+        Args:
+            user (str): Database user.
+            password (str): Database password.
+            dsn (str): Database DSN.
+            pool_min (int): Sessions the shared pool keeps open.
+            pool_max (int): Upper bound on sessions in the shared pool.
+            pool_increment (int): Sessions opened at a time when the pool grows.
+            acquire_timeout (float): Seconds to wait for a free session before giving up.
+            ping_interval (int): Seconds a session may sit idle before it is pinged on acquire.
+        """
         self.user = user
         self.password = password
         self.dsn = dsn
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self.pool_increment = pool_increment
+        self.acquire_timeout = acquire_timeout
+        self.ping_interval = ping_interval
         self.logger = logging.getLogger(__name__)
 
+    def get_pool(self):
+        """Returns the process-wide pool for this user and DSN, creating it on first use."""
+        key = (self.user, self.dsn)
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = ConnectionPool(
+                    self.user, self.password, self.dsn, self.pool_min, self.pool_max,
+                    self.pool_increment, self.acquire_timeout, self.ping_interval,
+                )
+                self.logger.info(f"Created database session pool (min={self.pool_min}, max={self.pool_max}).")
+            return _pools[key]
+
     def get_connection(self):
-        """Establishes and returns a connection to the Oracle database."""
+        """Acquires a connection from the shared pool; closing it returns it to the pool."""
         try:
-            connection = oracledb.connect(user=self.user, password=self.password, dsn=self.dsn)
-            self.logger.info("Successfully connected to the database.")
-            return connection
+            return self.get_pool().acquire()
         except oracledb.DatabaseError as e:
             self.logger.error("Database connection error", exc_info=True)
             return None
-        
+
+    def check_health(self):
+        """
+        Checks that a pooled connection can reach the database.
+
+        Returns:
+            bool: True if a connection was acquired and answered a ping, False otherwise.
+        """
+        connection = self.get_connection()
+        if not connection:
+            return False
+        try:
+            connection.ping()
+            return True
+        except oracledb.DatabaseError:
+            self.logger.error("Database health check failed", exc_info=True)
+            return False
+        finally:
+            connection.close()
+
+    def pool_stats(self):
+        """
+        Returns usage statistics for the shared pool.
+
+        Returns:
+            dict: Pool size, sessions in use, acquire count, waits, failed acquires and acquire latency,
+            or an empty dict if the pool could not be created.
+        """
+        try:
+            return self.get_pool().stats()
+        except oracledb.DatabaseError:
+            self.logger.error("Database pool unavailable", exc_info=True)
+            return {}
+
+    @timed("db_log", table="INTELLINOTES_LOG")
     def log_entry(self, event, model, input_message, output_message=None, 
               input_tokens=None, output_tokens=None, duration=None, 
               error_message=None, user_id=None, user_rating=None, 
-              user_feedback=None, created_date=None, custom_prompt=None):
+              user_feedback=None, created_date=None, custom_prompt=None, template_name=None):
         """
-        Logs an event into the INTELLINOTES_LOG table with CLOB support.
+        Logs an event into the INTELLINOTES_LOG table.
+
+        The transcript, summary and custom prompt go to the blob store (see blob_store.py)
+        and the row references them by hash.
         """
         connection = self.get_connection()  # Ensure parentheses to execute the method
         if not connection:
@@ -43,38 +212,12 @@ class DBOracle:
             return False
         
         try:
-            with connection.cursor() as cursor:  # Correctly use the cursor object
-                # Prepare CLOB for input_message
-                input_clob = connection.createlob(oracledb.DB_TYPE_CLOB)
-                if input_message:
-                    input_clob.write(input_message)
-
-                # Prepare CLOB for output_message
-                output_clob = connection.createlob(oracledb.DB_TYPE_CLOB)
-                if output_message:
-                    output_clob.write(output_message)
-
-                # Prepare CLOB for custom_prompt
-                custom_prompt_clob = connection.createlob(oracledb.DB_TYPE_CLOB)
-                if custom_prompt:
-                    custom_prompt_clob.write(custom_prompt)
-
-                # Execute the INSERT statement
-                cursor.execute("""
-                    INSERT INTO INTELLINOTES_LOG (
-                            LOGID, EVENT, MODEL, INPUT_MESSAGE, OUTPUT_MESSAGE,
-                        INPUT_TOKENS, OUTPUT_TOKENS, DURATION, ERRORMESSAGE,
-                        USERID, USER_RATING, USER_FEEDBACK, CREATEDATE, CUSTOM_PROMPT
-                    ) VALUES (
-                        SQ_INTELLINOTES_LOG.NEXTVAL, :event, :model, :input_message, :output_message,
-                        :input_tokens, :output_tokens, :duration, :error_message,
-                        :user_id, :user_rating, :user_feedback, :created_date, :custom_prompt
-                    )
-                """, {
+            with connection.cursor() as cursor:
+                self._insert_log_rows(connection, cursor, [{
                     "event": event,
                     "model": model,
-                    "input_message": input_clob if input_message else None,
-                    "output_message": output_clob if output_message else None,
+                    "input_message": input_message,
+                    "output_message": output_message,
                     "input_tokens": input_tokens,
                     "output_tokens": output_tokens,
                     "duration": duration,
@@ -82,12 +225,10 @@ class DBOracle:
                     "user_id": user_id,
                     "user_rating": user_rating,
                     "user_feedback": user_feedback,
-                    "created_date": created_date or datetime.datetime.now(),
-                    "custom_prompt": custom_prompt_clob if custom_prompt else None
-                })
-
-                connection.commit()
-
+                    "created_date": created_date,
+                    "custom_prompt": custom_prompt,
+                    "template_name": template_name,
+                }])
                 self.logger.info(f"Logged entry: {event} with model {model}.")
                 return True
         except Exception as e:
@@ -96,6 +237,7 @@ class DBOracle:
         finally:
             connection.close()
             
+    @timed("db_log", table="IntelliNotes_Feedback")
     def log_feedback(self, logid: int, user_id: int, user_feedback: str, user_rating: int, created_date=None):
         """
         Logs feedback into the IntelliNotes_Feedback table.
@@ -117,13 +259,7 @@ class DBOracle:
 
         try:
             with connection.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO IntelliNotes_Feedback (
-                        LOGID, USERID, USER_FEEDBACK, USER_RATING, CREATED_DATE
-                    ) VALUES (
-                        :logid, :user_id, :user_feedback, :user_rating, :created_date
-                    )
-                """, {
+                cursor.execute(FEEDBACK_INSERT_SQL, {
                     "logid": logid,
                     "user_id": user_id,
                     "user_feedback": user_feedback,
@@ -141,6 +277,136 @@ class DBOracle:
             connection.close()
 
 
+    @timed("db_log", table="INTELLINOTES_LOG", mode="batch")
+    def log_entries(self, entries):
+        """
+        Logs a batch of events into the INTELLINOTES_LOG table with a single executemany and commit.
+
+        Args:
+            entries (list): Dictionaries with the same keys as the log_entry arguments.
+
+        Returns:
+            bool: True if the whole batch was written, False otherwise.
+        """
+        connection = self.get_connection()
+        if not connection:
+            self.logger.error("Failed to log events: Database connection error.")
+            return False
+
+        try:
+            with connection.cursor() as cursor:
+                self._insert_log_rows(connection, cursor, entries)
+                self.logger.info(f"Logged {len(entries)} entries.")
+                return True
+        except Exception as e:
+            self.logger.error("Failed to log entries", exc_info=True)
+            return False
+        finally:
+            connection.close()
+
+    def _insert_log_rows(self, connection, cursor, entries):
+        """Stores the entries' texts in the blob store, inserts the rows and commits."""
+        blob_writer = self.get_pool().blob_writer
+        texts = [entry.get(field) for entry in entries for field in MESSAGE_COLUMNS]
+        hashes = blob_writer.store(cursor, texts)
+        rows = []
+        for index, entry in enumerate(entries):
+            input_hash, output_hash, custom_prompt_hash = hashes[index * 3:index * 3 + 3]
+            rows.append({
+                "event": entry["event"],
+                "model": entry["model"],
+                "input_hash": input_hash,
+                "output_hash": output_hash,
+                "input_tokens": entry.get("input_tokens"),
+                "output_tokens": entry.get("output_tokens"),
+                "duration": entry.get("duration"),
+                "error_message": entry.get("error_message"),
+                "user_id": entry.get("user_id"),
+                "user_rating": entry.get("user_rating"),
+                "user_feedback": entry.get("user_feedback"),
+                "created_date": entry.get("created_date") or datetime.datetime.now(),
+                "custom_prompt_hash": custom_prompt_hash,
+                "template_name": entry.get("template_name"),
+            })
+        cursor.executemany(LOG_INSERT_SQL, rows)
+        connection.commit()
+        blob_writer.remember(hashes)
+
+    def fetch_log_entry(self, logid):
+        """
+        Reads one INTELLINOTES_LOG row, with its transcript, summary and custom prompt as text.
+
+        Rows written through the blob store are resolved and decompressed; rows logged before
+        it (and not yet migrated) are read from their CLOB columns.
+
+        Returns:
+            dict: The row with lowercase keys, or None if there is no such row or the read failed.
+        """
+        connection = self.get_connection()
+        if not connection:
+            self.logger.error("Failed to fetch log entry: Database connection error.")
+            return None
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LOG_SELECT_SQL, {"logid": logid})
+                columns = [column[0].lower() for column in cursor.description]
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                entry = {
+                    column: value.read() if hasattr(value, "read") else value
+                    for column, value in zip(columns, row)
+                }
+                texts = read_blobs(cursor, [entry[column.lower()] for column in MESSAGE_COLUMNS.values()])
+                for field, column in MESSAGE_COLUMNS.items():
+                    blob_hash = entry.pop(column.lower())
+                    if blob_hash:
+                        entry[field] = texts.get(blob_hash)
+                return entry
+        except Exception as e:
+            self.logger.error("Failed to fetch log entry", exc_info=True)
+            return None
+        finally:
+            connection.close()
+
+    @timed("db_log", table="IntelliNotes_Feedback", mode="batch")
+    def log_feedback_batch(self, feedback):
+        """
+        Logs a batch of feedback rows into the IntelliNotes_Feedback table with a single executemany and commit.
+
+        Args:
+            feedback (list): Dictionaries with the same keys as the log_feedback arguments.
+
+        Returns:
+            bool: True if the whole batch was written, False otherwise.
+        """
+        connection = self.get_connection()
+        if not connection:
+            self.logger.error("Failed to log feedback: Database connection error.")
+            return False
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.executemany(FEEDBACK_INSERT_SQL, [
+                    {
+                        "logid": item["logid"],
+                        "user_id": item["user_id"],
+                        "user_feedback": item["user_feedback"],
+                        "user_rating": item["user_rating"],
+                        "created_date": item.get("created_date") or datetime.datetime.now(),
+                    } for item in feedback
+                ])
+                connection.commit()
+                self.logger.info(f"Logged {len(feedback)} feedback entries.")
+                return True
+        except Exception as e:
+            self.logger.error("Failed to log feedback batch", exc_info=True)
+            return False
+        finally:
+            connection.close()
+
+    @timed("template_fetch", source="db")
     def fetch_templates(self):
         """
         Fetches unique template details where IS_CUSTOM is 0.
@@ -184,6 +450,30 @@ class DBOracle:
         finally:
             connection.close()
 
+    @timed("template_fetch", source="db_version")
+    def fetch_templates_version(self):
+        """
+        Returns a cheap fingerprint of INTELLINOTES_PROMPTS that changes whenever a template does.
+
+        Uses the row count and the highest ORA_ROWSCN, so no CLOBs are read.
+
+        Returns:
+            tuple: (row count, max ORA_ROWSCN), or None if the database could not be queried.
+        """
+        connection = self.get_connection()
+        if not connection:
+            self.logger.error("Failed to fetch template version: Database connection error.")
+            return None
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*), MAX(ORA_ROWSCN) FROM INTELLINOTES_PROMPTS")
+                return tuple(cursor.fetchone())
+        except Exception as e:
+            self.logger.error("Failed to fetch template version", exc_info=True)
+            return None
+        finally:
+            connection.close()
 
 
 def load_env_variables():
@@ -206,7 +496,70 @@ def log_tokens(input_text: str, output_text: str, encoding_name: str = "cl100k_b
     Returns:
         tuple: A tuple containing the number of input and output tokens.
     """
-    encoding = tiktoken.get_encoding(encoding_name)
-    input_tokens = len(encoding.encode(input_text))
-    output_tokens = len(encoding.encode(output_text))
+    input_tokens, output_tokens = count_tokens_batch([input_text, output_text], encoding_name)
     return input_tokens, output_tokens
+
+
+# A line that opens a new speaker turn, e.g. "Kenny, Mike   0:14" or "Raube, Chad 0 minutes 4 seconds".
+SPEAKER_LINE_PATTERN = re.compile(r"^[^\n]{1,60}?\s+(\d{1,2}:\d{2}(:\d{2})?|\d+ minutes? \d+ seconds?)\s*$")
+
+
+def split_transcript(text: str, max_tokens: int, encoding_name: str = "cl100k_base"):
+    """
+    Splits a transcript into chunks that fit within a token budget.
+
+    Chunks are cut at paragraph (blank line) boundaries where possible, then at speaker
+    turns, then at single lines. A line that is longer than the budget on its own is
+    cut on token boundaries as a last resort.
+
+    Args:
+        text (str): Transcript text.
+        max_tokens (int): Maximum number of tokens per chunk.
+        encoding_name (str): Name of the encoding to use. Default is 'cl100k_base', as in log_tokens.
+
+    Returns:
+        list: A list of transcript chunks, in their original order.
+    """
+    encoding = get_encoding(encoding_name)
+
+    def units_of(block):
+        # Break an oversized paragraph into speaker turns, and oversized turns into lines.
+        turns, current = [], []
+        for line in block.split("\n"):
+            if current and SPEAKER_LINE_PATTERN.match(line):
+                turns.append("\n".join(current))
+                current = []
+            current.append(line)
+        if current:
+            turns.append("\n".join(current))
+        for turn in turns:
+            tokens = encoding.encode(turn)
+            if len(tokens) <= max_tokens:
+                yield turn, len(tokens)
+                continue
+            for line in turn.split("\n"):
+                tokens = encoding.encode(line)
+                if len(tokens) <= max_tokens:
+                    yield line, len(tokens)
+                    continue
+                for start in range(0, len(tokens), max_tokens):
+                    piece = tokens[start:start + max_tokens]
+                    yield encoding.decode(piece), len(piece)
+
+    chunks, current, current_tokens = [], [], 0
+    # Each separator between units costs roughly one token.
+    for paragraph in re.split(r"\n\s*\n", text):
+        if not paragraph.strip():
+            continue
+        paragraph_tokens = len(encoding.encode(paragraph))
+        units = [(paragraph, paragraph_tokens)] if paragraph_tokens <= max_tokens else units_of(paragraph)
+        for unit, unit_tokens in units:
+            if current and current_tokens + unit_tokens + 1 > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit_tokens + 1
+
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
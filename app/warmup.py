@@ -0,0 +1,173 @@
+"""
+Model warm-up and keep-alive for the Ollama servers behind a router.
+
+Ollama unloads a model once its keep_alive runs out, and the next request pays the full
+load time. WarmupManager loads the model on every server when the app starts, then,
+while the schedule says traffic is expected, sends a load-only request (an empty prompt
+with keep_alive) to any server that has not served a request for ping_interval seconds.
+Outside the schedule it does nothing and the model unloads as usual.
+
+Requests that still hit an unloaded model are flagged by the router (cold_start in the
+generation metadata, cold="True" on the llm_endpoint span).
+"""
+import asyncio
+import datetime
+import logging
+import threading
+import time
+
+from async_runtime import run_sync
+from llm_router import is_cold_start
+from metrics import increment, record_span
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+class Schedule:
+    """
+    Times when traffic is expected, e.g. "mon-fri 07:00-19:00".
+
+    Several windows can be separated by commas ("mon-fri 07:00-19:00, sat 09:00-12:00").
+    An empty spec or "always" means all the time. Times are local server time.
+    """
+
+    def __init__(self, spec=None):
+        self.spec = (spec or "always").strip()
+        self.windows = [] if self.spec.lower() == "always" else [_parse_window(w) for w in self.spec.split(",") if w.strip()]
+
+    def active(self, now=None):
+        if not self.windows:
+            return True
+        now = now or datetime.datetime.now()
+        minute = now.hour * 60 + now.minute
+        return any(now.weekday() in days and start <= minute < end for days, start, end in self.windows)
+
+
+def _parse_window(window):
+    days_part, _, hours_part = window.strip().partition(" ")
+    if ":" in days_part:
+        days_part, hours_part = "mon-sun", days_part
+    days = set()
+    for item in days_part.lower().split("/"):
+        first, _, last = item.partition("-")
+        start_index, end_index = DAYS.index(first[:3]), DAYS.index((last or first)[:3])
+        days.update(range(start_index, end_index + 1))
+    start, _, end = (hours_part.strip() or "00:00-24:00").partition("-")
+    return days, _minutes(start), _minutes(end)
+
+
+def _minutes(clock):
+    hours, _, minutes = clock.strip().partition(":")
+    return int(hours) * 60 + int(minutes or 0)
+
+
+class WarmupManager:
+    """
+    Keeps the router's model loaded on its servers.
+
+    Args:
+        router (OllamaRouter): The servers and model to keep warm.
+        keep_alive: keep_alive sent with each ping; defaults to the router's, else "30m".
+        ping_interval (float): Seconds of idleness after which a server is pinged. Keep it
+            below keep_alive.
+        schedule (str): When to keep the model loaded; see Schedule.
+    """
+
+    def __init__(self, router, keep_alive=None, ping_interval=240.0, schedule=None):
+        self.router = router
+        self.keep_alive = keep_alive or router.keep_alive or "30m"
+        self.ping_interval = ping_interval
+        self.schedule = schedule if isinstance(schedule, Schedule) else Schedule(schedule)
+        self.logger = logging.getLogger(__name__)
+        self._state = {endpoint.url: {"pings": 0, "cold_loads": 0, "last_ping": None, "last_load_seconds": None}
+                       for endpoint in router.endpoints}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Preloads the model in the background, then keeps it warm on schedule."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="ollama-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def preload(self):
+        """Loads the model on every healthy server now; returns {url: load seconds or None}."""
+        return run_sync(self._ping_all(self.router.endpoints))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "schedule": self.schedule.spec,
+                "active": self.schedule.active(),
+                "keep_alive": self.keep_alive,
+                "endpoints": {url: dict(state) for url, state in self._state.items()},
+            }
+
+    def _loop(self):
+        try:
+            self.preload()
+        except Exception:
+            self.logger.error("Ollama warm-up failed", exc_info=True)
+        # Wake up often enough to notice a server going idle soon after ping_interval.
+        while not self._stop.wait(min(self.ping_interval, 60.0)):
+            if not self.schedule.active():
+                continue
+            now = time.monotonic()
+            idle = [
+                endpoint for endpoint in self.router.endpoints
+                if now - max(endpoint.last_request_at or 0.0, self._last_ping(endpoint.url)) >= self.ping_interval
+            ]
+            if idle:
+                try:
+                    run_sync(self._ping_all(idle))
+                except Exception:
+                    self.logger.error("Ollama keep-alive ping failed", exc_info=True)
+
+    def _last_ping(self, url):
+        with self._lock:
+            return self._state[url]["last_ping"] or 0.0
+
+    async def _ping_all(self, endpoints):
+        endpoints = [endpoint for endpoint in endpoints if endpoint.healthy]
+        results = await asyncio.gather(*(self._ping(endpoint) for endpoint in endpoints), return_exceptions=True)
+        return {endpoint.url: None if isinstance(result, BaseException) else result
+                for endpoint, result in zip(endpoints, results)}
+
+    async def _ping(self, endpoint):
+        """Sends a load-only request; returns the load time Ollama reported, in seconds."""
+        start_time = time.perf_counter()
+        try:
+            response = await endpoint.async_client.generate(self.router.model, keep_alive=self.keep_alive)
+        except Exception as e:
+            self.logger.warning(f"Keep-alive ping to {endpoint.url} failed: {e}")
+            increment("llm_warmup_errors_total", endpoint=endpoint.url)
+            raise
+        load_seconds = (response.load_duration or 0) / 1e9
+        cold = is_cold_start(response.load_duration)
+        with self._lock:
+            state = self._state[endpoint.url]
+            state["pings"] += 1
+            state["cold_loads"] += int(cold)
+            state["last_ping"] = time.monotonic()
+            state["last_load_seconds"] = round(load_seconds, 3)
+        record_span("llm_warmup", time.perf_counter() - start_time, endpoint=endpoint.url, cold=cold)
+        if cold:
+            self.logger.info(f"Loaded {self.router.model} on {endpoint.url} in {load_seconds:.2f}s.")
+        return load_seconds
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_warmup_manager(router, **kwargs):
+    """Returns the process-wide, started warm-up manager for a router."""
+    with _managers_lock:
+        if id(router) not in _managers:
+            _managers[id(router)] = WarmupManager(router, **kwargs).start()
+        return _managers[id(router)]
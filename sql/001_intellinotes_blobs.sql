@@ -0,0 +1,34 @@
+-- Content-addressed storage for the transcripts, summaries and custom prompts in INTELLINOTES_LOG.
+--
+-- Each distinct text is stored once in INTELLINOTES_BLOBS, zlib-compressed and keyed by the
+-- SHA-256 of its UTF-8 encoding; log rows reference it by hash (see app/blob_store.py).
+-- Apply before deploying the application version that writes the hash columns, then move
+-- existing rows over with:  python app/blob_store.py --batch-size 200
+
+CREATE TABLE INTELLINOTES_BLOBS (
+    BLOB_HASH       VARCHAR2(64)  NOT NULL,
+    CONTENT         BLOB          NOT NULL,
+    ORIGINAL_BYTES  NUMBER        NOT NULL,
+    STORED_BYTES    NUMBER        NOT NULL,
+    CREATED_DATE    DATE          DEFAULT SYSDATE NOT NULL,
+    CONSTRAINT PK_INTELLINOTES_BLOBS PRIMARY KEY (BLOB_HASH)
+)
+LOB (CONTENT) STORE AS SECUREFILE (NOCACHE LOGGING);
+
+ALTER TABLE INTELLINOTES_LOG ADD (
+    INPUT_HASH          VARCHAR2(64),
+    OUTPUT_HASH         VARCHAR2(64),
+    CUSTOM_PROMPT_HASH  VARCHAR2(64)
+);
+
+ALTER TABLE INTELLINOTES_LOG ADD CONSTRAINT FK_INTELLINOTES_LOG_INPUT
+    FOREIGN KEY (INPUT_HASH) REFERENCES INTELLINOTES_BLOBS (BLOB_HASH);
+ALTER TABLE INTELLINOTES_LOG ADD CONSTRAINT FK_INTELLINOTES_LOG_OUTPUT
+    FOREIGN KEY (OUTPUT_HASH) REFERENCES INTELLINOTES_BLOBS (BLOB_HASH);
+ALTER TABLE INTELLINOTES_LOG ADD CONSTRAINT FK_INTELLINOTES_LOG_PROMPT
+    FOREIGN KEY (CUSTOM_PROMPT_HASH) REFERENCES INTELLINOTES_BLOBS (BLOB_HASH);
+
+-- Foreign key columns are indexed so blob deletes do not lock INTELLINOTES_LOG.
+CREATE INDEX IX_INTELLINOTES_LOG_INPUT ON INTELLINOTES_LOG (INPUT_HASH);
+CREATE INDEX IX_INTELLINOTES_LOG_OUTPUT ON INTELLINOTES_LOG (OUTPUT_HASH);
+CREATE INDEX IX_INTELLINOTES_LOG_PROMPT ON INTELLINOTES_LOG (CUSTOM_PROMPT_HASH);
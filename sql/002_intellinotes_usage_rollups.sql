@@ -0,0 +1,61 @@
+-- Hourly usage rollups over INTELLINOTES_LOG and IntelliNotes_Feedback (see app/analytics.py).
+--
+-- UsageRollup.refresh() adds rows logged since its watermark to these tables, so dashboards
+-- read a few rows per hour instead of scanning the log. Missing models or templates are
+-- stored as '-' because they are part of the primary keys.
+
+-- LOADED_AT is when the database inserted the row. The rollups scan by it rather than by the
+-- app-set CREATEDATE and CREATED_DATE, which keep their original values when the app replays
+-- rows it spilled during a database outage.
+ALTER TABLE INTELLINOTES_LOG ADD (
+    TEMPLATE_NAME VARCHAR2(200),
+    LOADED_AT     TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL
+);
+ALTER TABLE IntelliNotes_Feedback ADD (LOADED_AT TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL);
+
+-- Feedback is attributed to the latest log row of the same USERID.
+CREATE INDEX IX_INTELLINOTES_LOG_USERID ON INTELLINOTES_LOG (USERID, LOGID);
+CREATE INDEX IX_INTELLINOTES_FEEDBACK_LOADED ON IntelliNotes_Feedback (LOADED_AT);
+
+CREATE TABLE INTELLINOTES_USAGE_HOURLY (
+    HOUR_START      DATE           NOT NULL,
+    MODEL           VARCHAR2(100)  NOT NULL,
+    TEMPLATE_NAME   VARCHAR2(200)  NOT NULL,
+    EVENT           VARCHAR2(200)  NOT NULL,
+    REQUESTS        NUMBER         DEFAULT 0 NOT NULL,
+    ERRORS          NUMBER         DEFAULT 0 NOT NULL,
+    INPUT_TOKENS    NUMBER         DEFAULT 0 NOT NULL,
+    OUTPUT_TOKENS   NUMBER         DEFAULT 0 NOT NULL,
+    -- Seconds over the requests that reported a duration, and how many did.
+    DURATION_SUM    NUMBER         DEFAULT 0 NOT NULL,
+    DURATION_COUNT  NUMBER         DEFAULT 0 NOT NULL,
+    DURATION_MAX    NUMBER,
+    FEEDBACK_COUNT  NUMBER         DEFAULT 0 NOT NULL,
+    RATING_SUM      NUMBER         DEFAULT 0 NOT NULL,
+    RATING_COUNT    NUMBER         DEFAULT 0 NOT NULL,
+    CONSTRAINT PK_INTELLINOTES_USAGE_HOURLY PRIMARY KEY (HOUR_START, MODEL, TEMPLATE_NAME, EVENT)
+);
+
+-- Request durations as a histogram per rollup row: REQUESTS with BUCKET_LE as the upper bound
+-- in seconds (1e9 for the overflow bucket). Percentiles are interpolated from it.
+CREATE TABLE INTELLINOTES_USAGE_LATENCY (
+    HOUR_START      DATE           NOT NULL,
+    MODEL           VARCHAR2(100)  NOT NULL,
+    TEMPLATE_NAME   VARCHAR2(200)  NOT NULL,
+    EVENT           VARCHAR2(200)  NOT NULL,
+    BUCKET_LE       NUMBER         NOT NULL,
+    REQUESTS        NUMBER         DEFAULT 0 NOT NULL,
+    CONSTRAINT PK_INTELLINOTES_USAGE_LATENCY PRIMARY KEY (HOUR_START, MODEL, TEMPLATE_NAME, EVENT, BUCKET_LE)
+);
+
+-- One row per rollup: the last LOGID and feedback LOADED_AT already counted.
+CREATE TABLE INTELLINOTES_ROLLUP_WATERMARKS (
+    NAME                  VARCHAR2(50)  NOT NULL,
+    LAST_LOGID            NUMBER        DEFAULT 0 NOT NULL,
+    LAST_FEEDBACK_LOADED  TIMESTAMP     DEFAULT TIMESTAMP '1970-01-01 00:00:00' NOT NULL,
+    UPDATED_DATE          DATE,
+    CONSTRAINT PK_INTELLINOTES_ROLLUP_WATERMARKS PRIMARY KEY (NAME)
+);
+
+INSERT INTO INTELLINOTES_ROLLUP_WATERMARKS (NAME) VALUES ('usage_hourly');
+COMMIT;